@@ -1,4 +1,4 @@
-from flask import Blueprint, jsonify, request, send_from_directory, session, redirect, url_for, render_template
+from flask import Blueprint, jsonify, request, send_from_directory, session, redirect, url_for, render_template, Response
 import functools
 import hashlib
 import os
@@ -115,6 +115,101 @@ def execute_database_query():
     except Exception as e:
         return jsonify({"error": f"Query execution error: {str(e)}"}), 500
 
+@admin_bp.route("/api/query-stats")
+@require_auth
+def get_query_stats():
+    """Get the statement shapes taking the most database time and the slow query log"""
+    try:
+        from flask import current_app
+        multi_manager = current_app.config['multi_manager']
+        limit = request.args.get('limit', 20, type=int)
+        sort = request.args.get('sort', 'total')
+        report = multi_manager.sqlite_storage.query_stats.get_report(limit=limit, sort=sort)
+        report["writes"] = multi_manager.sqlite_storage.get_write_stats()
+        return jsonify(report)
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@admin_bp.route("/api/query-stats/reset", methods=['POST'])
+@require_auth
+def reset_query_stats():
+    """Clear the statement stats and slow query log"""
+    try:
+        from flask import current_app
+        multi_manager = current_app.config['multi_manager']
+        multi_manager.sqlite_storage.query_stats.reset()
+        return jsonify({"message": "Query stats reset"})
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@admin_bp.route("/api/profile", methods=['POST'])
+@require_auth
+def start_profile():
+    """
+    Start a sampling profile: the next `count` requests to `route` (a URL rule such as
+    /students/dashboard/<classroom_id>, or an exact path), or every thread for `seconds`
+    """
+    try:
+        from flask import current_app
+        profiler = current_app.config['profiler']
+        
+        data = request.get_json() or {}
+        interval = float(data.get('interval_ms', profiler.DEFAULT_INTERVAL * 1000)) / 1000
+        if interval <= 0:
+            return jsonify({"error": "interval_ms must be positive"}), 400
+        
+        if data.get('route'):
+            count = int(data.get('count', 1))
+            if count < 1:
+                return jsonify({"error": "count must be at least 1"}), 400
+            profiler.profile_requests(data['route'], count, method=data.get('method'), interval=interval,
+                                      timeout=float(data.get('timeout', profiler.MAX_SECONDS)))
+        elif data.get('seconds'):
+            seconds = float(data['seconds'])
+            if not 0 < seconds <= profiler.MAX_SECONDS:
+                return jsonify({"error": f"seconds must be between 0 and {profiler.MAX_SECONDS}"}), 400
+            profiler.profile_threads(seconds, interval=interval)
+        else:
+            return jsonify({"error": "Provide either route (and count) or seconds"}), 400
+        
+        return jsonify(profiler.get_status()), 202
+    except RuntimeError as e:
+        return jsonify({"error": str(e)}), 409
+    except (TypeError, ValueError) as e:
+        return jsonify({"error": f"Invalid profile settings: {str(e)}"}), 400
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@admin_bp.route("/api/profile")
+@require_auth
+def get_profile_status():
+    """Get the running or last profile's progress"""
+    from flask import current_app
+    status = current_app.config['profiler'].get_status()
+    if status is None:
+        return jsonify({"error": "No profile has been run"}), 404
+    return jsonify(status)
+
+@admin_bp.route("/api/profile/stop", methods=['POST'])
+@require_auth
+def stop_profile():
+    """Stop the running profile, keeping the samples taken so far"""
+    from flask import current_app
+    profiler = current_app.config['profiler']
+    profiler.stop()
+    return jsonify(profiler.get_status())
+
+@admin_bp.route("/api/profile/collapsed")
+@require_auth
+def get_profile_collapsed():
+    """Download the profile's samples as collapsed stacks (for flamegraph.pl or speedscope)"""
+    from flask import current_app
+    profiler = current_app.config['profiler']
+    if profiler.get_status() is None:
+        return jsonify({"error": "No profile has been run"}), 404
+    return Response(profiler.collapsed(), mimetype='text/plain',
+                    headers={'Content-Disposition': 'attachment; filename=profile.folded'})
+
 @admin_bp.route("/api/table/<table_name>")
 @require_auth
 def get_table_data(table_name):
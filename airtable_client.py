@@ -0,0 +1,382 @@
+import posixpath
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+from urllib.parse import quote
+import requests
+from airtable import Airtable
+from urllib3.exceptions import NameResolutionError, NewConnectionError
+from utilities import load_env
+
+# Statuses worth retrying: throttling and transient server errors
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+# Methods that create records: resending one after an ambiguous failure can duplicate them
+NON_IDEMPOTENT_METHODS = {'POST'}
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket used to pace requests to a fixed rate.
+    Tokens refill continuously at `rate` per second up to `capacity`.
+    """
+
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else rate
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._blocked_until = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self) -> float:
+        """
+        Take one token, sleeping until one is available.
+
+        Returns:
+            Seconds spent waiting for the token
+        """
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if now >= self._blocked_until and self._tokens >= 1:
+                    self._tokens -= 1
+                    return waited
+                wait = max(self._blocked_until - now, (1 - self._tokens) / self.rate)
+            time.sleep(wait)
+            waited += wait
+
+    def pause(self, seconds: float):
+        """
+        Stop handing out tokens for `seconds`, e.g. after the server has throttled us.
+        """
+        with self._lock:
+            self._blocked_until = max(self._blocked_until, time.monotonic() + seconds)
+            self._tokens = 0
+
+
+class AirtableCallMetrics:
+    """
+    Thread-safe per-operation counters for Airtable calls.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._operations: Dict[str, dict] = {}
+
+    def record(self, operation: str, latency: float, status: Optional[int], limiter_wait: float, retried: bool):
+        with self._lock:
+            stats = self._operations.setdefault(operation, {
+                "calls": 0,
+                "errors": 0,
+                "retries": 0,
+                "throttled": 0,
+                "total_latency": 0.0,
+                "max_latency": 0.0,
+                "limiter_wait": 0.0
+            })
+            stats["calls"] += 1
+            stats["total_latency"] += latency
+            stats["max_latency"] = max(stats["max_latency"], latency)
+            stats["limiter_wait"] += limiter_wait
+            if status is None or status >= 400:
+                stats["errors"] += 1
+            if status == 429:
+                stats["throttled"] += 1
+            if retried:
+                stats["retries"] += 1
+
+    def snapshot(self) -> Dict[str, dict]:
+        """
+        Get a copy of the metrics with average latency added, keyed by operation.
+        """
+        with self._lock:
+            result = {}
+            for operation, stats in self._operations.items():
+                stats = dict(stats)
+                stats["avg_latency"] = stats["total_latency"] / stats["calls"] if stats["calls"] else 0.0
+                result[operation] = stats
+            return result
+
+    def reset(self):
+        with self._lock:
+            self._operations.clear()
+
+
+class AirtableClient:
+    """
+    Shared gateway for every request to one Airtable base.
+    Paces requests with a token bucket (Airtable allows 5 requests/sec per base),
+    retries throttled and transient failures with jittered exponential backoff
+    (honouring Retry-After) and records per-call latency and throttle metrics.
+    """
+
+    def __init__(self, api_key: str, base_id: str, requests_per_second: float = 5,
+                 max_retries: int = 5, backoff_base: float = 0.5, backoff_max: float = 30.0,
+                 timeout: Optional[float] = 30, api_url: str = Airtable.API_URL):
+        self.api_key = api_key
+        self.base_id = base_id
+        self.api_url = api_url.rstrip('/')
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.timeout = timeout
+        self.rate_limiter = TokenBucket(requests_per_second)
+        self.metrics = AirtableCallMetrics()
+        self.session = requests.Session()
+        self.session.headers.update({
+            'Authorization': f'Bearer {api_key}',
+            'Content-Type': 'application/json'
+        })
+
+    def table(self, table_name: str) -> 'RateLimitedAirtable':
+        """
+        Get an Airtable table wrapper whose requests go through this client.
+        """
+        return RateLimitedAirtable(self, table_name, timeout=self.timeout)
+
+    def request(self, method: str, url: str, operation: Optional[str] = None, **kwargs) -> requests.Response:
+        """
+        Send a request (e.g. to the meta API) through the rate limiter and retry layer.
+        """
+        kwargs.setdefault('timeout', self.timeout)
+        return self.send(self.session, method, url, operation=operation or f"{method.upper()} {url}", **kwargs)
+
+    def send(self, session: requests.Session, method: str, url: str, operation: str, **kwargs) -> requests.Response:
+        """
+        Send a request with `session`, waiting for a rate limit token before each attempt
+        and retrying on 429/5xx responses and transient connection errors.
+
+        Creates (POST) are only retried when the server can't have acted on them:
+        after a 429, or a connection that was never established. A timeout, dropped
+        connection or 5xx may come after Airtable has already created the records.
+        DNS failures are raised straight away since retrying won't fix them.
+
+        Returns:
+            The final response (which may still be an error once retries are exhausted)
+        """
+        idempotent = method.upper() not in NON_IDEMPOTENT_METHODS
+        attempt = 0
+        while True:
+            limiter_wait = self.rate_limiter.acquire()
+            start = time.monotonic()
+            try:
+                response = session.request(method, url, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                self.metrics.record(operation, time.monotonic() - start, None, limiter_wait, attempt > 0)
+                if attempt >= self.max_retries or self._is_unreachable(e):
+                    raise
+                if not idempotent and not self._failed_before_sending(e):
+                    raise
+                time.sleep(self._backoff_delay(attempt))
+                attempt += 1
+                continue
+
+            self.metrics.record(operation, time.monotonic() - start, response.status_code, limiter_wait, attempt > 0)
+            if response.status_code not in RETRY_STATUSES or attempt >= self.max_retries:
+                return response
+            if not idempotent and response.status_code != 429:
+                return response
+
+            delay = self._retry_after(response)
+            if delay is None:
+                delay = self._backoff_delay(attempt)
+            if response.status_code == 429:
+                # Throttling applies to the whole base, so hold back every caller
+                self.rate_limiter.pause(delay)
+            print(f"Airtable {operation} returned {response.status_code}, retrying in {delay:.2f}s")
+            time.sleep(delay)
+            attempt += 1
+
+    @staticmethod
+    def _connection_error_reason(error: Exception) -> Optional[Exception]:
+        # requests wraps urllib3's MaxRetryError, whose reason is the underlying failure
+        wrapped = error.args[0] if error.args else None
+        return getattr(wrapped, 'reason', None)
+
+    @classmethod
+    def _is_unreachable(cls, error: Exception) -> bool:
+        return isinstance(cls._connection_error_reason(error), NameResolutionError)
+
+    @classmethod
+    def _failed_before_sending(cls, error: Exception) -> bool:
+        if isinstance(error, requests.ConnectTimeout):
+            return True
+        return isinstance(cls._connection_error_reason(error), NewConnectionError)
+
+    def _backoff_delay(self, attempt: int) -> float:
+        # Full jitter: a random delay up to the exponential cap
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    @staticmethod
+    def _retry_after(response: requests.Response) -> Optional[float]:
+        value = response.headers.get('Retry-After')
+        if not value:
+            return None
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            return None
+
+    def get_metrics(self) -> Dict[str, dict]:
+        return self.metrics.snapshot()
+
+    def batch_executor(self, table_name: str, max_workers: Optional[int] = None) -> 'BatchUploadExecutor':
+        """
+        Get an executor that uploads batches for a table concurrently within this client's rate budget.
+        Set AIRTABLE_UPLOAD_WORKERS to change the default pool size (default 4).
+        """
+        if max_workers is None:
+            max_workers = int(load_env('AIRTABLE_UPLOAD_WORKERS', '4'))
+        return BatchUploadExecutor(self, table_name, max_workers=max_workers)
+
+
+class RateLimitedAirtable(Airtable):
+    """
+    airtable-python-wrapper table whose HTTP requests go through an AirtableClient.
+    The wrapper's own fixed sleeps are disabled because the client does the pacing.
+    """
+    API_LIMIT = 0
+
+    def __init__(self, client: AirtableClient, table_name: str, timeout=None):
+        super().__init__(client.base_id, table_name, client.api_key, timeout=timeout)
+        self.client = client
+        # Point at the client's API URL, which may be a local stand-in (see fake_airtable.py)
+        self.url_table = posixpath.join(client.api_url, client.base_id, quote(table_name, safe=""))
+
+    def _request(self, method, url, params=None, json_data=None):
+        response = self.client.send(
+            self.session, method, url,
+            operation=f"{method.upper()} {self.table_name}",
+            params=params, json=json_data, timeout=self.timeout
+        )
+        return self._process_response(response)
+
+
+class BatchUploadExecutor:
+    """
+    Sends 10-record Airtable batches from a small worker pool so several requests
+    are in flight at once, while the client's token bucket keeps the total within
+    the base's rate budget. Each batch is retried on its own after a transient HTTP
+    failure, so one bad batch doesn't stop the rest of the upload. Inserts are only
+    resent when Airtable can't have created the records (429 or no connection).
+    """
+    BATCH_SIZE = Airtable.MAX_RECORDS_PER_REQUEST
+
+    def __init__(self, client: AirtableClient, table_name: str, max_workers: int = 4, batch_retries: int = 2):
+        self.client = client
+        self.table_name = table_name
+        self.max_workers = max_workers
+        self.batch_retries = batch_retries
+        self._local = threading.local()
+
+    def _table(self) -> 'RateLimitedAirtable':
+        # requests.Session isn't guaranteed thread-safe, so each worker gets its own
+        if not hasattr(self._local, 'table'):
+            self._local.table = self.client.table(self.table_name)
+        return self._local.table
+
+    def insert(self, records: List[dict]) -> dict:
+        return self._run('insert', records, lambda table, batch: table.batch_insert(batch), idempotent=False)
+
+    def update(self, records: List[dict]) -> dict:
+        return self._run('update', records, lambda table, batch: table.batch_update(batch))
+
+    def delete(self, record_ids: List[str]) -> dict:
+        return self._run('delete', record_ids, lambda table, batch: table.batch_delete(batch))
+
+    def _run(self, operation: str, items: list, send, idempotent: bool = True) -> dict:
+        """
+        Send `items` in batches and wait for all of them.
+
+        Returns:
+            Dictionary with the number of records sent, failed batch details (index,
+            record count, error and HTTP status), elapsed seconds and throughput in records/sec
+        """
+        batches = [items[i:i+self.BATCH_SIZE] for i in range(0, len(items), self.BATCH_SIZE)]
+        start = time.monotonic()
+        with ThreadPoolExecutor(max_workers=max(1, self.max_workers)) as pool:
+            outcomes = list(pool.map(lambda batch: self._send_batch(send, batch, idempotent), batches))
+        elapsed = time.monotonic() - start
+
+        succeeded = sum(count for count, _, _ in outcomes)
+        failures = [
+            {"batch": index, "records": len(batches[index]), "error": error, "status": status}
+            for index, (_, error, status) in enumerate(outcomes) if error
+        ]
+        return {
+            "operation": operation,
+            "records": succeeded,
+            "failed_records": sum(failure["records"] for failure in failures),
+            "batches": len(batches),
+            "batch_size": self.BATCH_SIZE,
+            "failed_batches": failures,
+            "seconds": round(elapsed, 3),
+            "records_per_second": round(succeeded / elapsed, 1) if elapsed > 0 else float(succeeded)
+        }
+
+    def _send_batch(self, send, batch: list, idempotent: bool):
+        # Returns (records sent, error message, HTTP status of the failure if there was one)
+        attempt = 0
+        while True:
+            try:
+                result = send(self._table(), batch)
+                return (len(result) if result else len(batch)), None, None
+            except Exception as e:
+                if attempt >= self.batch_retries or not self._is_retryable(e, idempotent):
+                    response = getattr(e, 'response', None)
+                    return 0, str(e), response.status_code if response is not None else None
+                # The client has already backed off through its own retries, so carry on
+                # from where its schedule stopped rather than starting again from the base delay
+                time.sleep(self.client._backoff_delay(self.client.max_retries + attempt))
+                attempt += 1
+
+    @staticmethod
+    def _is_retryable(error: Exception, idempotent: bool = True) -> bool:
+        # Only HTTP failures can be transient; anything else (e.g. a bad record) fails the same way again
+        if not isinstance(error, requests.RequestException):
+            return False
+        response = error.response
+        if response is not None:
+            if response.status_code == 429:
+                return True
+            # A 5xx on an insert may come after the records were created
+            return idempotent and response.status_code in RETRY_STATUSES
+        if AirtableClient._is_unreachable(error):
+            return False
+        return idempotent or AirtableClient._failed_before_sending(error)
+
+
+_clients: Dict[tuple, AirtableClient] = {}
+_clients_lock = threading.Lock()
+
+
+def get_airtable_client(api_key: str, base_id: str) -> AirtableClient:
+    """
+    Get the process-wide AirtableClient for a base, creating it on first use,
+    so every table in the base shares one rate limit budget.
+    Set AIRTABLE_REQUESTS_PER_SECOND to change the budget (default 5) and
+    AIRTABLE_API_URL to talk to a different server, e.g. a local fake_airtable.py.
+    """
+    api_url = load_env('AIRTABLE_API_URL', Airtable.API_URL)
+    with _clients_lock:
+        client = _clients.get((api_key, base_id, api_url))
+        if client is None:
+            requests_per_second = float(load_env('AIRTABLE_REQUESTS_PER_SECOND', '5'))
+            client = AirtableClient(api_key, base_id, requests_per_second=requests_per_second, api_url=api_url)
+            _clients[(api_key, base_id, api_url)] = client
+        return client
+
+
+def reset_clients():
+    """
+    Forget every shared client, e.g. in a forked worker process, so HTTP sessions
+    (and their sockets) aren't shared with the parent. Clients are recreated on next use.
+    """
+    global _clients_lock
+    _clients_lock = threading.Lock()
+    _clients.clear()
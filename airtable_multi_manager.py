@@ -1,10 +1,13 @@
 import os
-from typing import Dict, Optional, List
-from airtable import Airtable
+import threading
+from datetime import datetime
+from typing import Dict, Optional, List, TYPE_CHECKING
 from table_manager import TableManager
 from sqlite_storage import SQLiteStorage
-from utilities import load_env
-import requests
+from utilities import load_env, critical_tables
+
+if TYPE_CHECKING:
+    from airtable_client import AirtableClient
 
 
 class AirtableMultiManager:
@@ -13,7 +16,7 @@ class AirtableMultiManager:
     Allows easy access to different tables by table name.
     """
     
-    def __init__(self, api_key: str, base_id: str, table_names: Optional[List[str]] = None, sqlite_storage: Optional[SQLiteStorage] = None):
+    def __init__(self, api_key: str, base_id: str, table_names: Optional[List[str]] = None, sqlite_storage: Optional[SQLiteStorage] = None, airtable_client: Optional['AirtableClient'] = None):
         """
         Initialize the multi-manager for a single base.
         
@@ -22,11 +25,13 @@ class AirtableMultiManager:
             base_id: The Airtable base ID
             table_names: List of table names to manage. If None, will use default tables.
             sqlite_storage: Optional SQLiteStorage instance to use for all tables.
+            airtable_client: Optional AirtableClient to use instead of the shared one for the base.
         """
         self.api_key = api_key
         self.base_id = base_id
         self.managers: Dict[str, TableManager] = {}
         self.sqlite_storage = sqlite_storage or SQLiteStorage()  # Always use a shared storage
+        self._airtable_client = airtable_client  # Shared rate limit for the base, created on first use
 
         # Default table names if none provided
         if table_names is None:
@@ -37,6 +42,29 @@ class AirtableMultiManager:
         # Initialize managers for all configured tables
         self._initialize_managers()
     
+    @property
+    def airtable_client(self) -> 'AirtableClient':
+        """
+        The rate limited client shared by every table in the base, created on first use
+        so starting the app doesn't import requests or open a session.
+        """
+        if self._airtable_client is None:
+            from airtable_client import get_airtable_client
+            self._airtable_client = get_airtable_client(self.api_key, self.base_id)
+        return self._airtable_client
+
+    def reset_airtable_client(self):
+        """
+        Drop the shared Airtable client (and its HTTP session) after a fork, so this process
+        creates its own on first use.
+        """
+        import sys
+        if 'airtable_client' in sys.modules:
+            sys.modules['airtable_client'].reset_clients()
+        self._airtable_client = None
+        for manager in self.managers.values():
+            manager._airtable_client = None
+
     def _initialize_managers(self):
         """Initialize TableManager instances for all configured tables."""
         for table_name in self.table_names:
@@ -44,7 +72,8 @@ class AirtableMultiManager:
                 base_id=self.base_id,
                 table_name=table_name,
                 api_key=self.api_key,
-                sqlite_storage=self.sqlite_storage  # Pass shared storage
+                sqlite_storage=self.sqlite_storage,  # Pass shared storage
+                airtable_client=self._airtable_client
             )
     
     def add_table(self, table_name: str):
@@ -60,7 +89,8 @@ class AirtableMultiManager:
             base_id=self.base_id,
             table_name=table_name,
             api_key=self.api_key,
-            sqlite_storage=self.sqlite_storage  # Pass shared storage
+            sqlite_storage=self.sqlite_storage,  # Pass shared storage
+            airtable_client=self._airtable_client
         )
     
     def get_manager(self, table_name: str) -> Optional[TableManager]:
@@ -113,7 +143,8 @@ class AirtableMultiManager:
             Dictionary with table names as keys and status messages as values
         """
         results = {}
-        for table_name in self.managers.keys():
+        # Copy the names: background discovery may add tables meanwhile
+        for table_name in list(self.managers.keys()):
             try:
                 result = self.update_database_from_airtable(table_name)
                 results[table_name] = result if result else "Failed to update"
@@ -197,23 +228,49 @@ class AirtableMultiManager:
         Returns:
             List of table names or None if failed to retrieve
         """
+        tables = self._get_base_schema(base_id)
+        if tables is None:
+            return None
+        return [table['name'] for table in tables]
+
+    def get_table_ids_from_base(self, base_id: str = None) -> Optional[Dict[str, str]]:
+        """
+        Get a mapping of Airtable table ids (tbl...) to table names, e.g. to read webhook payloads.
+        
+        Returns:
+            Dictionary of table id -> table name, or None if failed to retrieve
+        """
+        tables = self._get_base_schema(base_id)
+        if tables is None:
+            return None
+        return {table['id']: table['name'] for table in tables}
+
+    def _get_base_schema(self, base_id: str = None) -> Optional[List[dict]]:
+        """
+        Get the table list of a base from the Airtable Meta API.
+        
+        Returns:
+            List of table dicts (id, name, fields, ...) or None if failed to retrieve
+        """
         if base_id is None:
             base_id = self.base_id
             
         try:
-            headers = {
-                'Authorization': f'Bearer {self.api_key}',
-                'Content-Type': 'application/json'
-            }
+            from airtable_client import get_airtable_client
+            client = self.airtable_client if base_id == self.base_id else get_airtable_client(self.api_key, base_id)
             
             # Airtable Meta API endpoint for base schema
-            url = f'https://api.airtable.com/v0/meta/bases/{base_id}/tables'
+            url = f'{client.api_url}/meta/bases/{base_id}/tables'
             
-            response = requests.get(url, headers=headers)
+            response = client.request('GET', url, operation='GET meta/tables')
             
             if response.status_code == 200:
                 data = response.json()
-                return [table['name'] for table in data.get('tables', [])]
+                tables = data.get('tables', [])
+                if base_id == self.base_id:
+                    # Keep the cached catalog current for the next startup
+                    self.sqlite_storage.save_table_catalog(base_id, tables)
+                return tables
             else:
                 print(f"Failed to get tables from base {base_id}: {response.status_code}")
                 print(f"Response: {response.text}")
@@ -246,6 +303,61 @@ class AirtableMultiManager:
         
         return results
 
+    def load_table_catalog(self, max_age: Optional[float] = None, background_refresh: bool = True) -> Dict[str, bool]:
+        """
+        Add the base's tables from the catalog cached in the database, without waiting for Airtable.
+        If the catalog is older than max_age seconds (AIRTABLE_CATALOG_TTL_SECONDS, default 86400)
+        or missing, discovery is rerun: in a background thread if background_refresh is True,
+        otherwise before returning. Without a cached catalog the critical tables are added
+        straight away, so they can be served from the database while discovery runs.
+        
+        Returns:
+            Dictionary with table names as keys and success status as values
+        """
+        if max_age is None:
+            max_age = float(load_env('AIRTABLE_CATALOG_TTL_SECONDS', '86400'))
+        catalog = self.sqlite_storage.get_table_catalog(self.base_id)
+        results = {}
+        if catalog:
+            for table in catalog["tables"]:
+                self.add_table(table["name"])
+                results[table["name"]] = True
+            if (datetime.utcnow() - catalog["fetched_at"]).total_seconds() < max_age:
+                return results
+        elif background_refresh:
+            for table_name in critical_tables:
+                self.add_table(table_name)
+                results[table_name] = True
+
+        if background_refresh:
+            threading.Thread(target=self.discover_and_add_tables_from_base, name="table-discovery", daemon=True).start()
+            return results
+        results.update(self.discover_and_add_tables_from_base())
+        return results
+
+    def reload_table_catalog(self) -> List[str]:
+        """
+        Add any tables in the cached catalog that aren't managed yet, without calling Airtable.
+        
+        Returns:
+            Names of the tables added
+        """
+        catalog = self.sqlite_storage.get_table_catalog(self.base_id)
+        added = [table["name"] for table in (catalog or {}).get("tables", []) if table["name"] not in self.managers]
+        for table_name in added:
+            self.add_table(table_name)
+        return added
+
+    def get_cached_table_fields(self, table_name: str) -> Optional[List[dict]]:
+        """
+        Get a table's Airtable field definitions from the cached catalog, or None if unknown.
+        """
+        catalog = self.sqlite_storage.get_table_catalog(self.base_id)
+        for table in (catalog or {}).get("tables", []):
+            if table["name"] == table_name:
+                return table["fields"]
+        return None
+
     def get_value(self, table_name: str, column_containing_reference: str, reference_value: str, target_column: str):
         """
         Retrieve a value from a specific column for the row where column_containing_reference == reference_value
@@ -278,24 +390,25 @@ class AirtableMultiManager:
     def upload_modified_tables_to_airtable(self, force_upload: bool = False) -> Dict[str, str]:
         """
         Upload all modified tables back to Airtable.
-        This will check which tables have been modified and upload their data back to Airtable.
+        Only the rows recorded in the change journal are uploaded for each modified table.
         
         Args:
-            force_upload: If True, upload all tables regardless of modification status
+            force_upload: If True, replace every table in Airtable regardless of modification status
         
         Returns:
             Dictionary with table names as keys and status messages as values
         """
         results = {}
-        for table_name in self.managers.keys():
+        modified_tables = set(self.get_modified_tables())
+        for table_name in list(self.managers.keys()):
             try:
                 manager = self.get_manager(table_name)
-                if manager and (force_upload or (hasattr(manager, 'has_updates') and manager.has_updates)):
+                if manager and force_upload:
                     result = manager.upload_to_airtable()
                     results[table_name] = result if result else "Failed to upload"
-                    # Reset the update flag after successful upload
-                    if result and not result.startswith("Error"):
-                        manager.has_updates = False
+                elif manager and table_name in modified_tables:
+                    result = manager.upload_changes_to_airtable()
+                    results[table_name] = result if result else "Failed to upload"
                 else:
                     results[table_name] = "No modifications to upload"
             except Exception as e:
@@ -304,7 +417,8 @@ class AirtableMultiManager:
 
     def upload_table_to_airtable(self, table_name: str) -> Optional[str]:
         """
-        Upload a specific table back to Airtable.
+        Upload the journaled changes for a specific table back to Airtable.
+        If the table has been marked as modified as a whole, it is replaced in full.
         
         Args:
             table_name: Name of the table to upload
@@ -314,30 +428,34 @@ class AirtableMultiManager:
         """
         manager = self.get_manager(table_name)
         if manager:
-            return manager.upload_to_airtable()
+            return manager.upload_changes_to_airtable()
         return None
 
     def mark_table_as_modified(self, table_name: str):
         """
-        Mark a table as modified so it will be uploaded on the next sync.
+        Mark a whole table as modified so it will be replaced in full on the next sync.
+        Writes through TableManager are journaled per row and don't need this.
         
         Args:
             table_name: Name of the table to mark as modified
         """
         manager = self.get_manager(table_name)
         if manager:
-            manager.has_updates = True
+            self.sqlite_storage.record_change(table_name)
 
     def get_modified_tables(self) -> List[str]:
         """
-        Get a list of tables that have been modified and need to be uploaded.
+        Get a list of tables that have journaled changes and need to be uploaded.
         
         Returns:
             List of table names that have modifications
         """
-        modified_tables = []
-        for table_name in self.managers.keys():
-            manager = self.get_manager(table_name)
-            if manager and hasattr(manager, 'has_updates') and manager.has_updates:
-                modified_tables.append(table_name)
-        return modified_tables
+        journaled_tables = set(self.sqlite_storage.get_tables_with_pending_changes())
+        return [table_name for table_name in list(self.managers.keys()) if table_name in journaled_tables]
+
+    def get_airtable_metrics(self) -> Dict[str, dict]:
+        """
+        Get per-operation Airtable call metrics (calls, errors, retries, throttled responses,
+        latency and time spent waiting on the rate limiter) for this base.
+        """
+        return self.airtable_client.get_metrics()
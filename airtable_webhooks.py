@@ -0,0 +1,136 @@
+import base64
+import hashlib
+import hmac
+import os
+import socket
+import threading
+import time
+from typing import Dict, Optional
+from utilities import load_env
+
+
+class AirtableWebhookProcessor:
+    """
+    Applies Airtable-side edits pushed through a webhook.
+
+    Airtable's notification ping carries no data: on each ping the changed record ids
+    are read from the webhook's payload list, starting at the cursor stored in the
+    webhook_cursors table, and only those records are fetched and upserted (see
+    TableManager.apply_airtable_changes). The cursor is saved after each page, and
+    payloads whose baseTransactionNumber was already applied are skipped, so repeated
+    or overlapping pings don't apply anything twice.
+    """
+    # Wait this long for another worker that is already reading the same webhook
+    LEASE_WAIT_SECONDS = 30
+
+    def __init__(self, multi_manager, webhook_id: Optional[str] = None, mac_secret: Optional[str] = None,
+                 allow_unsigned: Optional[bool] = None):
+        """
+        Args:
+            multi_manager: AirtableMultiManager for the webhook's base
+            webhook_id: Webhook id (ach...), defaults to AIRTABLE_WEBHOOK_ID
+            mac_secret: Base64 MAC secret from webhook creation, defaults to AIRTABLE_WEBHOOK_MAC_SECRET
+            allow_unsigned: Accept notifications without checking them when there is no MAC secret,
+                            for local development only; defaults to AIRTABLE_WEBHOOK_ALLOW_UNSIGNED
+        """
+        self.multi_manager = multi_manager
+        self.storage = multi_manager.sqlite_storage
+        self.client = multi_manager.airtable_client
+        self.webhook_id = webhook_id or load_env('AIRTABLE_WEBHOOK_ID', '')
+        self.mac_secret = mac_secret or load_env('AIRTABLE_WEBHOOK_MAC_SECRET', '')
+        if allow_unsigned is None:
+            allow_unsigned = load_env('AIRTABLE_WEBHOOK_ALLOW_UNSIGNED', 'false').lower() in ('1', 'true', 'yes')
+        self.allow_unsigned = allow_unsigned
+        self._table_names: Dict[str, str] = {}
+
+    def verify_signature(self, body: bytes, header: Optional[str]) -> bool:
+        """
+        Check the X-Airtable-Content-MAC header of a notification against the MAC secret.
+        Without a secret every notification is rejected, unless unsigned ones
+        have been explicitly allowed for development.
+        """
+        if not self.mac_secret:
+            return self.allow_unsigned
+        if not header or not header.startswith('hmac-sha256='):
+            return False
+        expected = hmac.new(base64.b64decode(self.mac_secret), body, hashlib.sha256).hexdigest()
+        return hmac.compare_digest(expected, header[len('hmac-sha256='):])
+
+    def _table_name(self, table_id: str) -> Optional[str]:
+        if table_id not in self._table_names:
+            # Tables may have been added since the last lookup
+            self._table_names = self.multi_manager.get_table_ids_from_base() or self._table_names
+        return self._table_names.get(table_id)
+
+    def _fetch_payloads(self, webhook_id: str, cursor: int) -> dict:
+        url = f"{self.client.api_url}/bases/{self.multi_manager.base_id}/webhooks/{webhook_id}/payloads"
+        response = self.client.request('GET', url, operation='GET webhook payloads', params={"cursor": cursor})
+        response.raise_for_status()
+        return response.json()
+
+    def process(self, webhook_id: Optional[str] = None) -> dict:
+        """
+        Read every new payload for the webhook and apply the changed records.
+
+        Returns:
+            Dictionary with the payloads applied and skipped, the new cursor and a
+            status message per table
+        """
+        webhook_id = webhook_id or self.webhook_id
+        if not webhook_id:
+            raise ValueError("No webhook id given and AIRTABLE_WEBHOOK_ID is not set")
+
+        # One reader per webhook at a time, so cursor updates don't race
+        lease_name = f"webhook:{webhook_id}"
+        # acquire_lease lets a holder take its own lease again, so the holder must be unique
+        # across processes (and across threads, since a process can run several processors)
+        holder = f"{socket.gethostname()}:{os.getpid()}:{threading.get_ident()}"
+        deadline = time.monotonic() + self.LEASE_WAIT_SECONDS
+        while not self.storage.acquire_lease(lease_name, holder, ttl_seconds=300):
+            if time.monotonic() > deadline:
+                raise TimeoutError(f"Webhook {webhook_id} is being processed by another worker")
+            time.sleep(0.5)
+
+        summary = {"applied_payloads": 0, "skipped_payloads": 0, "tables": {}}
+        try:
+            state = self.storage.get_webhook_cursor(webhook_id)
+            cursor, last_transaction = state["cursor"], state["last_transaction"]
+            while True:
+                page = self._fetch_payloads(webhook_id, cursor)
+                changed: Dict[str, set] = {}
+                destroyed: Dict[str, set] = {}
+                for payload in page.get("payloads", []):
+                    transaction = payload.get("baseTransactionNumber", 0)
+                    if transaction <= last_transaction:
+                        summary["skipped_payloads"] += 1
+                        continue
+                    # Payloads are in transaction order, so later deletes override earlier edits
+                    for table_id, changes in payload.get("changedTablesById", {}).items():
+                        table_changed = changed.setdefault(table_id, set())
+                        table_destroyed = destroyed.setdefault(table_id, set())
+                        for key in ("createdRecordsById", "changedRecordsById"):
+                            table_changed.update(changes.get(key, {}).keys())
+                        for record_id in changes.get("destroyedRecordIds", []):
+                            table_changed.discard(record_id)
+                            table_destroyed.add(record_id)
+                    last_transaction = transaction
+                    summary["applied_payloads"] += 1
+
+                for table_id in set(changed) | set(destroyed):
+                    table_name = self._table_name(table_id)
+                    manager = self.multi_manager.get_manager(table_name) if table_name else None
+                    if not manager:
+                        continue
+                    result = manager.apply_airtable_changes(changed.get(table_id, set()), destroyed.get(table_id, set()))
+                    summary["tables"].setdefault(table_name, []).append(result)
+
+                cursor = page.get("cursor", cursor)
+                self.storage.save_webhook_cursor(webhook_id, cursor, last_transaction)
+                if not page.get("mightHaveMore"):
+                    break
+        except Exception as e:
+            self.storage.release_lease(lease_name, holder, False, f"Error: {str(e)}")
+            raise
+        summary["cursor"] = cursor
+        self.storage.release_lease(lease_name, holder, True, summary)
+        return summary
@@ -1,18 +1,35 @@
-from flask import Flask, jsonify, request, Response, render_template, send_from_directory
-from flask_cors import CORS
+import startup_profile
+
+with startup_profile.phase("import flask"):
+    from flask import Flask, jsonify, request, Response, render_template, send_from_directory
+    from flask_cors import CORS
 import os
-from airtable_multi_manager import AirtableMultiManager
-from student_data_manager import StudentDataManager
-import threading
-from scheduler import DailyAirtableUploader
-from utilities import load_env, deep_jsonify, parse_database_row, critical_tables
-from quest_routes import quest_bp
-from admin_routes import admin_bp
+with startup_profile.phase("import data managers"):
+    from airtable_multi_manager import AirtableMultiManager
+    from student_data_manager import StudentDataManager
+    from sync_planner import AdaptiveSyncPlanner
+    from airtable_webhooks import AirtableWebhookProcessor
+    from initial_sync import InitialSync
+    from request_metrics import RequestMetrics
+    from sampling_profiler import SamplingProfiler
+    from utilities import load_env, deep_jsonify, parse_database_row, critical_tables
+with startup_profile.phase("import blueprints"):
+    from quest_routes import quest_bp
+    from admin_routes import admin_bp
 import uuid
 
 app = Flask(__name__)
 CORS(app)
 
+# Per-route latency, status, database and response size metrics for /metrics.
+# Registered first so its before_request hook runs ahead of any that answer early.
+request_metrics = RequestMetrics()
+request_metrics.init_app(app)
+
+# On-demand profiler for the admin API; idle unless an admin starts a profile
+profiler = SamplingProfiler()
+profiler.init_app(app)
+
 # Configure session for admin authentication
 app.secret_key = os.environ.get('SECRET_KEY', 'dev-secret-key-change-in-production')
 
@@ -21,28 +38,28 @@ ENVIRONMENT_MODE = load_env('ENVIRONMENT_MODE')
 # --- Initialisation ---
 
 # Initialize TableManager with environment variables
-multi_manager = AirtableMultiManager.from_environment()
+with startup_profile.phase("database engine"):
+    multi_manager = AirtableMultiManager.from_environment()
+
+# Tracks the background initial sync (if the database starts empty) for /readyz
+initial_sync = InitialSync(multi_manager)
 
 # Initialize StudentDataManager globally with error handling
 student_data_manager = None
 try:
-    # Discover and add all tables from the base
-    results = multi_manager.discover_and_add_tables_from_base()
+    # Add the base's tables from the cached catalog; discovery refreshes it in the background
+    with startup_profile.phase("table catalog"):
+        results = multi_manager.load_table_catalog()
     print(f"Added tables: {results}")
     
     # Check if database has data - only update from Airtable if empty
-    database_has_data = multi_manager.sqlite_storage.has_data_in_critical_tables()
+    with startup_profile.phase("critical table check"):
+        database_has_data = multi_manager.sqlite_storage.has_data_in_critical_tables()
     
     if not database_has_data:
-        print("Database appears empty - performing initial sync from Airtable")
-        results = multi_manager.update_all_tables()
-        print("Initial sync results: ", results)
-        
-        # Check if critical tables failed
-        failed_critical = [table for table in critical_tables if table in results and 'Error' in str(results[table])]
-        if failed_critical:
-            print(f"Warning: Critical tables failed to update: {failed_critical}")
-            
+        # Sync in the background so the server can start; data requests get a 503 until their tables load
+        print("Database appears empty - starting initial sync from Airtable in the background")
+        initial_sync.start()
     else:
         print("Database has existing data - skipping initial sync from Airtable")
     
@@ -53,8 +70,21 @@ except Exception as e:
     print(f"Failed to initialize StudentDataManager: {e}")
     student_data_manager = None
 
+def reset_after_fork():
+    """
+    Called in each gunicorn worker right after it is forked from the preloaded app
+    (see gunicorn.conf.py), so no database connection, HTTP session, lock or thread
+    state is shared with the parent process.
+    """
+    multi_manager.sqlite_storage.reset_after_fork()
+    multi_manager.reset_airtable_client()
+    initial_sync.reset_after_fork()
+    # Pick up tables the parent's background discovery cached after the app was loaded
+    multi_manager.reload_table_catalog()
+
 # Store multi_manager in app config for use in blueprints
 app.config['multi_manager'] = multi_manager
+app.config['profiler'] = profiler
 
 # Register quest routes blueprint
 app.register_blueprint(quest_bp)
@@ -71,6 +101,65 @@ def deep_jsonify_response(obj):
     return jsonify(serialized)
 
 
+# --- Readiness ---
+
+# Paths served from the synced tables; while the initial sync loads them they get a 503 rather than missing data.
+# Tables whose load failed aren't waited for: the sync retries them in the background.
+DATA_PATH_PREFIXES = ('/data/', '/get-', '/students/', '/teachers/', '/teacher/', '/quests/', '/api/',
+                      '/modify-', '/update-student', '/update-and-check-quest', '/add-', '/delete-', '/assign-')
+SYNC_PATHS = ('/get-modified-tables',)
+
+@app.before_request
+def reject_requests_for_unloaded_tables():
+    if not request.path.startswith(DATA_PATH_PREFIXES) or request.path in SYNC_PATHS:
+        return None
+    table_name = (request.view_args or {}).get('table_name')
+    waiting = initial_sync.loading_tables([table_name] if table_name else critical_tables)
+    if not waiting:
+        return None
+    response = jsonify({
+        "error": "Data is still loading from Airtable, try again shortly",
+        "waiting_for": waiting
+    })
+    response.status_code = 503
+    response.headers['Retry-After'] = str(initial_sync.RETRY_AFTER_SECONDS)
+    return response
+
+
+@app.route("/healthz", methods=['GET'])
+def healthz():
+    """
+    Liveness check: the process is up and serving requests
+    """
+    return jsonify({"status": "ok"}), 200
+
+
+@app.route("/readyz", methods=['GET'])
+def readyz():
+    """
+    Readiness check: 200 once the critical tables are loaded, otherwise 503 with the initial sync's per-table
+    progress, listing any tables that failed to load
+    """
+    progress = initial_sync.get_progress()
+    if progress["ready"]:
+        return jsonify(progress), 200
+    response = jsonify(progress)
+    response.status_code = 503
+    if progress["loading"] or progress["running"]:
+        response.headers['Retry-After'] = str(initial_sync.RETRY_AFTER_SECONDS)
+    return response
+
+
+@app.route("/metrics", methods=['GET'])
+def metrics():
+    """
+    Request metrics for this process in the Prometheus text format: per-route latency,
+    database statement and response size histograms, database time and status counts,
+    labelled by blueprint (core, quests, admin), route and method
+    """
+    return Response(request_metrics.render(), mimetype='text/plain; version=0.0.4')
+
+
 # --- Routes ---
 
 @app.route("/")
@@ -102,20 +191,16 @@ def get_table_manager(table_name):
 @app.route("/sync/update-all", methods=['POST'])
 @app.route("/update-server-from-airtable", methods=['POST'])
 def update_server_from_airtable():
-    results = multi_manager.update_all_tables()
-    if results:
-        return jsonify({
-            "message": "All tables updated from Airtable",
-            "results": results
-        }), 200
-    else:
-        return Response(f"Failed to update from Airtable: {results}", status=500)
+    """
+    Queue a sync of every table from Airtable for the sync worker
+    """
+    return _queue_job_response('sync')
 
 @app.route("/sync/update-table", methods=['POST'])
 @app.route("/update-table-from-airtable", methods=['POST'])
 def update_table_from_airtable():
     """
-    Update specific table(s) from Airtable.
+    Queue a sync of a specific table from Airtable for the sync worker.
     
     Expected JSON format:
     {
@@ -125,48 +210,24 @@ def update_table_from_airtable():
     
     Or use query parameters: /update-table-from-airtable?table_name=craffft_students&force_delete=true
     """
-    try:
-        # Get table name from JSON body or query parameter
-        table_name = None
-        force_delete = True  # Default to true for safety
-        
-        if request.is_json:
-            data = request.get_json()
-            if data:
-                table_name = data.get('table_name')
-                force_delete = data.get('force_delete', True)  # Default to True
-        
-        if not table_name:
-            table_name = request.args.get('table_name')
-        if request.args.get('force_delete') is not None:
-            force_delete = request.args.get('force_delete', 'true').lower() == 'true'
-        
-        if table_name:
-            # Update specific table
-            manager = multi_manager.get_manager(table_name)
-            if not manager:
-                return jsonify({"error": f"Table '{table_name}' not found"}), 404
-            
-            result = manager.update_database_from_airtable(force_delete=force_delete)
-            
-            if result and not str(result).startswith("Error"):
-                response_message = f"Table '{table_name}' updated successfully from Airtable"
-                if force_delete:
-                    response_message += " (table was deleted and recreated)"
-                    
-                return jsonify({
-                    "message": response_message,
-                    "table": table_name,
-                    "force_delete": force_delete,
-                    "result": result
-                }), 200
-            else:
-                return jsonify({
-                    "error": f"Failed to update table '{table_name}' from Airtable",
-                    "result": result
-                }), 500
-    except Exception as e:
-        return jsonify({"error": f"Unexpected error: {str(e)}"}), 500
+    # Get table name from JSON body or query parameter
+    table_name = None
+    force_delete = True  # Default to true for safety
+    
+    if request.is_json:
+        data = request.get_json(silent=True)
+        if data:
+            table_name = data.get('table_name')
+            force_delete = data.get('force_delete', True)  # Default to True
+    
+    if not table_name:
+        table_name = request.args.get('table_name')
+    if request.args.get('force_delete') is not None:
+        force_delete = request.args.get('force_delete', 'true').lower() == 'true'
+    
+    if not table_name:
+        return jsonify({"error": "table_name is required"}), 400
+    return _queue_job_response('sync', table_name, {"force_delete": bool(force_delete)})
 
 
 @app.route("/data/json/<table_name>", methods=['GET'])
@@ -301,6 +362,27 @@ def get_teacher_data(id):
 
     return jsonify(teacher_info)
 
+@app.route("/teachers/dashboard/<teacher_id>", methods=['GET'])
+def get_teacher_dashboard(teacher_id):
+    """
+    Dashboard data for every class of a teacher (their classroom_ids), in one request.
+
+    Returns:
+        teacher: The teacher's website_user_id, first_name and last_name
+        quests: The quests any of the teacher's students are on
+        classes: One section per classroom id with classroom_id, class_name and the
+                 students, as /students/dashboard/<classroom_id> returns them
+    """
+    if not student_data_manager:
+        return Response("StudentDataManager not found", status=404)
+
+    dashboard_info = student_data_manager.get_teacher_dashboard(teacher_id)
+    if not dashboard_info:
+        return Response(f"No data found for teacher_id: {teacher_id}", status=404)
+
+    parsed_dashboard = deep_jsonify(dashboard_info, parse_stringified_lists=True)
+    return jsonify(parsed_dashboard)
+
 @app.route("/teacher/add", methods=['POST'])
 @app.route("/add-teacher", methods=['POST'])
 def add_teacher():
@@ -352,9 +434,6 @@ def add_teacher():
     success = teachers_manager.add_record(teacher_record)
     
     if success:
-        # Mark table as modified for Airtable sync
-        multi_manager.mark_table_as_modified("craffft_teachers")
-        
         return jsonify({
             "message": "Teacher added successfully",
             "teacher": {
@@ -521,6 +600,68 @@ def update_and_check_quest():
     })
 
 
+@app.route("/students/update-and-check-quest/batch", methods=['POST'])
+def update_and_check_quest_batch():
+    """
+    Update many students' current steps at once, in one transaction.
+
+    Expected JSON format:
+    {
+        "allow-quest-update": true,  // optional, defaults to true
+        "updates": [
+            {"websiteId": 12345, "current-step": "GG-S2"},
+            {"websiteId": 12346, "current-step": "GG-S5"}
+        ]
+    }
+
+    Returns:
+        results: One entry per update, in order, with websiteId and either the
+                 update-and-check-quest response fields or an error
+        updated_count / failed_count
+    """
+    data = request.get_json(silent=True)
+    if not data or not isinstance(data.get('updates'), list) or not data['updates']:
+        return jsonify({"error": "Missing 'updates' array"}), 400
+
+    if not student_data_manager:
+        return jsonify({"error": "StudentDataManager not found"}), 500
+
+    allow_quest_update = str(data.get('allow-quest-update', True)).lower() == "true"
+    updates = []
+    for i, update in enumerate(data['updates']):
+        if not isinstance(update, dict) or not update.get('websiteId') or not update.get('current-step'):
+            return jsonify({"error": f"Update {i} is missing websiteId or current-step"}), 400
+        updates.append((str(update['websiteId']), update['current-step']))
+
+    results = []
+    for (website_id, _), result in zip(updates, student_data_manager.update_steps_and_check_quests(updates, allow_quest_update)):
+        if result["success"]:
+            results.append({
+                "websiteId": website_id,
+                "current_step": result["current_step"],
+                "current_quest": result["current_quest"],
+                "quest_changed": result["quest_changed"],
+                "quest_completed": result.get("quest_completed", False)
+            })
+        else:
+            results.append({"websiteId": website_id, "error": result["error"]})
+
+    failed_count = sum(1 for result in results if "error" in result)
+    if not failed_count:
+        status_code = 200
+    elif failed_count == len(results):
+        status_code = 400
+    else:
+        # Mixed results (some succeeded, some failed)
+        status_code = 207  # Multi-Status
+
+    return jsonify({
+        "updated_count": len(results) - failed_count,
+        "failed_count": failed_count,
+        "results": results
+    }), status_code
+
+
 @app.route("/students/add", methods=['POST'])
 @app.route("/add-students", methods=['POST'])
 def add_students():
@@ -639,10 +780,6 @@ def add_students():
                     "error": f"Unexpected error: {str(e)}"
                 })
         
-        # Mark table as modified for Airtable sync
-        if added_students:
-            multi_manager.mark_table_as_modified("craffft_students")
-        
         # Add classes to teacher if requested and students were successfully added
         teacher_update_result = None
         if add_classes_to_teacher and teacher_website_id and added_students and student_data_manager:
@@ -719,10 +856,6 @@ def delete_students():
         else:
             failed.append({"website_id": website_id, "error": "Delete failed"})
     
-    # Mark table for Airtable sync
-    if deleted:
-        multi_manager.mark_table_as_modified("craffft_students")
-    
     # Determine appropriate status code
     if not deleted and not failed:
         # No website_ids provided or empty array
@@ -815,10 +948,6 @@ def modify_students():
                 "new_name": f"{student_update.get('first_name', student.get('first_name', ''))} {student_update.get('last_name', student.get('last_name', ''))}".strip()
             })
     
-    # Mark table for Airtable sync
-    if modified:
-        multi_manager.mark_table_as_modified("craffft_students")
-    
     # Determine appropriate status code
     if not modified and not failed:
         # No valid updates requested
@@ -896,10 +1025,6 @@ def assign_quests():
             else:
                 failed_assignments.append(assignment)
         
-        # Mark table as modified for Airtable sync
-        if successful_assignments:
-            multi_manager.mark_table_as_modified("craffft_students")
-        
         return jsonify({
             "successful_count": len(successful_assignments),
             "failed_count": len(failed_assignments),
@@ -944,11 +1069,10 @@ def assign_quest_to_class():
         if not class_name or not quest_code:
             return jsonify({"error": "Missing required parameters: class_name and quest_code"}), 400
         
-        # Get the students table manager
-        students_manager = multi_manager.get_manager("craffft_students")
-        
-        # Find all students in the given class using the new get_rows method
-        students_in_class = students_manager.get_rows("current_class", class_name)
+        # Reset quest fields and assign the new quest for the whole class at once
+        students_in_class = student_data_manager.reset_class_quest(class_name, quest_code)
+        if students_in_class is None:
+            return jsonify({"error": f"Failed to update quest in database for class '{class_name}'"}), 500
         
         if not students_in_class:
             return jsonify({
@@ -963,44 +1087,22 @@ def assign_quest_to_class():
         successful_assignments = []
         failed_assignments = []
         
-        # Assign the quest to each student in the class
         for student in students_in_class:
-            try:
-                website_id = student.get('website_id')
-                student_name = f"{student.get('first_name', '')} {student.get('last_name', '')}".strip()
-                
-                if not website_id:
-                    failed_assignments.append({
-                        "student": student_name,
-                        "error": "Missing website_id"
-                    })
-                    continue
-                
-                # Reset quest fields and assign new quest using StudentDataManager
-                success = student_data_manager.reset_student_quest(str(website_id), quest_code)
-                
-                if success:
-                    successful_assignments.append({
-                        "website_id": website_id,
-                        "student_name": student_name,
-                        "quest_code": quest_code
-                    })
-                else:
-                    failed_assignments.append({
-                        "website_id": website_id,
-                        "student_name": student_name,
-                        "error": "Failed to update quest in database"
-                    })
-                    
-            except Exception as e:
+            website_id = student.get('website_id')
+            student_name = f"{student.get('first_name', '')} {student.get('last_name', '')}".strip()
+            
+            if not website_id:
                 failed_assignments.append({
-                    "student": student.get('first_name', 'Unknown'),
-                    "error": f"Unexpected error: {str(e)}"
+                    "student": student_name,
+                    "error": "Missing website_id"
                 })
-        
-        # Mark table as modified for Airtable sync if any assignments were successful
-        if successful_assignments:
-            multi_manager.mark_table_as_modified("craffft_students")
+                continue
+            
+            successful_assignments.append({
+                "website_id": website_id,
+                "student_name": student_name,
+                "quest_code": quest_code
+            })
         
         # Prepare response
         response_data = {
@@ -1112,9 +1214,6 @@ def assign_achievement_to_student():
         if not success:
             return jsonify({"error": "Failed to update student achievements in database"}), 500
         
-        # Mark table as modified for Airtable sync
-        multi_manager.mark_table_as_modified("craffft_students")
-        
         # Return success response with the achievement data
         return jsonify({
             "message": "Achievement assigned successfully",
@@ -1133,59 +1232,11 @@ def assign_achievement_to_student():
 @app.route("/upload-to-airtable", methods=['POST'])
 def upload_to_airtable():
     """
-    Upload all modified tables back to Airtable, or upload a specific table if specified
+    Queue an upload of all modified tables back to Airtable, or of a specific table if specified
     """
-
     force_upload = request.args.get("force_upload", default=False, type=bool)
     table_name = request.args.get("table_name")
-
-    # If a specific table is requested
-    if table_name:
-        # Check if the table exists
-        manager = multi_manager.get_manager(table_name)
-        if not manager:
-            return Response(f"Table '{table_name}' not found", status=404)
-        
-        # Upload the specific table
-        if force_upload:
-            # Mark as modified to ensure upload happens
-            multi_manager.mark_table_as_modified(table_name)
-        
-        result = multi_manager.upload_table_to_airtable(table_name)
-        
-        if result and not result.startswith("Error"):
-            return jsonify({
-                "message": f"Successfully uploaded table '{table_name}' to Airtable",
-                "table": table_name,
-                "result": result
-            }), 200
-        else:
-            return jsonify({
-                "message": f"Failed to upload table '{table_name}' to Airtable",
-                "table": table_name,
-                "result": result
-            }), 500
-    
-    # Otherwise, upload all modified tables (existing behavior)
-    results = multi_manager.upload_modified_tables_to_airtable(force_upload=force_upload)
-    modified_tables = multi_manager.get_modified_tables()
-    
-    if not modified_tables and not force_upload:
-        return jsonify({"message": "No tables have been modified", "results": results}), 200
-    
-    success_count = sum(1 for result in results.values() if result and not result.startswith("Error"))
-    total_count = len(modified_tables) if not force_upload else len(results)
-    
-    if success_count == total_count:
-        return jsonify({
-            "message": f"Successfully uploaded {success_count} {'modified ' if not force_upload else ''}tables to Airtable",
-            "results": results
-        }), 200
-    else:
-        return jsonify({
-            "message": f"Uploaded {success_count}/{total_count} tables. Some uploads failed.",
-            "results": results
-        }), 207  # 207 = Multi-Status
+    return _queue_job_response('upload', table_name, {"force_upload": True} if force_upload else {})
 
 
 
@@ -1202,24 +1253,120 @@ def get_modified_tables():
     })
 
 
-# Set up API documentation after all routes are defined
-from docs.swagger_docs import setup_api_docs
-api = setup_api_docs(app)
+@app.route("/sync/airtable-metrics", methods=['GET'])
+def get_airtable_metrics():
+    """
+    Get per-operation Airtable call metrics: calls, errors, retries, throttled (429)
+    responses, latency and time spent waiting on the rate limiter
+    """
+    return jsonify(multi_manager.get_airtable_metrics())
 
 
-# --- Scheduler Initialisation ---
+@app.route("/sync/jobs", methods=['POST'])
+def queue_sync_job():
+    """
+    Queue a sync or upload job for the sync worker instead of running it in this request.
+    
+    Expected JSON format:
+    {
+        "job_type": "sync",  // Required: "sync" (Airtable -> database) or "upload" (database -> Airtable)
+        "table_name": "craffft_students",  // Optional, defaults to every table
+        "force_upload": false,  // Optional, upload jobs only: replace the table(s) in full
+        "force_delete": true  // Optional, sync jobs for one table only
+    }
+    """
+    data = request.get_json(silent=True) or {}
+    job_type = data.get('job_type')
+    if job_type not in ('sync', 'upload'):
+        return jsonify({"error": "job_type must be 'sync' or 'upload'"}), 400
 
-if __name__ == '__main__':
-    # Start the scheduler if in production mode
-    if ENVIRONMENT_MODE == 'Production': 
-        print("Starting scheduler for Production mode")
-        
-        # Start the scheduler in a background thread
-        def start_scheduler():
-            uploader = DailyAirtableUploader()
-            uploader.run_daily("00:00")  # Set desired time
+    table_name = data.get('table_name')
+    options = {}
+    if job_type == 'upload' and data.get('force_upload'):
+        options['force_upload'] = True
+    if job_type == 'sync' and table_name and 'force_delete' in data:
+        options['force_delete'] = bool(data['force_delete'])
+
+    return _queue_job_response(job_type, table_name, options)
+
+
+def _queue_job_response(job_type, table_name=None, options=None):
+    """
+    Queue a job for the sync worker and build the 202 response pointing at it
+    (404 if the table doesn't exist).
+    """
+    if table_name and not multi_manager.get_manager(table_name):
+        return jsonify({"error": f"Table '{table_name}' not found"}), 404
+    job = multi_manager.sqlite_storage.enqueue_job(job_type, table_name, options)
+    return jsonify({"message": f"Job {job['id']} queued for the sync worker", "job": job}), 202
+
+
+@app.route("/sync/jobs", methods=['GET'])
+def get_sync_jobs():
+    """
+    Get the most recent sync jobs, newest first (limit with ?limit=, default 20)
+    """
+    limit = request.args.get("limit", default=20, type=int)
+    return jsonify({"jobs": multi_manager.sqlite_storage.get_recent_jobs(limit)})
 
-        scheduler_thread = threading.Thread(target=start_scheduler, daemon=True)
-        scheduler_thread.start()
 
+@app.route("/sync/jobs/<int:job_id>", methods=['GET'])
+def get_sync_job(job_id):
+    """
+    Get the status and result of a queued sync job
+    """
+    job = multi_manager.sqlite_storage.get_job(job_id)
+    if not job:
+        return jsonify({"error": f"Job {job_id} not found"}), 404
+    return jsonify(job)
+
+
+@app.route("/sync/airtable-webhook", methods=['POST'])
+def receive_airtable_webhook():
+    """
+    Receive an Airtable webhook notification ping and queue a job for the sync worker
+    to fetch and apply just the changed records.
+    The X-Airtable-Content-MAC signature is checked against AIRTABLE_WEBHOOK_MAC_SECRET; without
+    a secret, notifications are rejected unless AIRTABLE_WEBHOOK_ALLOW_UNSIGNED is set for development.
+    """
+    processor = AirtableWebhookProcessor(multi_manager)
+    if not processor.verify_signature(request.get_data(), request.headers.get('X-Airtable-Content-MAC')):
+        return jsonify({"error": "Invalid webhook signature"}), 401
+
+    data = request.get_json(silent=True) or {}
+    webhook_id = (data.get('webhook') or {}).get('id')
+    if not webhook_id:
+        return jsonify({"error": "Notification has no webhook id"}), 400
+    if processor.webhook_id and webhook_id != processor.webhook_id:
+        return jsonify({"error": f"Unknown webhook {webhook_id}"}), 404
+
+    # Pings that arrive while a job is still pending are coalesced into it
+    job = multi_manager.sqlite_storage.enqueue_job('webhook', options={"webhook_id": webhook_id})
+    return jsonify({"message": f"Webhook {webhook_id} queued as job {job['id']}", "job": job}), 200
+
+
+@app.route("/sync/scheduler", methods=['GET'])
+def get_scheduler_status():
+    """
+    Get the sync worker's scheduled job leases (which worker holds each one and how its last run went)
+    and the adaptive planner's per-table change rates, intervals and last runs
+    """
+    return jsonify({
+        "leases": multi_manager.sqlite_storage.get_leases(),
+        "adaptive": AdaptiveSyncPlanner(multi_manager).get_status()
+    })
+
+
+# API documentation (/docs/) is built on its first request, see docs/lazy_docs.py
+from docs.lazy_docs import LazyApiDocs
+api_docs = LazyApiDocs(app)
+
+startup_profile.finish()
+
+
+# --- Scheduler ---
+# Scheduled uploads and queued sync jobs run in the separate worker process
+# (`python scheduler.py`, the `worker` entry in the Procfile), never in the web process.
+
+if __name__ == '__main__':
     app.run(debug=(ENVIRONMENT_MODE != 'Production'))
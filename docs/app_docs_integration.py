@@ -217,11 +217,10 @@ def wrap_sync_endpoints(app):
     with app.app_context():
         @sync_ns.route('/from-airtable/all')
         class UpdateFromAirtableAll(sync_ns.resource):
-            @sync_ns.doc('update_from_airtable_all', description='Update all tables from Airtable')
-            @sync_ns.response(200, 'Tables updated successfully')
-            @sync_ns.response(500, 'Update failed')
+            @sync_ns.doc('update_from_airtable_all', description='Queue a sync of all tables from Airtable')
+            @sync_ns.response(202, 'Sync job queued')
             def post(self):
-                """Update all tables from Airtable"""
+                """Queue a sync of all tables from Airtable"""
                 from app import update_server_from_airtable
                 return update_server_from_airtable()
         
@@ -231,26 +230,26 @@ def wrap_sync_endpoints(app):
                 'table_name': sync_ns.fields.String(required=True, description='Table name', example='craffft_students'),
                 'force_delete': sync_ns.fields.Boolean(description='Force delete and recreate', example=True, default=True)
             }))
-            @sync_ns.doc('update_from_airtable_table', description='Update specific table from Airtable')
-            @sync_ns.response(200, 'Table updated successfully')
+            @sync_ns.doc('update_from_airtable_table', description='Queue a sync of a specific table from Airtable')
+            @sync_ns.response(202, 'Sync job queued')
             @sync_ns.response(404, 'Table not found')
             def post(self):
-                """Update specific table from Airtable"""
+                """Queue a sync of a specific table from Airtable"""
                 from app import update_table_from_airtable
                 return update_table_from_airtable()
         
         @sync_ns.route('/to-airtable')
         class UploadToAirtable(sync_ns.resource):
             @sync_ns.doc('upload_to_airtable', 
-                        description='Upload modified tables to Airtable',
+                        description='Queue an upload of modified tables to Airtable',
                         params={
                             'force_upload': 'Force upload all tables (optional)',
                             'table_name': 'Specific table to upload (optional)'
                         })
-            @sync_ns.response(200, 'Upload successful')
-            @sync_ns.response(500, 'Upload failed')
+            @sync_ns.response(202, 'Upload job queued')
+            @sync_ns.response(404, 'Table not found')
             def post(self):
-                """Upload all modified tables back to Airtable"""
+                """Queue an upload of modified tables to Airtable"""
                 from app import upload_to_airtable
                 return upload_to_airtable()
         
@@ -0,0 +1,50 @@
+"""
+Builds the Swagger documentation on first use instead of at import time.
+
+Importing flask-restx and building the documentation's model graph is a noticeable
+part of every worker boot and test run, and most processes never serve /docs/.
+Flask doesn't allow routes to be added once an app has served a request, so the
+documentation lives in its own small Flask app, created by setup_api_docs on the
+first request for one of its paths. It shares the main app's config and view
+functions, so call_view_function and "Try it out" behave as before.
+"""
+
+import threading
+from flask import Flask
+
+# Paths served by the documentation app: the UI, its assets, the spec and one prefix per namespace
+DOCS_PATH_PREFIXES = ('/docs', '/swagger.json', '/swaggerui/',
+                      '/Students/', '/Teachers/', '/Quests & Steps/', '/Database/', '/Airtable Sync/')
+
+
+class LazyApiDocs:
+    """
+    WSGI middleware sending documentation requests to a docs app built on first use.
+    """
+
+    def __init__(self, app: Flask):
+        self.app = app
+        self.wsgi_app = app.wsgi_app
+        self._docs_app = None
+        self._lock = threading.Lock()
+        app.wsgi_app = self
+
+    @property
+    def built(self) -> bool:
+        return self._docs_app is not None
+
+    def get_docs_app(self) -> Flask:
+        with self._lock:
+            if self._docs_app is None:
+                from docs.swagger_docs import setup_api_docs
+                docs_app = Flask(self.app.import_name)
+                docs_app.config.update(self.app.config)
+                docs_app.view_functions.update(self.app.view_functions)
+                setup_api_docs(docs_app)
+                self._docs_app = docs_app
+            return self._docs_app
+
+    def __call__(self, environ, start_response):
+        if environ.get('PATH_INFO', '').startswith(DOCS_PATH_PREFIXES):
+            return self.get_docs_app()(environ, start_response)
+        return self.wsgi_app(environ, start_response)
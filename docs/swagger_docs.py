@@ -142,6 +142,16 @@ def setup_api_docs(app):
         'students': fields.List(fields.Nested(modify_student_model), required=True, description='List of student modifications')
     })
     
+    step_update_model = api.model('StepUpdate', {
+        'websiteId': fields.Integer(required=True, description='Student website ID', example=12345),
+        'current-step': fields.String(required=True, description='New current step', example='GG-S2')
+    })
+
+    step_updates_model = api.model('StepUpdates', {
+        'updates': fields.List(fields.Nested(step_update_model), required=True, description='Step updates, applied in order'),
+        'allow-quest-update': fields.Boolean(description='Allow quest updates', example=True, default=True)
+    })
+
     # Teacher models
     teacher_model = api.model('Teacher', {
         'website_user_id': fields.String(required=True, description='Teacher website user ID', example='12345'),
@@ -353,7 +363,29 @@ def setup_api_docs(app):
         def get(self):
             """Update student's current step and check if quest changed"""
             return call_view_function('update_and_check_quest')
-    
+
+    @students_ns.route('/update-and-check-quest/batch')
+    class UpdateAndCheckQuestBatchDoc(Resource):
+        @students_ns.expect(step_updates_model, validate=True)
+        @students_ns.doc('update_and_check_quest_batch',
+                        description="""
+                        Update many students' current steps at once.
+
+                        **Logic:**
+                        - Applies each update as update-and-check-quest does, in order
+                        - All updates are written in one transaction
+                        - Returns one result per update, with websiteId and either the
+                          update-and-check-quest fields or an error
+
+                        **Status:** 200 if every update succeeded, 207 if some failed, 400 if all failed
+                        """)
+        @students_ns.response(200, 'All steps updated successfully', success_response_model)
+        @students_ns.response(207, 'Partial success - some updates failed', success_response_model)
+        @students_ns.response(400, 'Invalid request or every update failed', error_response_model)
+        def post(self):
+            """Update many students' current steps and check if their quests changed"""
+            return call_view_function('update_and_check_quest_batch')
+
     # =============================================================================
     # TEACHER ENDPOINTS
     # =============================================================================
@@ -387,6 +419,23 @@ def setup_api_docs(app):
         def get(self, teacher_id):
             """Get teacher data by ID"""
             return call_view_function('get_teacher_data', teacher_id)
+
+    @teachers_ns.route('/dashboard/<string:teacher_id>')
+    class GetTeacherDashboardDoc(Resource):
+        @teachers_ns.doc('get_teacher_dashboard',
+                        description="""
+                        Get dashboard data for every class of a teacher in one request.
+
+                        **Features:**
+                        - Covers every class in the teacher's classroom_ids
+                        - Returns the quests once, shared by all classes
+                        - One section per class with its students, as the student dashboard returns them
+                        """)
+        @teachers_ns.response(200, 'Dashboard data retrieved', success_response_model)
+        @teachers_ns.response(404, 'Teacher not found', error_response_model)
+        def get(self, teacher_id):
+            """Get dashboard data for all of a teacher's classes"""
+            return call_view_function('get_teacher_dashboard', teacher_id)
     
     # =============================================================================
     # QUEST & ACHIEVEMENT ENDPOINTS
@@ -536,17 +585,16 @@ def setup_api_docs(app):
     class UpdateFromAirtableAllDoc(Resource):
         @sync_ns.doc('update_from_airtable_all',
                     description="""
-                    Update all tables from Airtable.
+                    Queue a sync of all tables from Airtable for the sync worker.
                     
                     **Behavior:**
-                    - Downloads latest data from all Airtable tables
+                    - Returns straight away with the queued job (see /sync/jobs)
+                    - The worker downloads the latest data from all Airtable tables
                     - Overwrites local database tables
-                    - Returns update status for each table
                     """)
-        @sync_ns.response(200, 'All tables updated successfully')
-        @sync_ns.response(500, 'Some or all updates failed')
+        @sync_ns.response(202, 'Sync job queued')
         def post(self):
-            """Update all tables from Airtable"""
+            """Queue a sync of all tables from Airtable"""
             return call_view_function('update_server_from_airtable')
     
     @sync_ns.route('/update-table-from-airtable')
@@ -554,24 +602,24 @@ def setup_api_docs(app):
         @sync_ns.expect(table_update_model, validate=True)
         @sync_ns.doc('update_from_airtable_table',
                     description="""
-                    Update specific table from Airtable.
+                    Queue a sync of a specific table from Airtable for the sync worker.
                     
                     **Options:**
                     - force_delete: Whether to delete and recreate table (default: true)
                     - Can also use query parameters instead of JSON body
                     """)
-        @sync_ns.response(200, 'Table updated successfully')
+        @sync_ns.response(202, 'Sync job queued')
+        @sync_ns.response(400, 'No table name given')
         @sync_ns.response(404, 'Table not found')
-        @sync_ns.response(500, 'Update failed')
         def post(self):
-            """Update specific table from Airtable"""
+            """Queue a sync of a specific table from Airtable"""
             return call_view_function('update_table_from_airtable')
     
     @sync_ns.route('/upload-to-airtable')
     class UploadToAirtableDoc(Resource):
         @sync_ns.doc('upload_to_airtable',
                     description="""
-                    Upload modified tables back to Airtable.
+                    Queue an upload of modified tables back to Airtable for the sync worker.
                     
                     **Query Parameters:**
                     - force_upload: Upload all tables regardless of modification status
@@ -581,11 +629,10 @@ def setup_api_docs(app):
                         'force_upload': {'description': 'Force upload all tables', 'type': 'boolean'},
                         'table_name': {'description': 'Specific table to upload', 'type': 'string'}
                     })
-        @sync_ns.response(200, 'Upload successful')
-        @sync_ns.response(207, 'Partial success - some uploads failed')
-        @sync_ns.response(500, 'Upload failed')
+        @sync_ns.response(202, 'Upload job queued')
+        @sync_ns.response(404, 'Table not found')
         def post(self):
-            """Upload all modified tables back to Airtable"""
+            """Queue an upload of modified tables to Airtable"""
             return call_view_function('upload_to_airtable')
     
     @sync_ns.route('/get-modified-tables')
@@ -597,4 +644,149 @@ def setup_api_docs(app):
             """Get a list of tables that have been modified"""
             return call_view_function('get_modified_tables')
     
-    return api
\ No newline at end of file
+    @sync_ns.route('/airtable-metrics')
+    class AirtableMetricsDoc(Resource):
+        @sync_ns.doc('get_airtable_metrics',
+                    description="""
+                    Get metrics for calls made to Airtable, grouped by operation.
+                    
+                    **Includes:**
+                    - Call, error and retry counts
+                    - Throttled (429) responses
+                    - Average and max latency, and time spent waiting on the rate limiter
+                    """)
+        @sync_ns.response(200, 'Airtable metrics retrieved')
+        def get(self):
+            """Get Airtable call metrics"""
+            return call_view_function('get_airtable_metrics')
+    
+    sync_job_model = api.model('SyncJobRequest', {
+        'job_type': fields.String(required=True, description='"sync" (Airtable to database) or "upload" (database to Airtable)', example='upload'),
+        'table_name': fields.String(description='Table to work on, defaults to every table', example='craffft_students'),
+        'force_upload': fields.Boolean(description='Upload jobs only: replace the table(s) in full', example=False),
+        'force_delete': fields.Boolean(description='Sync jobs for one table only: delete and recreate the table', example=True)
+    })
+    
+    @sync_ns.route('/jobs')
+    class SyncJobsDoc(Resource):
+        @sync_ns.expect(sync_job_model, validate=True)
+        @sync_ns.doc('queue_sync_job',
+                    description="""
+                    Queue a sync or upload job for the sync worker process.
+                    
+                    The request returns straight away; poll the job to see its status
+                    (pending, running, done or failed) and result. An identical job that
+                    is still pending is returned instead of queueing a duplicate.
+                    """)
+        @sync_ns.response(202, 'Job queued')
+        @sync_ns.response(400, 'Invalid job type')
+        @sync_ns.response(404, 'Table not found')
+        def post(self):
+            """Queue a sync or upload job"""
+            return call_view_function('queue_sync_job')
+        
+        @sync_ns.doc('get_sync_jobs',
+                    description="Get the most recent sync jobs, newest first",
+                    params={'limit': {'description': 'Maximum number of jobs to return (default 20)', 'type': 'integer'}})
+        @sync_ns.response(200, 'Jobs retrieved')
+        def get(self):
+            """Get recent sync jobs"""
+            return call_view_function('get_sync_jobs')
+    
+    @sync_ns.route('/jobs/<int:job_id>')
+    class SyncJobDoc(Resource):
+        @sync_ns.doc('get_sync_job', description="Get the status and result of a queued sync job")
+        @sync_ns.response(200, 'Job retrieved')
+        @sync_ns.response(404, 'Job not found')
+        def get(self, job_id):
+            """Get a sync job"""
+            return call_view_function('get_sync_job', job_id=job_id)
+    
+    @sync_ns.route('/airtable-webhook')
+    class AirtableWebhookDoc(Resource):
+        @sync_ns.doc('receive_airtable_webhook',
+                    description="""
+                    Notification URL for an Airtable webhook.
+                    
+                    Airtable's ping carries no record data, so this queues a job for the sync worker,
+                    which reads the webhook's payloads from the last stored cursor and fetches and
+                    upserts only the changed records (deleted records are removed).
+                    
+                    **Security:** the X-Airtable-Content-MAC header must be a valid HMAC-SHA256 of the
+                    body under AIRTABLE_WEBHOOK_MAC_SECRET. Without a secret, notifications are rejected
+                    unless AIRTABLE_WEBHOOK_ALLOW_UNSIGNED is set (local development only).
+                    """)
+        @sync_ns.response(200, 'Notification accepted and job queued')
+        @sync_ns.response(400, 'Notification has no webhook id')
+        @sync_ns.response(401, 'Invalid webhook signature')
+        @sync_ns.response(404, 'Unknown webhook')
+        def post(self):
+            """Receive an Airtable webhook notification"""
+            return call_view_function('receive_airtable_webhook')
+    
+    @sync_ns.route('/scheduler')
+    class SchedulerStatusDoc(Resource):
+        @sync_ns.doc('get_scheduler_status',
+                    description="""
+                    Get the leases sync workers take before running scheduled jobs (startup sync, daily upload).
+                    
+                    **Includes per job:**
+                    - Current lease holder and expiry (holder is null when the lease is free)
+                    - Which worker ran it last, when, and whether it succeeded
+                    
+                    **Adaptive sync, per table:**
+                    - Smoothed local change rate (changes/hour)
+                    - Current upload and download intervals, and when each last ran
+                    """)
+        @sync_ns.response(200, 'Scheduler status retrieved')
+        def get(self):
+            """Get scheduled job leases and last-run status"""
+            return call_view_function('get_scheduler_status')
+    
+    @sync_ns.route('/healthz')
+    class HealthzDoc(Resource):
+        @sync_ns.doc('healthz', description="Liveness check: returns 200 whenever the process is serving requests")
+        @sync_ns.response(200, 'Process is up')
+        def get(self):
+            """Liveness check"""
+            return call_view_function('healthz')
+    
+    @sync_ns.route('/readyz')
+    class ReadyzDoc(Resource):
+        @sync_ns.doc('readyz',
+                    description="""
+                    Readiness check. When the database starts empty, the initial sync from Airtable runs
+                    in the background (critical tables first) and data endpoints answer 503 with a
+                    Retry-After header until the tables they read are loaded. Tables that fail are retried
+                    in the background with backoff and don't hold requests off.
+                    
+                    **Includes:**
+                    - Whether the critical tables are loaded, and whether the sync is still running
+                    - The tables still loading and the tables that failed to load
+                    - Per table: pending / loading / loaded / failed, attempts, start and finish times and the sync result
+                    """)
+        @sync_ns.response(200, 'Critical tables loaded')
+        @sync_ns.response(503, 'Still loading (retry after the Retry-After header), or a critical table failed to load')
+        def get(self):
+            """Readiness check with initial sync progress"""
+            return call_view_function('readyz')
+    
+    @sync_ns.route('/metrics')
+    class MetricsDoc(Resource):
+        @sync_ns.doc('metrics',
+                    description="""
+                    Request metrics for the worker process that answers, in the Prometheus text format.
+                    
+                    **Per blueprint (core, quests, admin), route and method:**
+                    - http_request_duration_seconds: latency histogram
+                    - http_request_db_queries: database statements per request
+                    - http_request_db_seconds_total: time spent in database statements
+                    - http_response_size_bytes: response size histogram
+                    - http_requests_total: requests by status code
+                    """)
+        @sync_ns.response(200, 'Metrics in Prometheus text format')
+        def get(self):
+            """Prometheus request metrics"""
+            return call_view_function('metrics')
+    
+    return api
@@ -0,0 +1,526 @@
+"""
+Local stand-in for the Airtable REST API, for offline sync tests and benchmarks.
+
+Implements the parts of the API the backend uses:
+- List records with pageSize/offset pagination, fields and simple filterByFormula
+  (the {field}='value' / {field}&''='value' conditions, optionally inside OR()/AND())
+- Create, update and delete records, singly or in batches of up to 10
+- The meta API table listing (GET /v0/meta/bases/<base_id>/tables)
+- Webhooks: every record change is recorded as a webhook payload, listed with
+  GET /v0/bases/<base_id>/webhooks/<webhook_id>/payloads?cursor=N, and a signed
+  notification ping is POSTed to the webhook's notification URL (the fake webhook sender)
+- Per-base rate limiting with 429 responses, and configurable per-request latency
+
+Usage:
+    python fake_airtable.py --port 8765 --latency 0.05
+    python fake_airtable.py --webhook-url http://127.0.0.1:5000/sync/airtable-webhook
+    AIRTABLE_API_URL=http://127.0.0.1:8765/v0 python app.py
+
+Or from Python:
+    with FakeAirtableServer(latency=0.01) as server:
+        server.add_table("craffft_students", [{"record_id": "rec1", "first_name": "Ada"}])
+        client = AirtableClient("key", server.base_id, api_url=server.api_url)
+"""
+
+import argparse
+import base64
+import hashlib
+import hmac
+import json
+import re
+import secrets
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional
+from urllib.parse import parse_qs, unquote, urlparse
+import requests
+
+MAX_PAGE_SIZE = 100
+MAX_RECORDS_PER_REQUEST = 10
+MAX_WEBHOOK_PAYLOADS_PER_REQUEST = 50
+
+# Matches {field}='value', {field}&''='value' and RECORD_ID()='value', with \\ and \' escapes in the value
+CONDITION_PATTERN = re.compile(r"(?:\{([^}]*)\}|(RECORD_ID\(\)))(?:&'')?\s*=\s*'((?:[^'\\]|\\.)*)'")
+
+
+class FakeAirtableServer:
+    """
+    In-memory Airtable API served over HTTP on localhost.
+    All state is guarded by one lock, so results are deterministic for a given sequence of calls.
+    """
+
+    def __init__(self, base_id: str = "appFakeBase", host: str = "127.0.0.1", port: int = 0,
+                 latency: float = 0.0, requests_per_second: Optional[float] = None, retry_after: float = 1.0):
+        """
+        Args:
+            base_id: Base ID the server answers for
+            host: Interface to bind to
+            port: Port to bind to (0 picks a free port)
+            latency: Seconds to wait before answering each request
+            requests_per_second: Requests allowed per second before answering 429 (None disables throttling)
+            retry_after: Value of the Retry-After header sent with 429 responses
+        """
+        self.base_id = base_id
+        self.latency = latency
+        self.requests_per_second = requests_per_second
+        self.retry_after = retry_after
+        self.tables: Dict[str, Dict[str, dict]] = {}
+        self.table_ids: Dict[str, str] = {}
+        self.webhooks: Dict[str, dict] = {}
+        self._transaction_number = 0
+        self.request_counts: Dict[str, int] = {}
+        self._injected_errors: deque = deque()
+        self._recent_requests: deque = deque()
+        self._next_id = 1
+        self._lock = threading.Lock()
+
+        handler = type('FakeAirtableHandler', (_FakeAirtableHandler,), {'fake': self})
+        self.httpd = ThreadingHTTPServer((host, port), handler)
+        self.httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def api_url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}/v0"
+
+    def start(self) -> 'FakeAirtableServer':
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        if self._thread:
+            self._thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    # --- Test helpers ---
+
+    def add_table(self, table_name: str, records: Optional[List[dict]] = None) -> List[str]:
+        """
+        Create (or extend) a table with the given field dicts.
+
+        Returns:
+            The Airtable record ids assigned to the records
+        """
+        with self._lock:
+            table = self._table(table_name)
+            created = [self._create_record(table, fields) for fields in records or []]
+            self._record_webhook_change(table_name, created=created)
+        self._send_notifications()
+        return [record['id'] for record in created]
+
+    def update_record(self, table_name: str, record_id: str, fields: dict):
+        """
+        Change a record's fields as if edited in the Airtable UI (None clears a field).
+        """
+        with self._lock:
+            record = self.tables[table_name][record_id]
+            record['fields'] = {k: v for k, v in dict(record['fields'], **fields).items() if v is not None}
+            self._record_webhook_change(table_name, changed=[record])
+        self._send_notifications()
+
+    def delete_record(self, table_name: str, record_id: str):
+        """
+        Delete a record as if removed in the Airtable UI.
+        """
+        with self._lock:
+            del self.tables[table_name][record_id]
+            self._record_webhook_change(table_name, destroyed=[record_id])
+        self._send_notifications()
+
+    def create_webhook(self, notification_url: Optional[str] = None) -> dict:
+        """
+        Register a webhook that records a payload for every record change from now on.
+        If notification_url is set, a signed notification ping is POSTed to it after each change.
+        
+        Returns:
+            Dictionary with the webhook "id" and its "macSecretBase64", like Airtable's create webhook response
+        """
+        with self._lock:
+            webhook_id = f"ach{len(self.webhooks) + 1:014d}"
+            mac_secret = base64.b64encode(secrets.token_bytes(32)).decode()
+            self.webhooks[webhook_id] = {
+                "mac_secret": mac_secret,
+                "notification_url": notification_url,
+                "payloads": [],
+                "notified_up_to": 0
+            }
+            return {"id": webhook_id, "macSecretBase64": mac_secret}
+
+    def notification_request(self, webhook_id: str):
+        """
+        Build the notification ping Airtable sends for a webhook, signed with its MAC secret.
+        
+        Returns:
+            (body bytes, headers dict) tuple, ready to POST to the notification URL
+        """
+        body = json.dumps({
+            "base": {"id": self.base_id},
+            "webhook": {"id": webhook_id},
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S.000Z", time.gmtime())
+        }).encode()
+        mac_secret = base64.b64decode(self.webhooks[webhook_id]["mac_secret"])
+        signature = hmac.new(mac_secret, body, hashlib.sha256).hexdigest()
+        return body, {"Content-Type": "application/json", "X-Airtable-Content-MAC": f"hmac-sha256={signature}"}
+
+    def send_notification(self, webhook_id: str) -> Optional[int]:
+        """
+        POST a notification ping to the webhook's notification URL.
+        
+        Returns:
+            The receiver's status code, or None if it couldn't be reached
+        """
+        url = self.webhooks[webhook_id]["notification_url"]
+        body, headers = self.notification_request(webhook_id)
+        try:
+            return requests.post(url, data=body, headers=headers, timeout=10).status_code
+        except requests.RequestException as e:
+            print(f"Fake Airtable: webhook notification to {url} failed: {e}")
+            return None
+
+    def get_records(self, table_name: str) -> List[dict]:
+        """
+        Get the field dicts currently stored for a table.
+        """
+        with self._lock:
+            return [dict(record['fields']) for record in self.tables.get(table_name, {}).values()]
+
+    def inject_errors(self, status: int, count: int = 1):
+        """
+        Answer the next `count` requests with `status` (e.g. 429 or 503) before handling any more.
+        """
+        with self._lock:
+            self._injected_errors.extend([status] * count)
+
+    def reset_counts(self):
+        with self._lock:
+            self.request_counts.clear()
+
+    # --- Webhooks ---
+
+    def _table(self, table_name: str) -> Dict[str, dict]:
+        if table_name not in self.tables:
+            self.tables[table_name] = {}
+            self.table_ids[table_name] = f"tbl{len(self.table_ids) + 1:014d}"
+        return self.tables[table_name]
+
+    def _record_webhook_change(self, table_name: str, created=(), changed=(), destroyed=()):
+        """
+        Append a payload describing one change transaction to every webhook.
+        Field names stand in for Airtable's field ids in cellValuesByFieldId.
+        """
+        if not self.webhooks or not (created or changed or destroyed):
+            return
+        self._transaction_number += 1
+        table_changes = {}
+        if created:
+            table_changes["createdRecordsById"] = {
+                record['id']: {"createdTime": record['createdTime'], "cellValuesByFieldId": dict(record['fields'])}
+                for record in created
+            }
+        if changed:
+            table_changes["changedRecordsById"] = {
+                record['id']: {"current": {"cellValuesByFieldId": dict(record['fields'])}}
+                for record in changed
+            }
+        if destroyed:
+            table_changes["destroyedRecordIds"] = list(destroyed)
+        payload = {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S.000Z", time.gmtime()),
+            "baseTransactionNumber": self._transaction_number,
+            "payloadFormat": "v0",
+            "actionMetadata": {"source": "client"},
+            "changedTablesById": {self.table_ids[table_name]: table_changes}
+        }
+        for webhook in self.webhooks.values():
+            webhook["payloads"].append(payload)
+
+    def _send_notifications(self):
+        # Ping each webhook with new payloads from a background thread, like Airtable does
+        with self._lock:
+            due = []
+            for webhook_id, webhook in self.webhooks.items():
+                if webhook["notification_url"] and webhook["notified_up_to"] < len(webhook["payloads"]):
+                    webhook["notified_up_to"] = len(webhook["payloads"])
+                    due.append(webhook_id)
+        for webhook_id in due:
+            threading.Thread(target=self.send_notification, args=(webhook_id,), daemon=True).start()
+
+    def _list_webhook_payloads(self, webhook_id: str, query: Dict[str, List[str]]):
+        webhook = self.webhooks.get(webhook_id)
+        if webhook is None:
+            return 404, _error("NOT_FOUND", f"Unknown webhook {webhook_id}"), {}
+        # Cursors start at 1 and point at the next payload to read
+        cursor = max(1, int((query.get('cursor') or ['1'])[0]))
+        limit = min(int((query.get('limit') or [MAX_WEBHOOK_PAYLOADS_PER_REQUEST])[0]), MAX_WEBHOOK_PAYLOADS_PER_REQUEST)
+        payloads = webhook["payloads"][cursor - 1:cursor - 1 + limit]
+        next_cursor = cursor + len(payloads)
+        return 200, {
+            "payloads": payloads,
+            "cursor": next_cursor,
+            "mightHaveMore": next_cursor <= len(webhook["payloads"])
+        }, {}
+
+    # --- Request handling ---
+
+    def _create_record(self, table: Dict[str, dict], fields: dict) -> dict:
+        record_id = f"rec{self._next_id:014d}"
+        self._next_id += 1
+        record = {
+            "id": record_id,
+            "createdTime": time.strftime("%Y-%m-%dT%H:%M:%S.000Z", time.gmtime()),
+            "fields": {k: v for k, v in fields.items() if v is not None}
+        }
+        table[record_id] = record
+        return record
+
+    def _throttle_status(self) -> Optional[int]:
+        if self._injected_errors:
+            return self._injected_errors.popleft()
+        if self.requests_per_second:
+            now = time.monotonic()
+            while self._recent_requests and now - self._recent_requests[0] >= 1.0:
+                self._recent_requests.popleft()
+            if len(self._recent_requests) >= self.requests_per_second:
+                return 429
+            self._recent_requests.append(now)
+        return None
+
+    def handle(self, method: str, path: str, query: Dict[str, List[str]], body: Optional[dict]):
+        """
+        Handle one API request.
+
+        Returns:
+            (status, payload, headers) tuple
+        """
+        if self.latency:
+            time.sleep(self.latency)
+
+        parts = [unquote(part) for part in path.strip('/').split('/')]
+        with self._lock:
+            response = self._handle_locked(method, parts, query, body)
+        self._send_notifications()
+        return response
+
+    def _handle_locked(self, method: str, parts: List[str], query: Dict[str, List[str]], body: Optional[dict]):
+        # Called with self._lock held
+        key = f"{method} {'/'.join(parts[:2] if parts[1:2] == ['meta'] else parts[:3])}"
+        self.request_counts[key] = self.request_counts.get(key, 0) + 1
+
+        status = self._throttle_status()
+        if status == 429:
+            return 429, _error("RATE_LIMIT_REACHED", "Rate limit exceeded"), {"Retry-After": str(self.retry_after)}
+        if status:
+            return status, _error("SERVER_ERROR", "Injected error"), {}
+
+        if len(parts) < 3 or parts[0] != 'v0':
+            return 404, _error("NOT_FOUND", "Unknown path"), {}
+        if parts[1] == 'meta':
+            return self._list_tables(parts)
+        if parts[1] == 'bases':
+            if len(parts) == 6 and parts[2] == self.base_id and parts[3] == 'webhooks' and parts[5] == 'payloads' and method == 'GET':
+                return self._list_webhook_payloads(parts[4], query)
+            return 404, _error("NOT_FOUND", "Unknown path"), {}
+        if parts[1] != self.base_id:
+            return 404, _error("NOT_FOUND", f"Unknown base {parts[1]}"), {}
+
+        table = self.tables.get(parts[2])
+        if table is None:
+            return 404, _error("TABLE_NOT_FOUND", f"Unknown table {parts[2]}"), {}
+        record_id = parts[3] if len(parts) > 3 else None
+
+        if method == 'GET':
+            if record_id:
+                record = table.get(record_id)
+                return (200, record, {}) if record else (404, _error("NOT_FOUND", record_id), {})
+            return self._list_records(table, query)
+        if method == 'POST':
+            return self._create_records(parts[2], table, body or {})
+        if method in ('PATCH', 'PUT'):
+            return self._update_records(parts[2], table, body or {}, record_id, replace=(method == 'PUT'))
+        if method == 'DELETE':
+            return self._delete_records(parts[2], table, query, record_id)
+        return 405, _error("METHOD_NOT_ALLOWED", method), {}
+
+    def _list_tables(self, parts: List[str]):
+        if parts[2:3] != ['bases'] or len(parts) < 5 or parts[3] != self.base_id:
+            return 404, _error("NOT_FOUND", "Unknown base"), {}
+        tables = []
+        for table_name, records in self.tables.items():
+            field_names = []
+            for record in records.values():
+                field_names.extend(name for name in record['fields'] if name not in field_names)
+            tables.append({
+                "id": self.table_ids[table_name],
+                "name": table_name,
+                "fields": [{"name": name, "type": "singleLineText"} for name in field_names]
+            })
+        return 200, {"tables": tables}, {}
+
+    def _list_records(self, table: Dict[str, dict], query: Dict[str, List[str]]):
+        records = list(table.values())
+        formula = (query.get('filterByFormula') or [None])[0]
+        if formula:
+            try:
+                records = [record for record in records if _matches_formula(record, formula)]
+            except ValueError as e:
+                return 422, _error("INVALID_FILTER_BY_FORMULA", str(e)), {}
+        max_records = int((query.get('maxRecords') or [0])[0])
+        if max_records:
+            records = records[:max_records]
+
+        page_size = min(int((query.get('pageSize') or [MAX_PAGE_SIZE])[0]), MAX_PAGE_SIZE)
+        start = int((query.get('offset') or ['0'])[0] or 0)
+        page = records[start:start + page_size]
+
+        fields = query.get('fields') or query.get('fields[]')
+        if fields:
+            page = [dict(record, fields={k: v for k, v in record['fields'].items() if k in fields}) for record in page]
+
+        payload = {"records": page}
+        if start + page_size < len(records):
+            payload["offset"] = str(start + page_size)
+        return 200, payload, {}
+
+    def _create_records(self, table_name: str, table: Dict[str, dict], body: dict):
+        if 'records' not in body:
+            record = self._create_record(table, body.get('fields', {}))
+            self._record_webhook_change(table_name, created=[record])
+            return 200, record, {}
+        if len(body['records']) > MAX_RECORDS_PER_REQUEST:
+            return 422, _error("INVALID_RECORDS", "Too many records"), {}
+        created = [self._create_record(table, record.get('fields', {})) for record in body['records']]
+        self._record_webhook_change(table_name, created=created)
+        return 200, {"records": created}, {}
+
+    def _update_records(self, table_name: str, table: Dict[str, dict], body: dict, record_id: Optional[str], replace: bool):
+        updates = [{"id": record_id, "fields": body.get('fields', {})}] if record_id else body.get('records', [])
+        if len(updates) > MAX_RECORDS_PER_REQUEST:
+            return 422, _error("INVALID_RECORDS", "Too many records"), {}
+        missing = [update.get('id') for update in updates if update.get('id') not in table]
+        if missing:
+            return 404, _error("NOT_FOUND", f"Records not found: {missing}"), {}
+
+        updated = []
+        for update in updates:
+            record = table[update['id']]
+            fields = {} if replace else dict(record['fields'])
+            fields.update(update.get('fields', {}))
+            record['fields'] = {k: v for k, v in fields.items() if v is not None}
+            updated.append(record)
+        self._record_webhook_change(table_name, changed=updated)
+        return 200, (updated[0] if record_id else {"records": updated}), {}
+
+    def _delete_records(self, table_name: str, table: Dict[str, dict], query: Dict[str, List[str]], record_id: Optional[str]):
+        record_ids = [record_id] if record_id else (query.get('records') or query.get('records[]') or [])
+        if len(record_ids) > MAX_RECORDS_PER_REQUEST:
+            return 422, _error("INVALID_RECORDS", "Too many records"), {}
+        missing = [rid for rid in record_ids if rid not in table]
+        if missing:
+            return 404, _error("NOT_FOUND", f"Records not found: {missing}"), {}
+
+        deleted = [{"id": rid, "deleted": True} for rid in record_ids]
+        for rid in record_ids:
+            del table[rid]
+        self._record_webhook_change(table_name, destroyed=record_ids)
+        return 200, (deleted[0] if record_id else {"records": deleted}), {}
+
+
+class _FakeAirtableHandler(BaseHTTPRequestHandler):
+    fake: FakeAirtableServer = None
+
+    def _dispatch(self):
+        url = urlparse(self.path)
+        body = None
+        length = int(self.headers.get('Content-Length') or 0)
+        if length:
+            try:
+                body = json.loads(self.rfile.read(length))
+            except ValueError:
+                self._send(422, _error("INVALID_REQUEST_BODY", "Body is not JSON"), {})
+                return
+        status, payload, headers = self.fake.handle(self.command, url.path, parse_qs(url.query), body)
+        self._send(status, payload, headers)
+
+    def _send(self, status: int, payload: dict, headers: dict):
+        data = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    do_GET = do_POST = do_PATCH = do_PUT = do_DELETE = _dispatch
+
+    def log_message(self, format, *args):
+        # Keep test and benchmark output quiet
+        pass
+
+
+def _error(error_type: str, message: str) -> dict:
+    return {"error": {"type": error_type, "message": message}}
+
+
+def _matches_formula(record: dict, formula: str) -> bool:
+    """
+    Evaluate the formulas the sync code sends: field or RECORD_ID() equality
+    conditions, alone or inside AND()/OR(). Anything else raises ValueError,
+    so an unsupported formula can't silently match every record.
+    """
+    stripped = formula.strip()
+    inner = stripped
+    match = re.fullmatch(r"(?i)(AND|OR)\((.*)\)", stripped, re.DOTALL)
+    if match:
+        inner = match.group(2)
+    conditions = CONDITION_PATTERN.findall(inner)
+    if not conditions or CONDITION_PATTERN.sub('', inner).strip(', \t\n'):
+        raise ValueError(f"Unsupported formula: {formula}")
+    results = [
+        (record['id'] if record_id_function else _field_as_text(record['fields'].get(field))) == re.sub(r"\\(.)", r"\1", value)
+        for field, record_id_function, value in conditions
+    ]
+    return any(results) if formula.strip().upper().startswith('OR(') else all(results)
+
+
+def _field_as_text(value) -> str:
+    if value is None:
+        return ''
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run a local fake Airtable API server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--base-id", default="appFakeBase")
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds added to every request")
+    parser.add_argument("--rate-limit", type=float, default=5, help="Requests/sec before answering 429 (0 disables)")
+    parser.add_argument("--webhook-url", help="Create a webhook that sends notification pings to this URL")
+    args = parser.parse_args()
+
+    server = FakeAirtableServer(base_id=args.base_id, host=args.host, port=args.port,
+                                latency=args.latency, requests_per_second=args.rate_limit or None)
+    print(f"Fake Airtable serving base {args.base_id} at {server.api_url}")
+    print(f"Point the app at it with AIRTABLE_API_URL={server.api_url} AIRTABLE_BASE_ID={args.base_id}")
+    if args.webhook_url:
+        webhook = server.create_webhook(args.webhook_url)
+        print(f"Webhook notifications go to {args.webhook_url}; configure the app with "
+              f"AIRTABLE_WEBHOOK_ID={webhook['id']} AIRTABLE_WEBHOOK_MAC_SECRET={webhook['macSecretBase64']}")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        server.httpd.server_close()
@@ -0,0 +1,35 @@
+"""
+Gunicorn settings for the web process (Procfile: `web: gunicorn -c gunicorn.conf.py app:app`).
+
+The app is loaded once in the master (preload_app) and forked into the workers, so
+table catalog loading, the critical-table check and any background initial sync run
+once per dyno rather than once per worker. Each worker then resets everything that
+must not be shared across a fork (see app.reset_after_fork).
+
+Environment:
+    PORT                 Port to bind (set by Heroku, default 5000)
+    WEB_CONCURRENCY      Worker processes (set by Heroku from the dyno size, default 2)
+    GUNICORN_THREADS     Request threads per worker (default 4)
+    GUNICORN_TIMEOUT     Seconds before a silent worker is restarted (default 30)
+"""
+import os
+
+# The app imports the Airtable client lazily, possibly from a background thread. Import it
+# in the master up front so no worker is forked while that import is half done.
+import airtable_client  # noqa: F401
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '5000')}"
+worker_class = 'gthread'
+workers = int(os.environ.get('WEB_CONCURRENCY', '2'))
+threads = int(os.environ.get('GUNICORN_THREADS', '4'))
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', '30'))
+keepalive = 5
+preload_app = True
+accesslog = '-'
+
+
+def post_fork(server, worker):
+    # Imported here: with preload_app the module is already loaded in the master
+    import app
+    app.reset_after_fork()
+    server.log.info(f"Worker {worker.pid} reset database pool, Airtable clients and startup state after fork")
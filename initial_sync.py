@@ -0,0 +1,238 @@
+import os
+import socket
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+from utilities import load_env, critical_tables
+
+
+class InitialSync:
+    """
+    First sync of an empty database from Airtable, run in a background thread so the
+    web process can bind its port and answer health checks while tables load.
+
+    Critical tables are fetched first, then the rest, and each table's progress is
+    tracked (pending, loading, loaded or failed). Failed tables are retried with
+    exponential backoff; requests for them are served from whatever the database
+    has rather than held off, and a table loaded later by any sync (e.g. a queued
+    /sync/update-all job) counts as loaded again. The sync takes the same
+    'startup-sync' lease as the sync worker; if another process already holds it,
+    this one just waits for that process's tables to appear in the database.
+    Tables that aren't part of the sync (the database already had data) count as loaded.
+    """
+    LEASE_NAME = 'startup-sync'
+    # Don't start another initial sync if one started less than this many seconds ago (unless it failed)
+    MIN_INTERVAL = 10 * 60
+    # Seconds clients are told to wait before retrying while tables load
+    RETRY_AFTER_SECONDS = 5
+    # Seconds between checks while another process runs the sync
+    POLL_SECONDS = 2
+    # Failed tables are retried this many times, waiting RETRY_BASE_SECONDS, then twice as long each time
+    RETRY_ATTEMPTS = 5
+    RETRY_BASE_SECONDS = 5
+    RETRY_MAX_SECONDS = 300
+
+    def __init__(self, multi_manager):
+        self.multi_manager = multi_manager
+        self.storage = multi_manager.sqlite_storage
+        self.holder = f"{socket.gethostname()}:{os.getpid()}"
+        self.lease_seconds = float(load_env('SCHEDULER_LEASE_SECONDS', '3600'))
+        self._lock = threading.Lock()
+        self._tables: Dict[str, dict] = {}
+        self._thread: Optional[threading.Thread] = None
+        self.started_at: Optional[datetime] = None
+        self.finished_at: Optional[datetime] = None
+
+    # --- Progress ---
+
+    def _set(self, table_name: str, **values):
+        with self._lock:
+            self._tables.setdefault(table_name, {"status": "pending", "started_at": None, "finished_at": None,
+                                                 "result": None, "attempts": 0, "next_retry_at": None}).update(values)
+
+    def _ordered_tables(self) -> List[str]:
+        # Critical tables first, each table once
+        with self._lock:
+            attempted = set(self._tables)
+        pending = [name for name in self.multi_manager.get_available_tables() if name not in attempted]
+        return sorted(pending, key=lambda name: name not in critical_tables)
+
+    def unloaded_tables(self, table_names) -> List[str]:
+        """
+        Get which of table_names are part of the initial sync and not loaded yet (including failed ones).
+        """
+        with self._lock:
+            return [name for name in table_names if name in self._tables and self._tables[name]["status"] != "loaded"]
+
+    def loading_tables(self, table_names) -> List[str]:
+        """
+        Get which of table_names are still waiting for the initial sync (pending or loading).
+        Failed tables aren't included: requests for them shouldn't wait on a retry that may never succeed.
+        """
+        with self._lock:
+            return [name for name in table_names
+                    if name in self._tables and self._tables[name]["status"] in ("pending", "loading")]
+
+    def failed_tables(self) -> List[str]:
+        """
+        Get the tables whose last load failed, first checking whether another sync has loaded them since.
+        """
+        with self._lock:
+            failed = [name for name, state in self._tables.items() if state["status"] == "failed"]
+        still_failed = []
+        for table_name in failed:
+            if self._loaded_in_database(table_name):
+                self._set(table_name, status="loaded", finished_at=datetime.utcnow(), result="Loaded by a later sync")
+            else:
+                still_failed.append(table_name)
+        return still_failed
+
+    def _loaded_in_database(self, table_name: str) -> bool:
+        # A successful sync stores the table's content hash, including one that found no records in Airtable
+        return bool(self.storage.count_rows(table_name) or self.storage.get_content_hash(table_name))
+
+    def is_ready(self) -> bool:
+        """
+        True once every critical table is loaded (or the database already had data).
+        """
+        if not self.unloaded_tables(critical_tables):
+            return True
+        self.failed_tables()
+        return not self.unloaded_tables(critical_tables)
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def get_progress(self) -> dict:
+        """
+        Get the sync's overall state and each table's status, start and finish times and result.
+        """
+        # Checked first, since it notices failed tables that a later sync has loaded
+        ready = self.is_ready()
+        with self._lock:
+            tables = {name: dict(state) for name, state in self._tables.items()}
+        for state in tables.values():
+            for key in ("started_at", "finished_at", "next_retry_at"):
+                state[key] = state[key].isoformat() if state[key] else None
+        counts = {}
+        for state in tables.values():
+            counts[state["status"]] = counts.get(state["status"], 0) + 1
+        return {
+            "ready": ready,
+            "running": self.running,
+            "loading": self.loading_tables(tables),
+            "failed": [name for name, state in tables.items() if state["status"] == "failed"],
+            "started_at": self.started_at.isoformat() if self.started_at else None,
+            "finished_at": self.finished_at.isoformat() if self.finished_at else None,
+            "counts": counts,
+            "tables": tables
+        }
+
+    # --- Running ---
+
+    def start(self):
+        """
+        Start the initial sync in a daemon thread. Tables known now are marked pending
+        straight away, so requests for them wait for the sync.
+        """
+        for table_name in self._ordered_tables():
+            self._set(table_name)
+        self.started_at = datetime.utcnow()
+        self._thread = threading.Thread(target=self.run, name="initial-sync", daemon=True)
+        self._thread.start()
+
+    def reset_after_fork(self):
+        """
+        Called in a worker forked from a preloaded parent. The parent's sync thread and
+        lock don't exist here, so if the sync was still going, follow it from the
+        database instead (the parent keeps the lease, so this process only waits).
+        """
+        self._lock = threading.Lock()
+        self._thread = None
+        self.holder = f"{socket.gethostname()}:{os.getpid()}"
+        if self.started_at is None or self.finished_at is not None:
+            return
+        for table_name, state in self._tables.items():
+            if state["status"] == "loading":
+                state["status"] = "pending"
+        self._thread = threading.Thread(target=self.run, name="initial-sync", daemon=True)
+        self._thread.start()
+
+    def run(self):
+        if not self.storage.acquire_lease(self.LEASE_NAME, self.holder, self.lease_seconds, self.MIN_INTERVAL):
+            print("Initial sync is running in another process - waiting for its tables")
+            self._wait_for_other_process()
+            self.finished_at = datetime.utcnow()
+            return
+
+        results = {}
+        try:
+            self._load_pending_tables(results)
+            for attempt in range(self.RETRY_ATTEMPTS):
+                failed = self.failed_tables()
+                if not failed:
+                    break
+                delay = min(self.RETRY_MAX_SECONDS, self.RETRY_BASE_SECONDS * (2 ** attempt))
+                retry_at = datetime.utcnow() + timedelta(seconds=delay)
+                for table_name in failed:
+                    self._set(table_name, next_retry_at=retry_at)
+                print(f"Initial sync failed for {failed}, retrying in {delay}s")
+                time.sleep(delay)
+                for table_name in self.failed_tables():
+                    self._load_table(table_name, results)
+                # Tables discovered while waiting are picked up too
+                self._load_pending_tables(results)
+        except Exception as e:
+            self.storage.release_lease(self.LEASE_NAME, self.holder, False, f"Error: {str(e)}")
+            raise
+        finally:
+            self.finished_at = datetime.utcnow()
+
+        failed_critical = [name for name in self.failed_tables() if name in critical_tables]
+        if failed_critical:
+            print(f"Warning: Critical tables failed to update: {failed_critical}")
+        self.storage.release_lease(self.LEASE_NAME, self.holder, not failed_critical, results)
+        print("Initial sync results: ", results)
+
+    def _load_pending_tables(self, results: dict):
+        # Tables discovered while the sync runs are picked up too
+        while True:
+            with self._lock:
+                table_name = next((name for name, state in self._tables.items() if state["status"] == "pending"), None)
+            if table_name is None:
+                remaining = self._ordered_tables()
+                if not remaining:
+                    return
+                table_name = remaining[0]
+            self._load_table(table_name, results)
+
+    def _load_table(self, table_name: str, results: dict):
+        with self._lock:
+            attempts = self._tables.get(table_name, {}).get("attempts", 0) + 1
+        self._set(table_name, status="loading", started_at=datetime.utcnow(), attempts=attempts, next_retry_at=None)
+        try:
+            result = self.multi_manager.update_database_from_airtable(table_name) or "Failed to update"
+        except Exception as e:
+            result = f"Error: {str(e)}"
+        failed = str(result).startswith(("Error", "Failed"))
+        self._set(table_name, status="failed" if failed else "loaded", finished_at=datetime.utcnow(), result=result)
+        results[table_name] = result
+
+    def _wait_for_other_process(self):
+        while True:
+            with self._lock:
+                waiting = [name for name, state in self._tables.items() if state["status"] == "pending"]
+            for table_name in waiting:
+                if self.storage.count_rows(table_name):
+                    self._set(table_name, status="loaded", finished_at=datetime.utcnow(), result="Loaded by another process")
+            lease = next((lease for lease in self.storage.get_leases() if lease["name"] == self.LEASE_NAME), None)
+            if not waiting or not lease or lease["holder"] is None:
+                break
+            time.sleep(self.POLL_SECONDS)
+        # The other process is done: whatever is still missing failed there
+        for table_name in self.unloaded_tables(list(self._tables)):
+            loaded = bool(self.storage.count_rows(table_name))
+            self._set(table_name, status="loaded" if loaded else "failed", finished_at=datetime.utcnow(),
+                      result="Loaded by another process" if loaded else "Failed to load in another process")
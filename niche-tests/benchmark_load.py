@@ -0,0 +1,343 @@
+"""
+Load test harness for the web app.
+
+Starts the app locally (gunicorn with gunicorn.conf.py, or Flask's threaded dev
+server) against a throwaway SQLite database synced from the local fake Airtable
+server (fake_airtable.py) serving a synthetic dataset, then replays a mix of
+realistic traffic from concurrent clients:
+
+- dashboard:     a teacher's dashboard polling one class
+- step_update:   a student moving to another step of their quest
+- quest_browser: the quest browser page and the quest list it loads
+- add_students:  a teacher adding a few students to a class
+
+Each concurrency level runs for --duration seconds and reports throughput and
+p50/p95/p99 latency per endpoint. Results are written as JSON so runs on different
+commits can be compared with --compare.
+
+Usage (from the repository root):
+    python niche-tests/benchmark_load.py
+    python niche-tests/benchmark_load.py --concurrency 1,8,32 --duration 30 --students 10000
+    python niche-tests/benchmark_load.py --mix dashboard=80,step_update=20 --server flask
+    python niche-tests/benchmark_load.py --compare niche-tests/benchmark_results/<earlier>.json
+
+--url runs the traffic against an app that is already running instead (its
+database must hold the same synthetic dataset, e.g. from an earlier --keep run).
+Never point it at production: step updates and student adds write data.
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+from urllib.parse import quote
+
+import requests
+
+from benchmark_sync import REPO_ROOT, RESULTS_DIR, build_dataset, git_commit, summarize, timed
+from airtable_client import AirtableClient
+from airtable_multi_manager import AirtableMultiManager
+from fake_airtable import FakeAirtableServer
+from sqlite_storage import SQLiteStorage
+
+DEFAULT_MIX = "dashboard=50,step_update=30,quest_browser=15,add_students=5"
+
+
+class TrafficGenerator:
+    """
+    Builds the requests for each scenario from the synthetic dataset.
+    """
+
+    def __init__(self, dataset):
+        self.classes = sorted({student["current_class"] for student in dataset["craffft_students"]})
+        self.students = [(student["website_id"], student["current_quest"]) for student in dataset["craffft_students"]]
+        self.quest_steps = {quest["short_code"]: quest["steps"] for quest in dataset["craffft_quests"]}
+        self.teacher_ids = [teacher["website_user_id"] for teacher in dataset["craffft_teachers"]]
+        self._next_website_id = 10_000_000
+        self._lock = threading.Lock()
+
+    def _new_website_id(self):
+        with self._lock:
+            self._next_website_id += 1
+            return self._next_website_id
+
+    def requests_for(self, scenario, rng):
+        """
+        Get the (endpoint, method, path, json body) requests one run of a scenario sends, in order.
+        """
+        if scenario == "dashboard":
+            return [("dashboard", "GET", f"/students/dashboard/{quote(rng.choice(self.classes), safe='')}", None)]
+        if scenario == "step_update":
+            website_id, quest = rng.choice(self.students)
+            # Stay off the last step so students don't complete (and leave) their quest
+            step = rng.choice(self.quest_steps[quest][:-1] or self.quest_steps[quest])
+            return [("step_update", "GET", f"/students/update-and-check-quest?websiteId={website_id}&current-step={quote(step)}", None)]
+        if scenario == "quest_browser":
+            return [("quest_browser_page", "GET", "/quest-browser", None),
+                    ("quest_list", "GET", "/api/quests", None)]
+        if scenario == "add_students":
+            body = {
+                "teacher_website_id": rng.choice(self.teacher_ids),
+                "students": [{
+                    "first_name": "Load",
+                    "last_name": f"Test{i}",
+                    "website_id": self._new_website_id(),
+                    "current_class": rng.randint(1, 4)
+                } for i in range(rng.randint(1, 3))]
+            }
+            return [("add_students", "POST", "/students/add", body)]
+        raise ValueError(f"Unknown scenario: {scenario}")
+
+
+def parse_mix(mix):
+    """
+    Parse "name=weight,..." into a dictionary of scenario -> weight.
+    """
+    weights = {}
+    for part in mix.split(","):
+        if part.strip():
+            name, _, weight = part.partition("=")
+            weights[name.strip()] = float(weight or 1)
+    return weights
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_app(args, work_dir, env, port):
+    """
+    Start the app in work_dir and wait until /readyz answers 200.
+
+    Returns:
+        The server process
+    """
+    env = dict(env, PORT=str(port), WEB_CONCURRENCY=str(args.workers), GUNICORN_THREADS=str(args.threads))
+    if args.server == "gunicorn":
+        command = [sys.executable, "-m", "gunicorn", "-c", os.path.join(REPO_ROOT, "gunicorn.conf.py"), "app:app"]
+    else:
+        command = [sys.executable, "-c", f"from app import app; app.run(port={port}, threaded=True)"]
+    log = open(os.path.join(work_dir, "server.log"), "w")
+    process = subprocess.Popen(command, cwd=work_dir, env=env, stdout=log, stderr=subprocess.STDOUT)
+    deadline = time.monotonic() + args.startup_timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            break
+        try:
+            if requests.get(f"http://127.0.0.1:{port}/readyz", timeout=1).status_code == 200:
+                return process
+        except requests.RequestException:
+            pass
+        time.sleep(0.2)
+    process.kill()
+    with open(os.path.join(work_dir, "server.log")) as f:
+        raise RuntimeError(f"App did not become ready:\n{f.read()[-3000:]}")
+
+
+def run_level(base_url, generator, weights, concurrency, duration, seed):
+    """
+    Run the traffic mix from `concurrency` clients for `duration` seconds.
+
+    Returns:
+        Dictionary with the level's wall time, totals and per-endpoint summaries
+    """
+    names, scenario_weights = zip(*weights.items())
+    samples = {}
+    lock = threading.Lock()
+    deadline = time.monotonic() + duration
+
+    def client(index):
+        rng = random.Random(seed * 1000 + index)
+        session = requests.Session()
+        local = []
+        while time.monotonic() < deadline:
+            scenario = rng.choices(names, scenario_weights)[0]
+            for endpoint, method, path, body in generator.requests_for(scenario, rng):
+                start = time.perf_counter()
+                try:
+                    status = session.request(method, base_url + path, json=body, timeout=60).status_code
+                except requests.RequestException:
+                    status = None
+                local.append((endpoint, time.perf_counter() - start, status))
+        with lock:
+            for endpoint, elapsed, status in local:
+                samples.setdefault(endpoint, []).append((elapsed, status))
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=client, args=(i,)) for i in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall = time.perf_counter() - started
+
+    endpoints = {}
+    for endpoint, results in sorted(samples.items()):
+        statuses = {}
+        for _, status in results:
+            statuses[str(status)] = statuses.get(str(status), 0) + 1
+        errors = sum(1 for _, status in results if status is None or status >= 400)
+        summary = summarize([elapsed for elapsed, _ in results], {
+            "requests": len(results),
+            "errors": errors,
+            "throughput_rps": round(len(results) / wall, 1),
+            "statuses": statuses
+        })
+        # Time summed across concurrent clients isn't meaningful here; throughput_rps is
+        for key in ("seconds", "operations", "ops_per_second"):
+            summary.pop(key)
+        endpoints[endpoint] = summary
+    total = sum(summary["requests"] for summary in endpoints.values())
+    return {
+        "concurrency": concurrency,
+        "wall_seconds": round(wall, 3),
+        "requests": total,
+        "errors": sum(summary["errors"] for summary in endpoints.values()),
+        "throughput_rps": round(total / wall, 1),
+        "endpoints": endpoints
+    }
+
+
+def compare(current, baseline_path):
+    """
+    Print how each endpoint's p95 latency and throughput changed relative to an earlier results file.
+    """
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    print(f"\nComparison with {baseline.get('commit')} ({baseline_path}):")
+    for level, result in current["results"].items():
+        previous = baseline.get("results", {}).get(level)
+        if not previous:
+            print(f"  concurrency {level}: no baseline")
+            continue
+        for endpoint, summary in result["endpoints"].items():
+            before = previous["endpoints"].get(endpoint)
+            if not before:
+                continue
+            for key in ("p95_ms", "throughput_rps"):
+                if before.get(key):
+                    change = (summary[key] - before[key]) / before[key] * 100
+                    print(f"  c={level:<4} {endpoint:<20} {key:<15} {before[key]:>10} -> {summary[key]:<10} ({change:+.1f}%)")
+
+
+def print_level(result):
+    print(f"\nconcurrency {result['concurrency']}: {result['requests']} requests, "
+          f"{result['throughput_rps']} req/s, {result['errors']} errors")
+    for endpoint, summary in result["endpoints"].items():
+        print(f"  {endpoint:<20} {summary['requests']:>7} req {summary['throughput_rps']:>8} req/s  "
+              f"p50 {summary['p50_ms']:>8.1f}ms  p95 {summary['p95_ms']:>8.1f}ms  p99 {summary['p99_ms']:>8.1f}ms  "
+              f"errors {summary['errors']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test a locally started app with mixed traffic")
+    parser.add_argument("--students", type=int, default=1000, help="craffft_students rows in the synthetic dataset")
+    parser.add_argument("--concurrency", default="1,8,32", help="Comma-separated numbers of concurrent clients")
+    parser.add_argument("--duration", type=float, default=15, help="Seconds to run each concurrency level")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help=f"Scenario weights (default: {DEFAULT_MIX})")
+    parser.add_argument("--server", choices=["gunicorn", "flask"], default="gunicorn", help="How to serve the app")
+    parser.add_argument("--workers", type=int, default=2, help="gunicorn worker processes")
+    parser.add_argument("--threads", type=int, default=4, help="gunicorn threads per worker")
+    parser.add_argument("--startup-timeout", type=float, default=60, help="Seconds to wait for the app to become ready")
+    parser.add_argument("--url", help="Send traffic to an already running app instead of starting one")
+    parser.add_argument("--keep", help="Keep the synthetic database in this directory instead of a temporary one")
+    parser.add_argument("--seed", type=int, default=42, help="Random seed for the data and the traffic")
+    parser.add_argument("--output", help="Results file (default: niche-tests/benchmark_results/load-<commit>-<time>.json)")
+    parser.add_argument("--compare", help="Earlier results file to compare against")
+    args = parser.parse_args()
+
+    weights = parse_mix(args.mix)
+    levels = [int(level) for level in args.concurrency.split(",") if level.strip()]
+    dataset = build_dataset(args.students, seed=args.seed)
+    generator = TrafficGenerator(dataset)
+    for scenario in weights:
+        generator.requests_for(scenario, random.Random(args.seed))
+
+    results = {}
+    with FakeAirtableServer() as server, tempfile.TemporaryDirectory() as temp_dir:
+        work_dir = args.keep or temp_dir
+        process = None
+        try:
+            if args.url:
+                base_url = args.url.rstrip("/")
+            else:
+                for table_name, records in dataset.items():
+                    server.add_table(table_name, records)
+                env = dict(os.environ,
+                           PYTHONPATH=REPO_ROOT + os.pathsep + os.environ.get("PYTHONPATH", ""),
+                           ENVIRONMENT_MODE="Development",
+                           AIRTABLE_API_URL=server.api_url,
+                           AIRTABLE_BASE_ID=server.base_id,
+                           AIRTABLE_API_KEY="benchmark_key")
+                env.pop("DATABASE_URL", None)
+
+                # Sync the database and table catalog before starting, so the app starts ready
+                sqlite_store, _ = timed(SQLiteStorage, db_path=os.path.join(work_dir, "data", "airtable_data.db"))
+                client = AirtableClient("benchmark_key", server.base_id, requests_per_second=1000, api_url=server.api_url)
+                multi_manager = AirtableMultiManager("benchmark_key", server.base_id, table_names=[],
+                                                     sqlite_storage=sqlite_store, airtable_client=client)
+                timed(multi_manager.load_table_catalog, background_refresh=False)
+                _, sync_seconds = timed(multi_manager.update_all_tables)
+                sqlite_store.engine.dispose()
+                print(f"Synced {args.students} students in {sync_seconds:.2f}s")
+
+                port = free_port()
+                process = start_app(args, work_dir, env, port)
+                base_url = f"http://127.0.0.1:{port}"
+                print(f"App ({args.server}) ready at {base_url}")
+
+            # One request of each kind first, so the first level doesn't time cold caches
+            rng = random.Random(args.seed)
+            for scenario in weights:
+                for _, method, path, body in generator.requests_for(scenario, rng):
+                    requests.request(method, base_url + path, json=body, timeout=60)
+
+            for level in levels:
+                results[str(level)] = run_level(base_url, generator, weights, level, args.duration, args.seed)
+                print_level(results[str(level)])
+        finally:
+            if process is not None:
+                process.terminate()
+                process.wait(timeout=30)
+
+    commit = git_commit()
+    report = {
+        "commit": commit,
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "settings": {
+            "students": args.students,
+            "duration": args.duration,
+            "mix": weights,
+            "server": "external" if args.url else args.server,
+            "workers": args.workers,
+            "threads": args.threads,
+            "seed": args.seed
+        },
+        "results": results
+    }
+    output = args.output
+    if not output:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        output = os.path.join(RESULTS_DIR, f"load-{commit}-{datetime.now().strftime('%Y%m%d-%H%M%S')}.json")
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nResults written to {output}")
+
+    if args.compare:
+        compare(report, args.compare)
+
+
+if __name__ == "__main__":
+    main()
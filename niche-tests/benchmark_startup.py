@@ -0,0 +1,153 @@
+"""
+Cold-start benchmark for the web app.
+
+Starts a fresh Python process that imports app.py, the same work every gunicorn
+worker boot and test run does, with STARTUP_PROFILE on so each import and
+initialisation phase is timed (see startup_profile.py). Airtable is the local fake
+server (fake_airtable.py) serving a synthetic dataset, and the database is a
+throwaway SQLite file:
+
+- first_boot: empty database, no cached table catalog
+- restart:    database and catalog already populated, repeated --runs times
+
+Results are written as JSON so runs on different commits can be compared with --compare.
+
+Usage (from the repository root):
+    python niche-tests/benchmark_startup.py
+    python niche-tests/benchmark_startup.py --runs 20 --compare niche-tests/benchmark_results/<earlier>.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+from benchmark_sync import REPO_ROOT, RESULTS_DIR, build_dataset, git_commit, summarize, timed
+from airtable_client import AirtableClient
+from airtable_multi_manager import AirtableMultiManager
+from fake_airtable import FakeAirtableServer
+from sqlite_storage import SQLiteStorage
+
+
+def boot(work_dir, env):
+    """
+    Import app.py in a new process.
+
+    Returns:
+        Dictionary with the process's wall time and the app's own phase timings
+    """
+    profile_path = os.path.join(work_dir, "startup-profile.json")
+    env = dict(env, STARTUP_PROFILE="1", STARTUP_PROFILE_OUTPUT=profile_path)
+    start = time.perf_counter()
+    completed = subprocess.run([sys.executable, "-c", "import app"], cwd=work_dir, env=env,
+                               capture_output=True, text=True)
+    wall = time.perf_counter() - start
+    if completed.returncode != 0:
+        raise RuntimeError(f"Importing app failed:\n{completed.stderr}")
+    with open(profile_path) as f:
+        profile = json.load(f)
+    return {
+        "wall_seconds": round(wall, 4),
+        "app_seconds": profile["total_seconds"],
+        "phases": {entry["phase"]: entry["seconds"] for entry in profile["phases"]}
+    }
+
+
+def median(values):
+    ordered = sorted(values)
+    return ordered[len(ordered) // 2] if ordered else 0.0
+
+
+def compare(current, baseline_path):
+    """
+    Print how first boot and typical restart times changed relative to an earlier results file.
+    """
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    print(f"\nComparison with {baseline.get('commit')} ({baseline_path}):")
+    pairs = [
+        ("first boot", baseline["results"]["first_boot"]["wall_seconds"], current["results"]["first_boot"]["wall_seconds"]),
+        ("restart p50", baseline["results"]["restart"]["p50_ms"], current["results"]["restart"]["p50_ms"])
+    ]
+    for phase, after in current["results"]["restart"]["phases_p50"].items():
+        before = baseline["results"]["restart"].get("phases_p50", {}).get(phase)
+        if before is not None:
+            pairs.append((f"  {phase}", before, after))
+    for name, before, after in pairs:
+        if before:
+            print(f"  {name:<32} {before:>10} -> {after:<10} ({(after - before) / before * 100:+.1f}%)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark app.py cold start")
+    parser.add_argument("--students", type=int, default=1000, help="craffft_students rows in the synthetic dataset")
+    parser.add_argument("--runs", type=int, default=10, help="Number of restarts to time")
+    parser.add_argument("--seed", type=int, default=42, help="Random seed for the synthetic data")
+    parser.add_argument("--output", help="Results file (default: niche-tests/benchmark_results/startup-<commit>-<time>.json)")
+    parser.add_argument("--compare", help="Earlier results file to compare against")
+    args = parser.parse_args()
+
+    results = {}
+    with FakeAirtableServer() as server, tempfile.TemporaryDirectory() as work_dir:
+        for table_name, records in build_dataset(args.students, seed=args.seed).items():
+            server.add_table(table_name, records)
+        env = dict(os.environ,
+                   PYTHONPATH=REPO_ROOT + os.pathsep + os.environ.get("PYTHONPATH", ""),
+                   ENVIRONMENT_MODE="Development",
+                   AIRTABLE_API_URL=server.api_url,
+                   AIRTABLE_BASE_ID=server.base_id,
+                   AIRTABLE_API_KEY="benchmark_key")
+
+        results["first_boot"] = boot(work_dir, env)
+        print(f"first boot:  {results['first_boot']['wall_seconds']:.3f}s")
+
+        # Populate the database and table catalog the way a finished first boot would
+        sqlite_store, _ = timed(SQLiteStorage, db_path=os.path.join(work_dir, "data", "airtable_data.db"))
+        client = AirtableClient("benchmark_key", server.base_id, requests_per_second=1000, api_url=server.api_url)
+        multi_manager = AirtableMultiManager("benchmark_key", server.base_id, table_names=[],
+                                             sqlite_storage=sqlite_store, airtable_client=client)
+        timed(multi_manager.load_table_catalog, background_refresh=False)
+        timed(multi_manager.update_all_tables)
+        sqlite_store.engine.dispose()
+
+        restarts = [boot(work_dir, env) for _ in range(args.runs)]
+        phases = {}
+        for run in restarts:
+            for phase, seconds in run["phases"].items():
+                phases.setdefault(phase, []).append(seconds)
+        results["restart"] = summarize([run["wall_seconds"] for run in restarts], {
+            "app_seconds_p50": median([run["app_seconds"] for run in restarts]),
+            "phases_p50": {phase: median(values) for phase, values in phases.items()}
+        })
+        print(f"restart:     p50 {results['restart']['p50_ms']:.1f}ms, p95 {results['restart']['p95_ms']:.1f}ms")
+        for phase, seconds in results["restart"]["phases_p50"].items():
+            print(f"  {phase:<32} {seconds:.3f}s")
+
+    commit = git_commit()
+    report = {
+        "commit": commit,
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "settings": {"students": args.students, "runs": args.runs, "seed": args.seed},
+        "results": results
+    }
+    output = args.output
+    if not output:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        output = os.path.join(RESULTS_DIR, f"startup-{commit}-{datetime.now().strftime('%Y%m%d-%H%M%S')}.json")
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nResults written to {output}")
+
+    if args.compare:
+        compare(report, args.compare)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,362 @@
+"""
+Sync and upload benchmark suite.
+
+Builds synthetic craffft_students / craffft_steps / craffft_quests / craffft_teachers
+datasets, serves them from the local fake Airtable server (fake_airtable.py) and times
+the main data paths against a throwaway SQLite database:
+
+- import:      loading the generated rows straight into SQLite
+- sync:        a full pull of every table from Airtable (update_all_tables)
+- upload:      an incremental upload of changed student rows, and a forced full replace
+- dashboard:   StudentDataManager.get_students_data_for_dashboard for a sample of classes
+- step_update: StudentDataManager.update_step_and_check_quest for a sample of students
+
+Results are written as JSON (one entry per dataset size) so runs on different commits
+can be compared with --compare.
+
+Usage (from the repository root):
+    python niche-tests/benchmark_sync.py --sizes 1000,10000
+    python niche-tests/benchmark_sync.py --sizes 100000 --skip-full-upload
+    python niche-tests/benchmark_sync.py --compare niche-tests/benchmark_results/<earlier>.json
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+# Benchmarks always run against a local SQLite file, never the production database
+os.environ['ENVIRONMENT_MODE'] = 'Development'
+
+from generate_student_names import generate_student_names
+from airtable_client import AirtableClient
+from airtable_multi_manager import AirtableMultiManager
+from fake_airtable import FakeAirtableServer
+from sqlite_storage import SQLiteStorage
+from student_data_manager import StudentDataManager
+
+DEFAULT_SIZES = [1000, 10000, 100000]
+RESULTS_DIR = os.path.join(REPO_ROOT, "niche-tests", "benchmark_results")
+STUDENTS_PER_CLASS = 25
+CLASSES_PER_TEACHER = 4
+STEPS_PER_QUEST = 10
+NUM_QUESTS = 20
+
+
+def build_dataset(num_students, seed=42):
+    """
+    Build synthetic Airtable records for the four core tables.
+
+    Args:
+        num_students: Number of craffft_students rows; teacher and class counts scale with it
+        seed: Random seed so every run (and every commit) benchmarks the same data
+
+    Returns:
+        Dictionary of table name -> list of field dicts
+    """
+    rng = random.Random(seed)
+
+    quests = []
+    steps = []
+    for q in range(1, NUM_QUESTS + 1):
+        short_code = f"Q{q:03d}"
+        step_names = [f"{short_code}-S{s:02d}" for s in range(1, STEPS_PER_QUEST + 1)]
+        quests.append({
+            "record_id": short_code,
+            "short_code": short_code,
+            "quest_name": f"Quest {q}",
+            "quest_description": f"Synthetic quest number {q}",
+            "steps": step_names
+        })
+        for index, name in enumerate(step_names):
+            steps.append({
+                "record_id": name,
+                "name": name,
+                "craffft_quest_id": short_code,
+                "step_number": str(index + 1),
+                "step_description": f"Step {index + 1} of {short_code}"
+            })
+
+    num_classes = max(1, num_students // STUDENTS_PER_CLASS)
+    num_teachers = max(1, -(-num_classes // CLASSES_PER_TEACHER))
+    teachers = []
+    class_ids = []
+    for t in range(1, num_teachers + 1):
+        classroom_ids = [f"T{t:05d}-C{c}" for c in range(1, CLASSES_PER_TEACHER + 1)]
+        class_ids.extend(classroom_ids)
+        teachers.append({
+            "record_id": f"recT{t:06d}",
+            "website_user_id": f"teacher-{t}",
+            "first_name": "Teacher",
+            "last_name": str(t),
+            "school_name": f"School {t % 50}",
+            "classroom_ids": classroom_ids
+        })
+    class_ids = class_ids[:num_classes]
+
+    students = []
+    names = generate_student_names(num_students, unique=False, seed=seed)
+    for i, full_name in enumerate(names, start=1):
+        first, last = full_name.split(" ", 1)
+        quest = rng.choice(quests)
+        step_index = rng.randrange(STEPS_PER_QUEST)
+        students.append({
+            "record_id": f"recS{i:07d}",
+            "website_id": str(i),
+            "first_name": first,
+            "last_name": last,
+            "gamer_tag": f"{first.lower()}{i}",
+            "current_class": class_ids[(i - 1) % len(class_ids)],
+            "current_quest": quest["short_code"],
+            "current_step": quest["steps"][step_index],
+            "quest_progress_percentage": "{:.0f}".format((step_index + 1) / STEPS_PER_QUEST * 100),
+            "completed_quests": [],
+            "achievements": []
+        })
+
+    return {
+        "craffft_quests": quests,
+        "craffft_steps": steps,
+        "craffft_teachers": teachers,
+        "craffft_students": students
+    }
+
+
+def summarize(durations, extra=None):
+    """
+    Summarize a list of per-operation durations (seconds) as total, throughput and latency percentiles.
+    """
+    ordered = sorted(durations)
+    total = sum(ordered)
+
+    def percentile(p):
+        if not ordered:
+            return 0.0
+        return ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))]
+
+    summary = {
+        "seconds": round(total, 4),
+        "operations": len(ordered),
+        "ops_per_second": round(len(ordered) / total, 1) if total > 0 else None,
+        "p50_ms": round(percentile(50) * 1000, 3),
+        "p95_ms": round(percentile(95) * 1000, 3),
+        "p99_ms": round(percentile(99) * 1000, 3),
+        "max_ms": round(ordered[-1] * 1000, 3) if ordered else 0.0
+    }
+    if extra:
+        summary.update(extra)
+    return summary
+
+
+def timed(func, *args, quiet=True, **kwargs):
+    """
+    Call func and return (result, elapsed seconds), hiding its print output if quiet.
+    """
+    output = io.StringIO() if quiet else None
+    with contextlib.redirect_stdout(output) if quiet else contextlib.nullcontext():
+        start = time.perf_counter()
+        result = func(*args, **kwargs)
+        elapsed = time.perf_counter() - start
+    return result, elapsed
+
+
+def run_size(num_students, args):
+    """
+    Run every benchmark for one dataset size.
+
+    Returns:
+        Dictionary of benchmark name -> summary
+    """
+    print(f"\n=== {num_students} students ===")
+    dataset, build_seconds = timed(build_dataset, num_students, seed=args.seed)
+    rows = {table: len(records) for table, records in dataset.items()}
+    print(f"Generated dataset in {build_seconds:.2f}s: {rows}")
+    results = {"rows": rows}
+    rng = random.Random(args.seed)
+
+    with FakeAirtableServer(latency=args.latency) as server, tempfile.TemporaryDirectory() as temp_dir:
+        for table_name, records in dataset.items():
+            server.add_table(table_name, records)
+        client = AirtableClient("benchmark_key", server.base_id, requests_per_second=args.requests_per_second, api_url=server.api_url)
+        sqlite_store, _ = timed(SQLiteStorage, db_path=os.path.join(temp_dir, "benchmark.db"))
+        multi_manager = AirtableMultiManager("benchmark_key", server.base_id, table_names=list(dataset.keys()),
+                                             sqlite_storage=sqlite_store, airtable_client=client)
+
+        # Local import, without any Airtable traffic
+        import_store, _ = timed(SQLiteStorage, db_path=os.path.join(temp_dir, "import.db"))
+        durations = []
+        for table_name, records in dataset.items():
+            flat = [{key: str(value) for key, value in record.items()} for record in records]
+            _, elapsed = timed(import_store.import_dict_rows, table_name, flat)
+            durations.append(elapsed)
+        import_store.engine.dispose()
+        results["import"] = summarize(durations, {"rows": sum(rows.values())})
+        print(f"import:      {results['import']['seconds']:.3f}s")
+
+        # Full sync from Airtable
+        server.reset_counts()
+        sync_results, elapsed = timed(multi_manager.update_all_tables)
+        failed = {table: status for table, status in sync_results.items() if not status.startswith(("Successfully", "Skipped"))}
+        results["sync"] = summarize([elapsed], {
+            "rows": sum(rows.values()),
+            "airtable_requests": sum(server.request_counts.values()),
+            "failed_tables": failed
+        })
+        print(f"sync:        {elapsed:.3f}s ({results['sync']['airtable_requests']} requests)")
+
+        # Second sync with nothing changed in Airtable: every table should be skipped
+        resync_results, elapsed = timed(multi_manager.update_all_tables)
+        results["resync_unchanged"] = summarize([elapsed], {
+            "skipped_tables": sum(status.startswith("Skipped") for status in resync_results.values())
+        })
+        print(f"resync:      {elapsed:.3f}s ({results['resync_unchanged']['skipped_tables']}/{len(resync_results)} tables skipped)")
+
+        student_manager = StudentDataManager(multi_manager)
+        students = dataset["craffft_students"]
+        class_ids = sorted({student["current_class"] for student in students})
+
+        # Teacher dashboard
+        sample_classes = rng.sample(class_ids, min(args.dashboard_samples, len(class_ids)))
+        durations = []
+        for class_id in sample_classes:
+            _, elapsed = timed(student_manager.get_students_data_for_dashboard, class_id)
+            durations.append(elapsed)
+        results["dashboard"] = summarize(durations)
+        print(f"dashboard:   p50 {results['dashboard']['p50_ms']:.2f}ms, p95 {results['dashboard']['p95_ms']:.2f}ms")
+
+        # Step advancement, including the odd quest completion on a last step
+        quest_steps = {quest["short_code"]: quest["steps"] for quest in dataset["craffft_quests"]}
+        sample_students = rng.sample(students, min(args.step_samples, len(students)))
+        durations = []
+        failures = 0
+        for student in sample_students:
+            steps = quest_steps[student["current_quest"]]
+            next_step = steps[min(steps.index(student["current_step"]) + 1, len(steps) - 1)]
+            result, elapsed = timed(student_manager.update_step_and_check_quest, student["website_id"], next_step)
+            durations.append(elapsed)
+            if not result.get("success"):
+                failures += 1
+        results["step_update"] = summarize(durations, {"failures": failures})
+        print(f"step_update: p50 {results['step_update']['p50_ms']:.2f}ms, p95 {results['step_update']['p95_ms']:.2f}ms")
+
+        # Incremental upload of the rows changed above plus a few renames
+        student_table = multi_manager.get_manager("craffft_students")
+        for student in rng.sample(students, min(args.upload_changes, len(students))):
+            timed(student_table.modify_field, "website_id", student["website_id"], "gamer_tag", f"renamed{student['website_id']}")
+        changed_rows = len({change["key_value"] for change in sqlite_store.get_pending_changes("craffft_students")})
+        server.reset_counts()
+        upload_results, elapsed = timed(multi_manager.upload_modified_tables_to_airtable)
+        results["upload_incremental"] = summarize([elapsed], {
+            "changed_rows": changed_rows,
+            "airtable_requests": sum(server.request_counts.values()),
+            "result": upload_results.get("craffft_students")
+        })
+        print(f"upload:      {elapsed:.3f}s for {changed_rows} changed rows ({results['upload_incremental']['airtable_requests']} requests)")
+
+        # Forced full replace of the students table
+        if not args.skip_full_upload:
+            server.reset_counts()
+            result, elapsed = timed(student_table.upload_to_airtable)
+            results["upload_full"] = summarize([elapsed], {
+                "rows": len(students),
+                "airtable_requests": sum(server.request_counts.values()),
+                "result": result
+            })
+            print(f"upload_full: {elapsed:.3f}s ({results['upload_full']['airtable_requests']} requests)")
+
+        results["airtable_metrics"] = client.get_metrics()
+        sqlite_store.engine.dispose()
+
+    return results
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_ROOT, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def compare(current, baseline_path):
+    """
+    Print how each benchmark's time changed relative to an earlier results file.
+    """
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    print(f"\nComparison with {baseline.get('commit')} ({baseline_path}):")
+    for size, benchmarks in current["results"].items():
+        previous = baseline.get("results", {}).get(size)
+        if not previous:
+            print(f"  {size}: no baseline")
+            continue
+        for name, summary in benchmarks.items():
+            if not isinstance(summary, dict) or "seconds" not in summary or name not in previous:
+                continue
+            # Sampled benchmarks compare typical latency, the others total time
+            key = "p50_ms" if name in ("dashboard", "step_update") else "seconds"
+            before, after = previous[name].get(key), summary[key]
+            if before:
+                print(f"  {size:>7} {name:<20} {key:<8} {before:>10} -> {after:<10} ({(after - before) / before * 100:+.1f}%)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark sync, upload, dashboard and step-update paths on synthetic data")
+    parser.add_argument("--sizes", default=",".join(str(size) for size in DEFAULT_SIZES),
+                        help="Comma-separated craffft_students row counts (default: 1000,10000,100000)")
+    parser.add_argument("--seed", type=int, default=42, help="Random seed for the synthetic data")
+    parser.add_argument("--latency", type=float, default=0.0, help="Simulated Airtable latency per request in seconds")
+    parser.add_argument("--requests-per-second", type=float, default=1000,
+                        help="Client rate limit; the real Airtable limit is 5, which would make large sizes take hours")
+    parser.add_argument("--dashboard-samples", type=int, default=20, help="Number of classes to load dashboards for")
+    parser.add_argument("--step-samples", type=int, default=200, help="Number of step updates to time")
+    parser.add_argument("--upload-changes", type=int, default=100, help="Extra student rows to modify before the incremental upload")
+    parser.add_argument("--skip-full-upload", action="store_true", help="Skip the forced full table replace")
+    parser.add_argument("--output", help="Results file (default: niche-tests/benchmark_results/benchmark-<commit>-<time>.json)")
+    parser.add_argument("--compare", help="Earlier results file to compare against")
+    args = parser.parse_args()
+
+    sizes = [int(size) for size in args.sizes.split(",") if size.strip()]
+    commit = git_commit()
+    report = {
+        "commit": commit,
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "settings": {
+            "seed": args.seed,
+            "latency": args.latency,
+            "requests_per_second": args.requests_per_second,
+            "dashboard_samples": args.dashboard_samples,
+            "step_samples": args.step_samples,
+            "upload_changes": args.upload_changes
+        },
+        "results": {}
+    }
+    for size in sizes:
+        report["results"][str(size)] = run_size(size, args)
+
+    output = args.output
+    if not output:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        output = os.path.join(RESULTS_DIR, f"benchmark-{commit}-{datetime.now().strftime('%Y%m%d-%H%M%S')}.json")
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nResults written to {output}")
+
+    if args.compare:
+        compare(report, args.compare)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+"""
+Concurrent write benchmark for SQLiteStorage.
+
+Runs the step-update path (StudentDataManager.update_step_and_check_quest, the work
+behind /students/update-and-check-quest) from many threads at once against the same
+synthetic SQLite database, first with every thread writing directly and then in
+single-writer mode (SQLITE_SINGLE_WRITER), where one writer thread commits queued
+writes together. Reports throughput, latency, failed updates and "database is
+locked" errors for each mode, plus the writer's batching in single-writer mode.
+
+Usage (from the repository root):
+    python niche-tests/benchmark_writes.py
+    python niche-tests/benchmark_writes.py --threads 32 --updates 50 --students 5000
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+from benchmark_sync import RESULTS_DIR, build_dataset, git_commit, summarize, timed
+from airtable_client import AirtableClient
+from airtable_multi_manager import AirtableMultiManager
+from fake_airtable import FakeAirtableServer
+from sqlite_storage import SQLiteStorage
+from student_data_manager import StudentDataManager
+
+
+def run_mode(db_path, dataset, single_writer, args):
+    """
+    Run args.threads threads of args.updates step updates each.
+
+    Returns:
+        Summary of the update latencies with throughput, failures and the storage's write stats
+    """
+    sqlite_store = SQLiteStorage(db_path=db_path, single_writer=single_writer)
+    multi_manager = AirtableMultiManager("benchmark_key", "appBenchmark", table_names=list(dataset.keys()),
+                                         sqlite_storage=sqlite_store)
+    student_data_manager = StudentDataManager(multi_manager)
+    quest_steps = {quest["short_code"]: quest["steps"] for quest in dataset["craffft_quests"]}
+    students = [(student["website_id"], student["current_quest"]) for student in dataset["craffft_students"]]
+    durations = []
+    failures = []
+    lock = threading.Lock()
+    start_together = threading.Barrier(args.threads)
+
+    def worker(index):
+        rng = random.Random(args.seed * 1000 + index)
+        local_durations, local_failures = [], 0
+        start_together.wait()
+        for _ in range(args.updates):
+            website_id, quest = rng.choice(students)
+            step = rng.choice(quest_steps[quest][:-1])
+            result, elapsed = timed(student_data_manager.update_step_and_check_quest, website_id, step)
+            local_durations.append(elapsed)
+            local_failures += not result.get("success")
+        with lock:
+            durations.extend(local_durations)
+            failures.append(local_failures)
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(args.threads)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall = time.perf_counter() - started
+
+    write_stats = sqlite_store.get_write_stats()
+    if sqlite_store.write_dispatcher is not None:
+        sqlite_store.write_dispatcher.close()
+    sqlite_store.engine.dispose()
+    summary = summarize(durations, {
+        "wall_seconds": round(wall, 3),
+        "updates_per_second": round(len(durations) / wall, 1),
+        "failed_updates": sum(failures),
+        "lock_errors": write_stats["lock_errors"],
+        "write_stats": write_stats
+    })
+    # Time summed across threads isn't meaningful here; updates_per_second is
+    for key in ("seconds", "ops_per_second"):
+        summary.pop(key)
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark concurrent step updates with and without the single SQLite writer")
+    parser.add_argument("--students", type=int, default=1000, help="craffft_students rows in the synthetic dataset")
+    parser.add_argument("--threads", type=int, default=16, help="Concurrent updating threads")
+    parser.add_argument("--updates", type=int, default=25, help="Step updates per thread")
+    parser.add_argument("--seed", type=int, default=42, help="Random seed for the data and the updates")
+    parser.add_argument("--output", help="Results file (default: niche-tests/benchmark_results/writes-<commit>-<time>.json)")
+    args = parser.parse_args()
+
+    dataset = build_dataset(args.students, seed=args.seed)
+    results = {}
+    with FakeAirtableServer() as server, tempfile.TemporaryDirectory() as temp_dir:
+        for table_name, records in dataset.items():
+            server.add_table(table_name, records)
+        template = os.path.join(temp_dir, "template.db")
+        sqlite_store = SQLiteStorage(db_path=template, single_writer=False)
+        client = AirtableClient("benchmark_key", server.base_id, requests_per_second=1000, api_url=server.api_url)
+        multi_manager = AirtableMultiManager("benchmark_key", server.base_id, table_names=list(dataset.keys()),
+                                             sqlite_storage=sqlite_store, airtable_client=client)
+        timed(multi_manager.update_all_tables)
+        sqlite_store.engine.dispose()
+
+        # Each mode starts from its own copy of the same synced database
+        for mode, single_writer in (("direct", False), ("single_writer", True)):
+            db_path = os.path.join(temp_dir, f"{mode}.db")
+            shutil.copy(template, db_path)
+            results[mode], _ = timed(run_mode, db_path, dataset, single_writer, args)
+            summary = results[mode]
+            print(f"{mode:<14} {summary['updates_per_second']:>8} updates/s  p50 {summary['p50_ms']:>8.1f}ms  "
+                  f"p95 {summary['p95_ms']:>8.1f}ms  p99 {summary['p99_ms']:>8.1f}ms  "
+                  f"failed {summary['failed_updates']}  lock errors {summary['lock_errors']}")
+        writer = results["single_writer"]["write_stats"]
+        print(f"single writer: {writer['writes']} writes in {writer['transactions']} transactions "
+              f"(mean batch {writer['mean_batch']}, max {writer['max_batch']})")
+
+    commit = git_commit()
+    report = {
+        "commit": commit,
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "settings": {"students": args.students, "threads": args.threads, "updates": args.updates, "seed": args.seed},
+        "results": results
+    }
+    output = args.output
+    if not output:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        output = os.path.join(RESULTS_DIR, f"writes-{commit}-{datetime.now().strftime('%Y%m%d-%H%M%S')}.json")
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nResults written to {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -47,30 +47,52 @@ last_names = [
     "Peterson", "Graham", "Reynolds", "Powell", "Flores", "Hansen", "Hoffman", "Silva", "Woods", "Cole"
 ]
 
-# Generate 1000 unique student names
-student_names = []
-used_combinations = set()
 
-while len(student_names) < 1000:
-    first = random.choice(first_names)
-    last = random.choice(last_names)
-    full_name = f"{first} {last}"
+def generate_student_names(count=1000, unique=True, seed=None):
+    """
+    Generate a list of "First Last" student names.
     
-    # Ensure we don't have duplicates
-    if full_name not in used_combinations:
+    Args:
+        count: Number of names to generate
+        unique: Whether names must be unique. There are only a few tens of thousands of
+                combinations, so pass False for larger synthetic datasets.
+        seed: Optional random seed for reproducible output
+    
+    Returns:
+        List of full name strings
+    """
+    rng = random.Random(seed)
+    student_names = []
+    used_combinations = set()
+    
+    while len(student_names) < count:
+        first = rng.choice(first_names)
+        last = rng.choice(last_names)
+        full_name = f"{first} {last}"
+        
+        # Ensure we don't have duplicates
+        if unique and full_name in used_combinations:
+            continue
         used_combinations.add(full_name)
         student_names.append(full_name)
+    
+    return student_names
 
-# Create comma-separated string
-student_names_string = ", ".join(student_names)
-
-# Print the result
-print("Here are 1000 student names as a comma-separated string:")
-print("\n" + student_names_string)
-
-# Also save to a file for easy copying
-with open("student_names_1000.txt", "w") as f:
-    f.write(student_names_string)
 
-print(f"\n\nTotal names generated: {len(student_names)}")
-print("Names also saved to 'student_names_1000.txt'")
+if __name__ == "__main__":
+    # Generate 1000 unique student names
+    student_names = generate_student_names(1000)
+    
+    # Create comma-separated string
+    student_names_string = ", ".join(student_names)
+    
+    # Print the result
+    print("Here are 1000 student names as a comma-separated string:")
+    print("\n" + student_names_string)
+    
+    # Also save to a file for easy copying
+    with open("student_names_1000.txt", "w") as f:
+        f.write(student_names_string)
+    
+    print(f"\n\nTotal names generated: {len(student_names)}")
+    print("Names also saved to 'student_names_1000.txt'")
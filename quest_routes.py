@@ -220,10 +220,6 @@ def generate_quest():
         success = quests_manager.add_record(quest_record)
         
         if success:
-            # Mark tables as modified so they can be uploaded to Airtable later
-            multi_manager.mark_table_as_modified("craffft_quests")
-            multi_manager.mark_table_as_modified("craffft_steps")
-            
             response_data = {
                 "message": "Quest and steps generated successfully",
                 "record_id": quest_record_id,
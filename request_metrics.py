@@ -0,0 +1,140 @@
+import threading
+import time
+from typing import Dict, Tuple
+from flask import g, request
+from sqlite_storage import SQLiteStorage
+
+
+class Histogram:
+    """
+    Cumulative-bucket histogram in the Prometheus style: a count per upper bound,
+    plus the sum and count of all observations.
+    """
+
+    def __init__(self, buckets):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * len(self.buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def copy(self) -> 'Histogram':
+        histogram = Histogram(self.buckets)
+        histogram.counts, histogram.sum, histogram.count = list(self.counts), self.sum, self.count
+        return histogram
+
+    def observe(self, value: float):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+        self.sum += value
+        self.count += 1
+
+
+class RequestMetrics:
+    """
+    Records every request's latency, status, database statements and response size
+    per route, and renders them in the Prometheus text format for /metrics.
+
+    Routes are labelled by blueprint ("core" for routes on the app itself), URL rule
+    (e.g. /students/dashboard/<classroom_id>, so ids don't create new series) and
+    method. Metrics are kept per process: each gunicorn worker reports its own.
+    """
+    LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+    QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 500)
+    SIZE_BUCKETS = (100, 1000, 10000, 100000, 1000000, 10000000)
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._routes: Dict[Tuple[str, str, str], dict] = {}
+
+    def init_app(self, app):
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+
+    def _before_request(self):
+        g.request_started_at = time.perf_counter()
+        SQLiteStorage.start_query_tally()
+
+    def _after_request(self, response):
+        started_at = g.pop('request_started_at', None)
+        tally = SQLiteStorage.stop_query_tally()
+        if started_at is None:
+            return response
+        labels = (
+            request.blueprint or 'core',
+            request.url_rule.rule if request.url_rule else 'unmatched',
+            request.method
+        )
+        size = response.calculate_content_length() if not response.is_streamed else None
+        self.observe(labels, time.perf_counter() - started_at, response.status_code,
+                     tally["queries"], tally["seconds"], size or 0)
+        return response
+
+    def observe(self, labels: Tuple[str, str, str], seconds: float, status: int,
+                queries: int, query_seconds: float, response_bytes: int):
+        with self._lock:
+            route = self._routes.get(labels)
+            if route is None:
+                route = self._routes[labels] = {
+                    "latency": Histogram(self.LATENCY_BUCKETS),
+                    "queries": Histogram(self.QUERY_BUCKETS),
+                    "query_seconds": 0.0,
+                    "size": Histogram(self.SIZE_BUCKETS),
+                    "statuses": {}
+                }
+            route["latency"].observe(seconds)
+            route["queries"].observe(queries)
+            route["query_seconds"] += query_seconds
+            route["size"].observe(response_bytes)
+            route["statuses"][status] = route["statuses"].get(status, 0) + 1
+
+    def reset(self):
+        with self._lock:
+            self._routes.clear()
+
+    # --- Prometheus text format ---
+
+    @staticmethod
+    def _labels(labels: Tuple[str, str, str], **extra) -> str:
+        values = dict(zip(("blueprint", "route", "method"), labels), **extra)
+        escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for value in values.values())
+        return '{' + ','.join(f'{name}="{value}"' for name, value in zip(values, escaped)) + '}'
+
+    def _histogram_lines(self, name: str, labels, histogram: Histogram):
+        for bound, count in zip(histogram.buckets, histogram.counts):
+            yield f"{name}_bucket{self._labels(labels, le=bound)} {count}"
+        yield f"{name}_bucket{self._labels(labels, le='+Inf')} {histogram.count}"
+        yield f"{name}_sum{self._labels(labels)} {histogram.sum:.6f}"
+        yield f"{name}_count{self._labels(labels)} {histogram.count}"
+
+    def render(self) -> str:
+        """
+        Render every route's metrics in the Prometheus text exposition format.
+        """
+        # Snapshot under the lock so a request finishing meanwhile can't tear a histogram
+        with self._lock:
+            routes = sorted((labels, {
+                "latency": route["latency"].copy(), "queries": route["queries"].copy(), "size": route["size"].copy(),
+                "query_seconds": route["query_seconds"], "statuses": dict(route["statuses"])
+            }) for labels, route in self._routes.items())
+        lines = []
+        sections = [
+            ("http_request_duration_seconds", "histogram", "Request latency in seconds", "latency"),
+            ("http_request_db_queries", "histogram", "Database statements run per request", "queries"),
+            ("http_response_size_bytes", "histogram", "Response body size in bytes", "size"),
+        ]
+        for name, kind, help_text, key in sections:
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, route in routes:
+                lines.extend(self._histogram_lines(name, labels, route[key]))
+        lines.append("# HELP http_request_db_seconds_total Time spent in database statements while serving requests")
+        lines.append("# TYPE http_request_db_seconds_total counter")
+        for labels, route in routes:
+            lines.append(f"http_request_db_seconds_total{self._labels(labels)} {route['query_seconds']:.6f}")
+        lines.append("# HELP http_requests_total Requests served, by response status")
+        lines.append("# TYPE http_requests_total counter")
+        for labels, route in routes:
+            for status, count in sorted(route["statuses"].items()):
+                lines.append(f"http_requests_total{self._labels(labels, status=status)} {count}")
+        return '\n'.join(lines) + '\n'
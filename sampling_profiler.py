@@ -0,0 +1,191 @@
+import os
+import sys
+import threading
+import time
+from datetime import datetime
+from typing import Dict, Optional
+from flask import g, request
+
+
+class SamplingProfiler:
+    """
+    On-demand sampling profiler for the admin API.
+
+    Either profiles the next N requests to one route, or samples every thread for a
+    number of seconds. A background thread reads the target threads' stacks every
+    interval and counts each distinct stack; the result is in the collapsed-stack
+    format read by flamegraph.pl, speedscope and similar tools.
+
+    Nothing samples while no profile is running: the request hooks only check
+    whether a route is being profiled. Profiles are per process, so with several
+    gunicorn workers a route profile only sees requests served by the worker that
+    started it.
+    """
+    DEFAULT_INTERVAL = 0.005
+    # Longest a profile may run, including time spent waiting for requests to the route
+    MAX_SECONDS = 300
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        # Route being profiled, while a request profile is running
+        self._route: Optional[dict] = None
+        # Thread ident -> root frame label, for the threads being sampled
+        self._targets: Dict[int, str] = {}
+        self._profile: Optional[dict] = None
+        self._stacks: Dict[str, int] = {}
+
+    def init_app(self, app):
+        app.before_request(self._before_request)
+        app.teardown_request(self._teardown_request)
+
+    # --- Request hooks ---
+
+    def _before_request(self):
+        route = self._route
+        if route is None:
+            return
+        rule = request.url_rule.rule if request.url_rule else None
+        if route["route"] not in (rule, request.path) or route["method"] not in (None, request.method):
+            return
+        with self._lock:
+            if self._route is not route or route["remaining"] <= 0:
+                return
+            route["remaining"] -= 1
+            self._targets[threading.get_ident()] = f"{request.method} {rule or request.path}"
+        g.profiled = True
+
+    def _teardown_request(self, exception=None):
+        if not g.pop('profiled', False):
+            return
+        with self._lock:
+            self._targets.pop(threading.get_ident(), None)
+            self._profile["requests"] += 1
+
+    # --- Starting and stopping ---
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def _start(self, profile: dict, interval: float, seconds: float):
+        if self.running:
+            raise RuntimeError("A profile is already running")
+        self._stop.clear()
+        self._stacks = {}
+        self._targets = {}
+        self._profile = dict(profile, interval_ms=interval * 1000, samples=0, requests=0,
+                             started_at=datetime.utcnow(), finished_at=None)
+        self._thread = threading.Thread(target=self._sample, args=(interval, min(seconds, self.MAX_SECONDS)),
+                                        name="sampling-profiler", daemon=True)
+        self._thread.start()
+
+    def profile_requests(self, route: str, count: int, method: Optional[str] = None,
+                         interval: float = DEFAULT_INTERVAL, timeout: float = MAX_SECONDS):
+        """
+        Profile the next count requests to route, given as its URL rule
+        (e.g. /students/dashboard/<classroom_id>) or an exact path. The profile ends
+        once they finish, or after timeout seconds.
+
+        Raises:
+            RuntimeError: If a profile is already running
+        """
+        method = method.upper() if method else None
+        with self._lock:
+            self._start({"mode": "requests", "route": route, "method": method, "count": count}, interval, timeout)
+            self._route = {"route": route, "method": method, "remaining": count}
+
+    def profile_threads(self, seconds: float, interval: float = DEFAULT_INTERVAL):
+        """
+        Sample every thread in the process for the given number of seconds.
+
+        Raises:
+            RuntimeError: If a profile is already running
+        """
+        with self._lock:
+            self._start({"mode": "threads", "seconds": seconds}, interval, seconds)
+
+    def stop(self):
+        """
+        Stop the running profile early, keeping the samples taken so far.
+        """
+        self._stop.set()
+        thread = self._thread
+        if thread is not None:
+            thread.join()
+
+    # --- Sampling ---
+
+    @staticmethod
+    def _frame_label(frame, root: str) -> str:
+        code = frame.f_code
+        filename = code.co_filename
+        if filename.startswith(root):
+            filename = filename[len(root):]
+        # ';' separates frames and the last ' ' separates the count in the collapsed format
+        return f"{code.co_name} ({filename}:{code.co_firstlineno})".replace(';', ':').replace(' ', '_')
+
+    def _sample(self, interval: float, seconds: float):
+        deadline = time.monotonic() + seconds
+        own_ident = threading.get_ident()
+        root = os.getcwd() + os.sep
+        try:
+            while not self._stop.is_set() and time.monotonic() < deadline:
+                with self._lock:
+                    route = self._route
+                    if route is not None and route["remaining"] <= 0 and not self._targets:
+                        break
+                    if route is not None:
+                        targets = dict(self._targets)
+                    else:
+                        targets = {thread.ident: thread.name for thread in threading.enumerate() if thread.ident != own_ident}
+                frames = sys._current_frames()
+                sampled = []
+                for ident, label in targets.items():
+                    frame = frames.get(ident)
+                    if frame is None:
+                        continue
+                    stack = []
+                    while frame is not None:
+                        stack.append(self._frame_label(frame, root))
+                        frame = frame.f_back
+                    stack.append(label.replace(';', ':').replace(' ', '_'))
+                    sampled.append(';'.join(reversed(stack)))
+                del frames
+                with self._lock:
+                    for key in sampled:
+                        self._stacks[key] = self._stacks.get(key, 0) + 1
+                    self._profile["samples"] += 1
+                self._stop.wait(interval)
+        finally:
+            with self._lock:
+                self._route = None
+                self._targets = {}
+                self._profile["finished_at"] = datetime.utcnow()
+
+    # --- Results ---
+
+    def get_status(self) -> Optional[dict]:
+        """
+        Get the running or last profile's settings, progress and sample counts, or None if none has run.
+        """
+        with self._lock:
+            if self._profile is None:
+                return None
+            profile = dict(self._profile)
+            if self._route is not None:
+                profile["remaining"] = self._route["remaining"]
+            profile["stacks"] = len(self._stacks)
+        profile["running"] = self.running
+        for key in ("started_at", "finished_at"):
+            profile[key] = profile[key].isoformat() if profile[key] else None
+        return profile
+
+    def collapsed(self) -> str:
+        """
+        Get the samples in the collapsed-stack format: one "frame;frame;... count" line per stack.
+        """
+        with self._lock:
+            stacks = sorted(self._stacks.items())
+        return ''.join(f"{stack} {count}\n" for stack, count in stacks)
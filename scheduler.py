@@ -1,65 +1,244 @@
 import os
+import socket
 import time
 import schedule
 from airtable_multi_manager import AirtableMultiManager
+from sync_planner import AdaptiveSyncPlanner
+from airtable_webhooks import AirtableWebhookProcessor
+from utilities import load_env
 
 class DailyAirtableUploader:
-    def __init__(self):
+    """
+    Sync worker: runs the scheduled daily upload and the sync/upload jobs that
+    web processes queue in the sync_jobs table. Runs as its own process
+    (`python scheduler.py`, the Procfile `worker` entry) so bulk Airtable work
+    never competes with request threads.
+
+    Scheduled jobs take a database lease first (see SQLiteStorage.acquire_lease),
+    so when several workers are running exactly one of them does each run.
+    Between daily uploads, AdaptiveSyncPlanner uploads and downloads busy tables
+    more often within an hourly Airtable call budget.
+    """
+    # Don't repeat a scheduled job that another worker started within this many seconds
+    DAILY_UPLOAD_MIN_INTERVAL = 12 * 60 * 60
+    STARTUP_SYNC_MIN_INTERVAL = 10 * 60
+
+    def __init__(self, multi_manager=None, initial_sync=True):
         # Initialize the multi-manager from environment variables
-        self.multi_manager = AirtableMultiManager.from_environment()
-        
-        # Discover and add all tables from the base on initialization
-        print("Discovering tables from Airtable base...")
-        results = self.multi_manager.discover_and_add_tables_from_base()
-        print(f"Added tables: {results}")
-        
-        # Initial sync to ensure we have the latest data before starting upload scheduler
-        print("Performing initial sync from Airtable...")
-        sync_results = self.multi_manager.update_all_tables()
-        print(f"Initial sync complete: {sync_results}")
-
-    def upload_to_airtable(self):
+        self.multi_manager = multi_manager or AirtableMultiManager.from_environment()
+        self.storage = self.multi_manager.sqlite_storage
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}"
+        self.lease_seconds = float(load_env('SCHEDULER_LEASE_SECONDS', '3600'))
+        # A job still 'running' after this long is assumed to belong to a dead worker and is run again
+        self.job_timeout = float(load_env('SYNC_JOB_TIMEOUT_SECONDS', '3600'))
+        self.planner = AdaptiveSyncPlanner(self.multi_manager)
+        self.write_behind_tables = [name.strip() for name in load_env('WRITE_BEHIND_TABLES', 'craffft_students').split(',') if name.strip()]
+
+        if multi_manager is None:
+            # Add all tables from the base, rediscovering them only if the cached catalog is stale
+            print("Loading tables from the cached Airtable catalog...")
+            results = self.multi_manager.load_table_catalog(background_refresh=False)
+            print(f"Added tables: {results}")
+
+        if initial_sync:
+            # Initial sync to ensure we have the latest data before starting upload scheduler
+            print("Performing initial sync from Airtable...")
+            sync_results = self.run_exclusive('startup-sync', self.multi_manager.update_all_tables,
+                                              min_interval=self.STARTUP_SYNC_MIN_INTERVAL)
+            print(f"Initial sync complete: {sync_results}")
+
+    def run_exclusive(self, name: str, func, min_interval: float = 0):
+        """
+        Run a scheduled job only if this worker can take its lease.
+
+        Args:
+            name: Lease name for the job
+            func: Callable that runs the job
+            min_interval: Skip the job if any worker started it less than this many seconds ago
+
+        Returns:
+            The job's return value, or None if it was skipped
+        """
+        if not self.storage.acquire_lease(name, self.worker_id, self.lease_seconds, min_interval):
+            print(f"Skipping {name}: another worker holds the lease or ran it recently")
+            return None
+        try:
+            result = func()
+        except Exception as e:
+            self.storage.release_lease(name, self.worker_id, False, f"Error: {str(e)}")
+            raise
+        self.storage.release_lease(name, self.worker_id, True, result)
+        return result
+
+    def upload_to_airtable(self) -> dict:
         print("Uploading modified tables to Airtable...")
-        
+
         # Check which tables have been modified
         modified_tables = self.multi_manager.get_modified_tables()
-        
+
         if not modified_tables:
             print("No tables have been modified - nothing to upload")
-            return
-        
+            return {}
+
         print(f"Found {len(modified_tables)} modified tables: {modified_tables}")
-        
+
         # Upload all modified tables
         results = self.multi_manager.upload_modified_tables_to_airtable()
-        
+
         # Check results and report
         success_count = 0
         failed_tables = []
-        
+
         for table_name, result in results.items():
-            if result and result.startswith("Successfully"):
+            if result and result.startswith("Success"):
                 success_count += 1
                 print(f"✓ {table_name}: {result}")
             else:
                 failed_tables.append(table_name)
                 print(f"✗ {table_name}: {result}")
-        
+
         total_tables = len(results)
         print(f"\nUpload Summary: {success_count}/{total_tables} tables uploaded successfully")
-        
+
         if failed_tables:
             print(f"Failed tables: {', '.join(failed_tables)}")
         else:
             print("All modified tables uploaded successfully!")
+        return results
+
+    def request_upload(self):
+        """
+        Queue an upload of all modified tables, so scheduled runs show up in the job history.
+        """
+        job = self.storage.enqueue_job('upload')
+        print(f"Queued scheduled upload as job {job['id']}")
+        return {"job_id": job["id"]}
+
+    def request_daily_upload(self):
+        return self.run_exclusive('daily-upload', self.request_upload, min_interval=self.DAILY_UPLOAD_MIN_INTERVAL)
+
+    def flush_write_behind(self) -> dict:
+        """
+        Stream journaled row updates for the write-behind tables (WRITE_BEHIND_TABLES,
+        default craffft_students) to Airtable, so student progress reaches Airtable
+        within seconds instead of waiting for the next upload.
+        """
+        # Count the changes into the change rates before the flush removes them from the journal
+        self.planner.observe_changes()
+        results = {}
+        calls_before = self.planner.total_calls()
+        for table_name in self.write_behind_tables:
+            manager = self.multi_manager.get_manager(table_name)
+            if manager and manager.has_updates:
+                results[table_name] = manager.flush_row_updates()
+        self.planner.record_calls(self.planner.total_calls() - calls_before)
+        return results
+
+    def run_write_behind(self):
+        results = self.run_exclusive('write-behind', self.flush_write_behind)
+        for table_name, result in (results or {}).items():
+            print(f"Write-behind {table_name}: {result}")
+        return results
+
+    def run_adaptive_sync(self):
+        results = self.run_exclusive('adaptive-sync', self.planner.run_due)
+        for task, result in (results or {}).items():
+            print(f"Adaptive sync {task}: {result}")
+        return results
+
+    @staticmethod
+    def _is_failure(result) -> bool:
+        return not result or str(result).startswith(("Error", "Failed"))
+
+    def run_job(self, job: dict):
+        """
+        Run one queued job.
+
+        Returns:
+            Tuple of (succeeded, result) where result is the status message or
+            a dictionary of status messages by table name
+        """
+        table_name = job.get("table_name")
+        options = job.get("options") or {}
+
+        if job["job_type"] == 'sync':
+            if table_name:
+                manager = self.multi_manager.get_manager(table_name)
+                if not manager:
+                    return False, f"Table '{table_name}' not found"
+                result = manager.update_database_from_airtable(force_delete=options.get("force_delete", True))
+                return not self._is_failure(result), result
+            results = self.multi_manager.update_all_tables()
+            return not any(self._is_failure(result) for result in results.values()), results
+
+        if job["job_type"] == 'upload':
+            force_upload = bool(options.get("force_upload"))
+            if table_name:
+                if not self.multi_manager.get_manager(table_name):
+                    return False, f"Table '{table_name}' not found"
+                if force_upload:
+                    # Mark the whole table as modified so it is replaced in full
+                    self.multi_manager.mark_table_as_modified(table_name)
+                result = self.multi_manager.upload_table_to_airtable(table_name)
+                return not self._is_failure(result), result
+            if force_upload:
+                results = self.multi_manager.upload_modified_tables_to_airtable(force_upload=True)
+            else:
+                results = self.upload_to_airtable()
+            return not any(self._is_failure(result) for result in results.values()), results
+
+        if job["job_type"] == 'webhook':
+            summary = AirtableWebhookProcessor(self.multi_manager).process(options.get("webhook_id"))
+            failed = [result for results in summary["tables"].values() for result in results if self._is_failure(result)]
+            return not failed, summary
+
+        return False, f"Unknown job type '{job['job_type']}'"
+
+    def process_pending_jobs(self) -> int:
+        """
+        Run queued jobs until none are left.
+
+        Returns:
+            Number of jobs run
+        """
+        processed = 0
+        while True:
+            job = self.storage.claim_next_job(self.worker_id, stale_after_seconds=self.job_timeout)
+            if job is None:
+                return processed
+            print(f"Running job {job['id']}: {job['job_type']} {job['table_name'] or 'all tables'}")
+            try:
+                succeeded, result = self.run_job(job)
+            except Exception as e:
+                succeeded, result = False, f"Error: {str(e)}"
+            if self.storage.finish_job(job["id"], succeeded, result, worker_id=self.worker_id):
+                print(f"Job {job['id']} {'done' if succeeded else 'failed'}: {result}")
+            else:
+                print(f"Job {job['id']} was reclaimed by another worker; not recording this run")
+            processed += 1
 
-    def run_daily(self, time_of_day="00:00"):
-        schedule.every().day.at(time_of_day).do(self.upload_to_airtable)
+    def run_daily(self, time_of_day="00:00", poll_interval=None):
+        """
+        Run forever: the daily upload at time_of_day, adaptive uploads and downloads
+        every SYNC_PLANNER_SECONDS (default 60), write-behind flushes every
+        WRITE_BEHIND_SECONDS (default 10), plus any queued jobs, checked every
+        poll_interval seconds (SYNC_WORKER_POLL_SECONDS, default 5).
+        """
+        if poll_interval is None:
+            poll_interval = float(load_env('SYNC_WORKER_POLL_SECONDS', '5'))
+        planner_interval = int(load_env('SYNC_PLANNER_SECONDS', '60'))
+        schedule.every().day.at(time_of_day).do(self.request_daily_upload)
+        write_behind_interval = int(load_env('WRITE_BEHIND_SECONDS', '10'))
+        schedule.every(planner_interval).seconds.do(self.run_adaptive_sync)
+        schedule.every(write_behind_interval).seconds.do(self.run_write_behind)
         print(f"Scheduled daily upload of modified tables to Airtable at {time_of_day}.")
+        print(f"Adaptive sync runs every {planner_interval}s within {self.planner.calls_per_hour:.0f} Airtable calls/hour.")
+        print(f"Write-behind flushes {self.write_behind_tables} every {write_behind_interval}s.")
         print(f"Currently managing {len(self.multi_manager.get_available_tables())} tables: {self.multi_manager.get_available_tables()}")
         while True:
             schedule.run_pending()
-            time.sleep(60)
+            self.process_pending_jobs()
+            time.sleep(poll_interval)
 
 if __name__ == "__main__":
     print("Starting Daily Airtable Uploader...")
@@ -1,7 +1,16 @@
 import os
-from typing import Optional
-from datetime import datetime
-from sqlalchemy import create_engine, Column, String, Text, DateTime, text
+import re
+import json
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from typing import Dict, Optional, List
+from datetime import datetime, timedelta
+from sqlalchemy import create_engine, event, Column, Integer, Float, String, Text, DateTime, bindparam, func, text, or_, and_
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from sqlalchemy.orm import declarative_base, sessionmaker
 from utilities import load_env, critical_tables
 
@@ -12,10 +21,374 @@ class TableData(Base):
     table_name = Column(String, primary_key=True)
     csv_data = Column(Text)
     json_data = Column(Text)
+    content_hash = Column(String)  # Hash of the Airtable records last imported by sync
     updated_at = Column(DateTime, default=datetime.utcnow)
 
+class ChangeJournal(Base):
+    """
+    One row per local write that still needs to reach Airtable.
+    A row with no key_column marks the whole table for a full upload.
+    """
+    __tablename__ = 'change_journal'
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    table_name = Column(String, nullable=False, index=True)
+    key_column = Column(String)
+    key_value = Column(String)
+    changed_columns = Column(Text)  # JSON list of column names
+    operation = Column(String)  # insert, update, delete or table
+    changed_at = Column(DateTime, default=datetime.utcnow)
+
+class SyncJob(Base):
+    """
+    A sync or upload job requested by a web process and run by the sync worker.
+    """
+    __tablename__ = 'sync_jobs'
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    job_type = Column(String, nullable=False)  # sync, upload or webhook
+    table_name = Column(String)  # None for every table
+    options = Column(Text)  # JSON dict, e.g. {"force_upload": true}
+    status = Column(String, nullable=False, default='pending', index=True)  # pending, running, done or failed
+    result = Column(Text)  # JSON result reported by the worker
+    worker_id = Column(String)
+    requested_at = Column(DateTime, default=datetime.utcnow)
+    started_at = Column(DateTime)
+    finished_at = Column(DateTime)
+
+class SchedulerLease(Base):
+    """
+    Lease taken by a worker before running a scheduled job, so only one process runs it.
+    Also records how the job's last run went.
+    """
+    __tablename__ = 'scheduler_leases'
+    name = Column(String, primary_key=True)
+    holder = Column(String)  # None when the lease is free
+    expires_at = Column(DateTime)
+    last_run_holder = Column(String)
+    last_run_started_at = Column(DateTime)
+    last_run_finished_at = Column(DateTime)
+    last_run_status = Column(String)  # running, done or failed
+    last_run_result = Column(Text)  # JSON
+
+class TableSyncState(Base):
+    """
+    Per-table state for the adaptive sync planner: the observed local change rate
+    and when the table was last uploaded to and downloaded from Airtable.
+    """
+    __tablename__ = 'table_sync_state'
+    table_name = Column(String, primary_key=True)
+    change_rate = Column(Float, default=0.0)  # Journaled changes per hour, exponentially smoothed
+    last_change_id = Column(Integer, default=0)  # Newest change journal id already counted
+    rate_updated_at = Column(DateTime)
+    last_upload_at = Column(DateTime)
+    last_download_at = Column(DateTime)
+
+class SyncCallCharge(Base):
+    """
+    Airtable calls made by a planned sync run or write-behind flush, charged to the
+    hourly call budget that every worker on the database shares.
+    """
+    __tablename__ = 'sync_call_charges'
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    calls = Column(Integer, nullable=False)
+    spent_at = Column(DateTime, default=datetime.utcnow, index=True)
+
+class WebhookCursor(Base):
+    """
+    How far the Airtable webhook payloads for a webhook have been applied.
+    """
+    __tablename__ = 'webhook_cursors'
+    webhook_id = Column(String, primary_key=True)
+    cursor = Column(Integer, default=1)  # Next payload cursor to request
+    last_transaction = Column(Integer, default=0)  # Newest baseTransactionNumber applied
+    updated_at = Column(DateTime, default=datetime.utcnow)
+
+class TableCatalogEntry(Base):
+    """
+    Cached Airtable Meta API schema of a base: one row per table, with its fields.
+    """
+    __tablename__ = 'table_catalog'
+    base_id = Column(String, primary_key=True)
+    table_name = Column(String, primary_key=True)
+    table_id = Column(String)
+    position = Column(Integer)  # Order of the table in the base
+    fields = Column(Text)  # JSON list of Airtable field definitions
+    fetched_at = Column(DateTime, default=datetime.utcnow)
+
+# Per-thread statement count and time, while a caller (e.g. a web request) is tallying
+_query_tally = threading.local()
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_start_times', []).append(time.perf_counter())
+
+
+def _sqlite_connect(dbapi_connection, connection_record):
+    # Let SQLAlchemy emit BEGIN itself (see _sqlite_begin) instead of the sqlite3 module's
+    # implicit transactions, which don't support savepoints
+    dbapi_connection.isolation_level = None
+    dbapi_connection.execute('PRAGMA journal_mode=WAL')
+
+
+def _sqlite_begin(conn):
+    # The writer takes the write lock up front: a deferred transaction that reads and then
+    # writes fails outright under WAL if another connection committed in between
+    conn.exec_driver_sql('BEGIN IMMEDIATE' if conn.get_execution_options().get('begin_immediate') else 'BEGIN')
+
+
+class QueryStats:
+    """
+    Statement timings aggregated by statement shape, plus a ring buffer of slow statements.
+
+    A statement's shape is its SQL with literals and bound parameters replaced by "?"
+    and IN lists collapsed, so the same lookup with different values is counted once.
+    Statements taking at least slow_threshold_ms are also kept, newest last, with their
+    parameters.
+    """
+    # Quoted identifiers are kept as they are; string and number literals and bound parameters become "?"
+    _TOKENS = re.compile(r'"(?:[^"]|"")*"|\'(?:[^\']|\'\')*\'|%\(\w+\)s|(?<![\w:]):\w+|\?|\b\d+(?:\.\d+)?\b')
+    _LISTS = re.compile(r'\(\s*\?(?:\s*,\s*\?)+\s*\)')
+    _VALUE_ROWS = re.compile(r'(\(\?(?:, \?)*\))(?:\s*,\s*\(\?(?:, \?)*\))+')
+    # Statements over this many shapes (e.g. ad-hoc admin queries) are counted together
+    MAX_SHAPES = 1000
+    OTHER_SHAPE = '(other statements)'
+
+    def __init__(self, slow_threshold_ms: float = 100, slow_log_size: int = 100):
+        self.slow_threshold_ms = slow_threshold_ms
+        self._lock = threading.Lock()
+        self._shapes = {}
+        self._slow = deque(maxlen=slow_log_size)
+        # Statements that failed because the database was locked
+        self.lock_errors = 0
+        self.since = datetime.utcnow()
+
+    @classmethod
+    def normalize(cls, statement: str) -> str:
+        """
+        Get the shape of a SQL statement.
+        """
+        shape = cls._TOKENS.sub(lambda m: m.group(0) if m.group(0).startswith('"') else '?', statement)
+        shape = ' '.join(shape.split())
+        shape = cls._VALUE_ROWS.sub(r'\1, ...', shape)
+        return cls._LISTS.sub('(?, ...)', shape)
+
+    def record(self, statement: str, parameters, seconds: float, executemany: bool = False):
+        shape = self.normalize(statement)
+        slow = seconds * 1000 >= self.slow_threshold_ms
+        with self._lock:
+            stats = self._shapes.get(shape)
+            if stats is None:
+                if len(self._shapes) >= self.MAX_SHAPES:
+                    shape = self.OTHER_SHAPE
+                stats = self._shapes.setdefault(shape, {"calls": 0, "total_seconds": 0.0, "max_seconds": 0.0, "slow_calls": 0})
+            stats["calls"] += 1
+            stats["total_seconds"] += seconds
+            stats["max_seconds"] = max(stats["max_seconds"], seconds)
+            if slow:
+                stats["slow_calls"] += 1
+                self._slow.append({
+                    "statement": statement[:2000],
+                    "shape": shape,
+                    "parameters": repr(parameters)[:500],
+                    "executemany": executemany,
+                    "ms": round(seconds * 1000, 3),
+                    "at": datetime.utcnow().isoformat(),
+                    "thread": threading.current_thread().name
+                })
+
+    def record_lock_error(self):
+        with self._lock:
+            self.lock_errors += 1
+
+    def total_calls(self) -> int:
+        """
+        Get the number of statements recorded since the last reset.
+        """
+        with self._lock:
+            return sum(stats["calls"] for stats in self._shapes.values())
+
+    def get_report(self, limit: int = 20, sort: str = 'total') -> dict:
+        """
+        Get the statement shapes with the most total time (sort='total'), longest single
+        run ('max'), highest mean ('mean') or most calls ('calls'), and the slow statement log.
+        """
+        with self._lock:
+            shapes = [dict(stats, statement=shape) for shape, stats in self._shapes.items()]
+            slow = list(self._slow)
+        for stats in shapes:
+            stats["mean_ms"] = round(stats["total_seconds"] / stats["calls"] * 1000, 3)
+            stats["total_ms"] = round(stats.pop("total_seconds") * 1000, 3)
+            stats["max_ms"] = round(stats.pop("max_seconds") * 1000, 3)
+        sort_key = {"total": "total_ms", "max": "max_ms", "mean": "mean_ms", "calls": "calls"}.get(sort, "total_ms")
+        shapes.sort(key=lambda stats: stats[sort_key], reverse=True)
+        return {
+            "since": self.since.isoformat(),
+            "slow_threshold_ms": self.slow_threshold_ms,
+            "shapes": len(shapes),
+            "lock_errors": self.lock_errors,
+            "statements": shapes[:limit],
+            "slow_queries": slow[::-1]
+        }
+
+    def reset(self):
+        with self._lock:
+            self._shapes.clear()
+            self._slow.clear()
+            self.lock_errors = 0
+            self.since = datetime.utcnow()
+
+
+class WriteDispatcher:
+    """
+    Runs every write on one thread and commits the writes queued meanwhile together,
+    in one transaction (group commit), so concurrent writers never contend for
+    SQLite's write lock and pay for one commit per batch instead of one each.
+
+    A write is a function of an open connection. Each runs in its own savepoint, so
+    a failing write is rolled back on its own and its caller gets the exception.
+    Callers block until the transaction holding their write has committed. A write's
+    statements count towards its caller's query tally (see start_query_tally), so a
+    request's statement counts include the writes it queued.
+    """
+
+    def __init__(self, engine, max_batch: int = 100):
+        self.engine = engine
+        self.max_batch = max_batch
+        self._thread: Optional[threading.Thread] = None
+        self._pid: Optional[int] = None
+        self._reset_state()
+
+    def _reset_state(self):
+        self._queue = queue.Queue()
+        self._start_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._stats = {"writes": 0, "failed_writes": 0, "transactions": 0, "failed_transactions": 0,
+                       "max_batch": 0, "queue_seconds": 0.0, "transaction_seconds": 0.0}
+        self.since = datetime.utcnow()
+
+    def submit(self, write):
+        """
+        Queue write(conn) and wait for the transaction holding it to commit.
+
+        Returns:
+            Whatever write returned
+
+        Raises:
+            The exception write raised, or the one that failed its transaction
+        """
+        if threading.current_thread() is self._thread:
+            raise RuntimeError("A write can't queue another write")
+        if self._pid != os.getpid() or not self._thread.is_alive():
+            self._start()
+        future = Future()
+        # The caller is blocked until the write is done, so the writer can add to its tally safely
+        self._queue.put((write, future, time.perf_counter(), getattr(_query_tally, 'current', None)))
+        return future.result()
+
+    def _start(self):
+        with self._start_lock:
+            if self._pid == os.getpid() and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(target=self._run, name="sqlite-writer", daemon=True)
+            self._thread.start()
+            self._pid = os.getpid()
+
+    def reset_after_fork(self):
+        """
+        Called in a forked child: the parent's writer thread doesn't exist here, so
+        start over with a new queue (the thread starts with the first write).
+        """
+        self._thread = None
+        self._pid = None
+        self._reset_state()
+
+    def close(self):
+        if self._thread is not None and self._pid == os.getpid() and self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join()
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            while batch[-1] is not None and len(batch) < self.max_batch:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            stopping = batch[-1] is None
+            if stopping:
+                batch.pop()
+            if batch:
+                self._commit(batch)
+            if stopping:
+                return
+
+    def _commit(self, batch):
+        started = time.perf_counter()
+        outcomes = []
+        try:
+            with self.engine.connect() as conn:
+                conn.execution_options(begin_immediate=True)
+                with conn.begin():
+                    for write, future, _, tally in batch:
+                        try:
+                            with conn.begin_nested():
+                                _query_tally.current = tally
+                                try:
+                                    outcomes.append((future, write(conn), None))
+                                finally:
+                                    _query_tally.current = None
+                        except Exception as e:
+                            outcomes.append((future, None, e))
+        except Exception as e:
+            outcomes = [(future, None, e) for _, future, _, _ in batch]
+            failed_transaction = True
+        else:
+            failed_transaction = False
+        finished = time.perf_counter()
+
+        with self._stats_lock:
+            self._stats["transactions"] += 1
+            self._stats["failed_transactions"] += failed_transaction
+            self._stats["writes"] += len(batch)
+            self._stats["failed_writes"] += sum(1 for _, _, error in outcomes if error is not None)
+            self._stats["max_batch"] = max(self._stats["max_batch"], len(batch))
+            self._stats["queue_seconds"] += sum(started - queued_at for _, _, queued_at, _ in batch)
+            self._stats["transaction_seconds"] += finished - started
+        for future, result, error in outcomes:
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(result)
+
+    def get_stats(self) -> dict:
+        """
+        Get write and transaction counts, batch sizes, time spent queued and in transactions, and write throughput.
+        """
+        with self._stats_lock:
+            stats = dict(self._stats)
+        elapsed = (datetime.utcnow() - self.since).total_seconds()
+        transactions = stats["transactions"] or 1
+        writes = stats["writes"] or 1
+        return {
+            "writes": stats["writes"],
+            "failed_writes": stats["failed_writes"],
+            "transactions": stats["transactions"],
+            "failed_transactions": stats["failed_transactions"],
+            "mean_batch": round(stats["writes"] / transactions, 2),
+            "max_batch": stats["max_batch"],
+            "mean_queue_ms": round(stats["queue_seconds"] / writes * 1000, 3),
+            "mean_transaction_ms": round(stats["transaction_seconds"] / transactions * 1000, 3),
+            "writes_per_second": round(stats["writes"] / elapsed, 1) if elapsed > 0 else None,
+            "queued": self._queue.qsize(),
+            "since": self.since.isoformat()
+        }
+
+
 class SQLiteStorage:
-    def __init__(self, db_path: str = "data/airtable_data.db"):
+    # Column used to identify inserted rows in the change journal
+    JOURNAL_KEY_COLUMN = 'record_id'
+
+    def __init__(self, db_path: str = "data/airtable_data.db", single_writer: Optional[bool] = None):
         # Check if we're on Heroku (DATABASE_URL environment variable)
         database_url = os.environ.get('DATABASE_URL')
         MODE = load_env('ENVIRONMENT_MODE')
@@ -34,11 +407,118 @@ class SQLiteStorage:
             self.db_path = db_path
             self.engine = create_engine(f'sqlite:///{db_path}', echo=False, future=True)
             print(f"Using SQLite: {db_path}")
+        
+        # Optionally send every write through one writer thread (SQLite only), with readers on WAL
+        if single_writer is None:
+            single_writer = load_env('SQLITE_SINGLE_WRITER', 'false').lower() in ('1', 'true', 'yes')
+        self.write_dispatcher = None
+        if single_writer and self.engine.dialect.name == 'sqlite':
+            event.listen(self.engine, 'connect', _sqlite_connect)
+            event.listen(self.engine, 'begin', _sqlite_begin)
+            self.write_dispatcher = WriteDispatcher(self.engine, int(load_env('SQLITE_WRITE_BATCH_SIZE', '100')))
+            print("SQLite writes go through a single writer thread")
+        elif single_writer:
+            print("SQLITE_SINGLE_WRITER only applies to SQLite - writing directly")
             
+        # Time every statement (see start_query_tally and query_stats)
+        self.query_stats = QueryStats(float(load_env('SLOW_QUERY_MS', '100')),
+                                      int(load_env('SLOW_QUERY_LOG_SIZE', '100')))
+        event.listen(self.engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(self.engine, 'after_cursor_execute', self._after_cursor_execute)
+        event.listen(self.engine, 'handle_error', self._handle_error)
         Base.metadata.create_all(self.engine)
+        # create_all doesn't add columns to tables made by older versions
+        if 'content_hash' not in self.get_table_columns('table_data'):
+            with self.engine.begin() as conn:
+                conn.execute(text('ALTER TABLE table_data ADD COLUMN content_hash VARCHAR'))
         self.Session = sessionmaker(bind=self.engine, future=True)
 
 
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info['query_start_times'].pop()
+        tally = getattr(_query_tally, 'current', None)
+        if tally is not None:
+            tally["queries"] += 1
+            tally["seconds"] += elapsed
+        self.query_stats.record(statement, parameters, elapsed, executemany)
+
+    def _handle_error(self, context):
+        # A failed statement never reaches after_cursor_execute
+        if context.connection is not None and context.connection.info.get('query_start_times'):
+            context.connection.info['query_start_times'].pop()
+        if 'locked' in str(context.original_exception).lower():
+            self.query_stats.record_lock_error()
+
+    def _write(self, write):
+        """
+        Run write(conn) in a transaction: queued for the writer thread in single-writer
+        mode, otherwise in a transaction of its own on the calling thread.
+
+        Returns:
+            Whatever write returned
+        """
+        if self.write_dispatcher is not None:
+            return self.write_dispatcher.submit(write)
+        with self.engine.begin() as conn:
+            return write(conn)
+
+    def _write_session(self, work):
+        """
+        Run work(session) with an ORM session joined to a _write transaction, so ORM
+        updates go through the single writer too. The session is committed when work
+        returns, which only ends the session's part: the changes commit with the
+        transaction. Build any return value from ORM objects inside work.
+
+        Returns:
+            Whatever work returned
+        """
+        def write(conn):
+            with self.Session(bind=conn) as session:
+                result = work(session)
+                session.commit()
+                return result
+        return self._write(write)
+
+    def get_write_stats(self) -> dict:
+        """
+        Get the write mode, lock errors seen and, in single-writer mode, the writer's throughput and batching.
+        """
+        stats = {
+            "mode": "single_writer" if self.write_dispatcher is not None else "direct",
+            "lock_errors": self.query_stats.lock_errors
+        }
+        if self.write_dispatcher is not None:
+            stats.update(self.write_dispatcher.get_stats())
+        return stats
+
+    @staticmethod
+    def start_query_tally():
+        """
+        Start counting the statements this thread runs, and the time they take.
+        """
+        _query_tally.current = {"queries": 0, "seconds": 0.0}
+
+    @staticmethod
+    def stop_query_tally() -> dict:
+        """
+        Stop counting for this thread.
+        
+        Returns:
+            Dictionary with the number of statements run since start_query_tally and their total seconds
+        """
+        tally = getattr(_query_tally, 'current', None) or {"queries": 0, "seconds": 0.0}
+        _query_tally.current = None
+        return tally
+
+    def reset_after_fork(self):
+        """
+        Give a forked process its own connection pool. The parent's connections are
+        left open for the parent (close=False) rather than closed from the child.
+        """
+        self.engine.dispose(close=False)
+        if self.write_dispatcher is not None:
+            self.write_dispatcher.reset_after_fork()
+
     def import_dict_rows(self, table_name: str, dict_rows: list):
         """
         Import a list of dictionaries (records) directly into the specified SQLite table.
@@ -56,7 +536,7 @@ class SQLiteStorage:
                 print(f"Warning: Column name '{col}' in table '{table_name}' contains special characters. This may cause issues with SQLite.")
         # Create table if not exists
         columns_sql = ', '.join([f'"{col}" TEXT' for col in fieldnames])
-        with self.engine.begin() as conn:
+        def replace_rows(conn):
             conn.execute(
                 text(f'CREATE TABLE IF NOT EXISTS "{table_name}" ({columns_sql})')
             )
@@ -70,9 +550,10 @@ class SQLiteStorage:
                 # Ensure all keys exist (fill missing with empty string)
                 row_dict = {col: row.get(col, '') for col in fieldnames}
                 conn.execute(insert_sql, row_dict)
+        self._write(replace_rows)
 
     def save_csv(self, table_name: str, csv_data: str):
-        with self.Session() as session:
+        def save(session):
             obj = session.get(TableData, table_name)
             if obj:
                 obj.csv_data = csv_data
@@ -80,12 +561,12 @@ class SQLiteStorage:
             else:
                 obj = TableData(table_name=table_name, csv_data=csv_data, updated_at=datetime.utcnow())
                 session.add(obj)
-            session.commit()
+        self._write_session(save)
 
     
 
     def save_json(self, table_name: str, json_data: str):
-        with self.Session() as session:
+        def save(session):
             obj = session.get(TableData, table_name)
             if obj:
                 obj.json_data = json_data
@@ -93,7 +574,7 @@ class SQLiteStorage:
             else:
                 obj = TableData(table_name=table_name, json_data=json_data, updated_at=datetime.utcnow())
                 session.add(obj)
-            session.commit()
+        self._write_session(save)
 
     def get_csv(self, table_name: str) -> Optional[str]:
         with self.Session() as session:
@@ -105,27 +586,76 @@ class SQLiteStorage:
             obj = session.get(TableData, table_name)
             return obj.json_data if obj else None
 
-    def import_csv_rows(self, table_name: str, csv_data: str):
+    def get_content_hash(self, table_name: str) -> Optional[str]:
+        with self.Session() as session:
+            obj = session.get(TableData, table_name)
+            return obj.content_hash if obj else None
+
+    def save_content_hash(self, table_name: str, content_hash: Optional[str]):
+        """
+        Store the hash of the Airtable records a table was last synced from.
+        Pass None when the local table was changed some other way, so the next sync imports it.
+        """
+        def save(session):
+            obj = session.get(TableData, table_name)
+            if obj:
+                obj.content_hash = content_hash
+                obj.updated_at = datetime.utcnow()
+            elif content_hash is not None:
+                session.add(TableData(table_name=table_name, content_hash=content_hash, updated_at=datetime.utcnow()))
+        self._write_session(save)
+
+    @staticmethod
+    def _replace_csv_rows(conn, table_name: str, csv_data: str):
         import csv
         import io
-        with self.engine.begin() as conn:
-            reader = csv.DictReader(io.StringIO(csv_data))
-            fieldnames = reader.fieldnames
-            # Create table if not exists
-            columns_sql = ', '.join([f'"{col}" TEXT' for col in fieldnames])
+        reader = csv.DictReader(io.StringIO(csv_data))
+        fieldnames = reader.fieldnames
+        # Create table if not exists
+        columns_sql = ', '.join([f'"{col}" TEXT' for col in fieldnames])
+        conn.execute(
+            text(f'CREATE TABLE IF NOT EXISTS "{table_name}" ({columns_sql})')
+        )
+        # Clear existing data (optional, comment out if you want to append)
+        conn.execute(text(f'DELETE FROM "{table_name}"'))
+        # Insert rows using named parameters and dicts
+        placeholders = ', '.join([f':{col}' for col in fieldnames])
+        quoted_fieldnames = ', '.join([f'"{col}"' for col in fieldnames])
+        insert_sql = text(f'INSERT INTO "{table_name}" ({quoted_fieldnames}) VALUES ({placeholders})')
+        for row in reader:
+            # Ensure all keys exist (fill missing with empty string)
+            row_dict = {col: row.get(col, '') for col in fieldnames}
+            conn.execute(insert_sql, row_dict)
+
+    def import_csv_rows(self, table_name: str, csv_data: str):
+        self._write(lambda conn: self._replace_csv_rows(conn, table_name, csv_data))
+
+    def replace_table_from_airtable(self, table_name: str, csv_data: str, journal_up_to_id: int, drop_table: bool = True) -> bool:
+        """
+        Replace a table with rows downloaded from Airtable and clear the journal entries
+        the download supersedes, in one transaction. Nothing is replaced if the table
+        was changed locally after journal_up_to_id (the newest entry when the download
+        started), so a change made during a long download can't be overwritten and lost.
+        
+        Returns:
+            bool: True if the table was replaced, False if it changed during the download
+        """
+        def replace(conn):
+            newer = conn.execute(
+                text('SELECT 1 FROM change_journal WHERE table_name = :table_name AND id > :up_to_id LIMIT 1'),
+                {"table_name": table_name, "up_to_id": journal_up_to_id}
+            ).first()
+            if newer is not None:
+                return False
+            if drop_table:
+                conn.execute(text(f'DROP TABLE IF EXISTS "{table_name}"'))
+            self._replace_csv_rows(conn, table_name, csv_data)
             conn.execute(
-                text(f'CREATE TABLE IF NOT EXISTS "{table_name}" ({columns_sql})')
+                text('DELETE FROM change_journal WHERE table_name = :table_name AND id <= :up_to_id'),
+                {"table_name": table_name, "up_to_id": journal_up_to_id}
             )
-            # Clear existing data (optional, comment out if you want to append)
-            conn.execute(text(f'DELETE FROM "{table_name}"'))
-            # Insert rows using named parameters and dicts
-            placeholders = ', '.join([f':{col}' for col in fieldnames])
-            quoted_fieldnames = ', '.join([f'"{col}"' for col in fieldnames])
-            insert_sql = text(f'INSERT INTO "{table_name}" ({quoted_fieldnames}) VALUES ({placeholders})')
-            for row in reader:
-                # Ensure all keys exist (fill missing with empty string)
-                row_dict = {col: row.get(col, '') for col in fieldnames}
-                conn.execute(insert_sql, row_dict)
+            return True
+        return self._write(replace)
 
     def find_row_by_column(self, table_name: str, column_containing_reference: str, reference_value: str):
         with self.engine.connect() as conn:
@@ -160,6 +690,16 @@ class SQLiteStorage:
                 return [dict(zip(columns, row)) for row in rows]
             return []
     
+    def find_rows_by_values(self, table_name: str, column: str, values: list) -> List[dict]:
+        """
+        Find all rows whose column is one of values, with a single IN query.
+        
+        Returns:
+            List of dictionaries representing all matching rows
+        """
+        with self.engine.connect() as conn:
+            return self.select_rows(conn, table_name, column, values)
+
     def find_value_by_row_and_column(self, table_name: str, column_containing_reference: str, reference_value: str, target_column: str):
         """
         Retrieve a value from a specific column for the row where column_containing_reference == reference_value.
@@ -186,13 +726,14 @@ class SQLiteStorage:
             
             if is_write_operation:
                 # Use transaction context for write operations (required for PostgreSQL)
-                with self.engine.begin() as conn:
-                    result = conn.execute(text(sql_query))
-                    return [{
-                        "operation": "completed",
-                        "rows_affected": result.rowcount,
-                        "message": f"Query executed successfully. {result.rowcount} rows affected."
-                    }]
+                rowcount = self._write(lambda conn: conn.execute(text(sql_query)).rowcount)
+                # Unjournaled edit: the next sync must not assume the table still matches Airtable
+                self.save_content_hash(table_name, None)
+                return [{
+                    "operation": "completed",
+                    "rows_affected": rowcount,
+                    "message": f"Query executed successfully. {rowcount} rows affected."
+                }]
             else:
                 # Use regular connection for read operations
                 with self.engine.connect() as conn:
@@ -228,12 +769,17 @@ class SQLiteStorage:
             else:
                 processed_value = new_value
             
-            with self.engine.begin() as conn:
+            def update(conn):
                 result = conn.execute(
                     text(f'UPDATE "{table_name}" SET "{target_column}" = :new_value WHERE "{column_containing_reference}" = :reference_value'),
                     {"new_value": processed_value, "reference_value": reference_value}
                 )
+                if result.rowcount > 0:
+                    # If the lookup column itself changed, the row is now found under the new value
+                    key_value = processed_value if target_column == column_containing_reference else reference_value
+                    self._journal_change(conn, table_name, column_containing_reference, key_value, [target_column], 'update')
                 return result.rowcount > 0
+            return self._write(update)
                 
         except Exception as e:
             print(f"Error modifying field in {table_name}: {e}")
@@ -264,7 +810,7 @@ class SQLiteStorage:
                 if special_char_pattern.search(col):
                     print(f"Warning: Column name '{col}' in table '{table_name}' contains special characters. This may cause issues with SQLite.")
             
-            with self.engine.begin() as conn:
+            def insert(conn):
                 # Check if table exists (database-agnostic way)
                 try:
                     # Try to query the table - if it doesn't exist, this will raise an exception
@@ -328,7 +874,14 @@ class SQLiteStorage:
                         
                 result = conn.execute(insert_sql, row_dict)
                 
+                if result.rowcount > 0:
+                    if row_dict.get(self.JOURNAL_KEY_COLUMN):
+                        self._journal_change(conn, table_name, self.JOURNAL_KEY_COLUMN, row_dict[self.JOURNAL_KEY_COLUMN], fieldnames, 'insert')
+                    else:
+                        # No unique key to find the row by later, so upload the whole table instead
+                        self._journal_change(conn, table_name, None, None, fieldnames, 'table')
                 return result.rowcount > 0
+            return self._write(insert)
                 
         except Exception as e:
             print(f"Error adding record to {table_name}: {e}")
@@ -347,7 +900,7 @@ class SQLiteStorage:
             True if record was deleted successfully, False otherwise
         """
         try:
-            with self.engine.begin() as conn:
+            def delete(conn):
                 # Check if table exists (database-agnostic way)
                 try:
                     conn.execute(text(f'SELECT 1 FROM "{table_name}" LIMIT 1'))
@@ -385,7 +938,10 @@ class SQLiteStorage:
                 delete_stmt = text(f'DELETE FROM "{table_name}" WHERE "{column_name}" = :value')
                 result = conn.execute(delete_stmt, {"value": value})
                 
+                if result.rowcount > 0:
+                    self._journal_change(conn, table_name, column_name, value, [], 'delete')
                 return result.rowcount > 0
+            return self._write(delete)
                 
         except Exception as e:
             print(f"Error deleting from {table_name}: {e}")
@@ -442,12 +998,663 @@ class SQLiteStorage:
             bool: True if table was deleted successfully, False otherwise
         """
         try:
-            with self.engine.connect() as conn:
-                # Use double quotes to handle table names with special characters
-                conn.execute(text(f'DROP TABLE IF EXISTS "{table_name}"'))
-                conn.commit()
-                print(f"Successfully deleted table: {table_name}")
-                return True
+            # Use double quotes to handle table names with special characters
+            self._write(lambda conn: conn.execute(text(f'DROP TABLE IF EXISTS "{table_name}"')))
+            self.save_content_hash(table_name, None)
+            print(f"Successfully deleted table: {table_name}")
+            return True
         except Exception as e:
             print(f"Error deleting table {table_name}: {e}")
             return False
+
+    # --- Transactions ---
+
+    def run_transaction(self, work):
+        """
+        Run work(conn) in one transaction (queued for the writer thread in single-writer
+        mode) and return its result. Read with select_rows and write with
+        compare_and_set on conn, so a read-modify-write commits or rolls back as a whole.
+        """
+        return self._write(work)
+
+    @staticmethod
+    def select_rows(conn, table_name: str, column: str, values: list, for_update: bool = False) -> List[dict]:
+        """
+        Get the rows whose column is one of values, on an open connection.
+        With for_update the rows stay locked until the transaction ends on Postgres
+        (SELECT ... FOR UPDATE); SQLite has no row locks, so compare_and_set guards the write.
+        """
+        if not values:
+            return []
+        lock = ' FOR UPDATE' if for_update and conn.dialect.name == 'postgresql' else ''
+        query = text(f'SELECT * FROM "{table_name}" WHERE "{column}" IN :values{lock}').bindparams(
+            bindparam("values", expanding=True)
+        )
+        result = conn.execute(query, {"values": list(values)})
+        columns = result.keys()
+        return [dict(zip(columns, row)) for row in result.fetchall()]
+
+    @staticmethod
+    def add_columns(conn, table_name: str, columns: List[str]):
+        """
+        Add columns as TEXT on an open connection, e.g. a field that no Airtable record
+        had a value for yet and so was never synced.
+        """
+        for col in columns:
+            conn.execute(text(f'ALTER TABLE "{table_name}" ADD COLUMN "{col}" TEXT'))
+
+    def compare_and_set(self, conn, table_name: str, key_column: str, key_value, expected: dict, new_values: dict) -> bool:
+        """
+        Update a row's columns to new_values only if its expected columns still hold the
+        values read earlier, and journal the columns that change. Lists and dicts are
+        stored as JSON, as in modify_field.
+        
+        Returns:
+            bool: False if the row changed since it was read (or no longer exists)
+        """
+        values = {col: json.dumps(value) if isinstance(value, (list, dict)) else value for col, value in new_values.items()}
+        changed = {col: value for col, value in values.items() if col not in expected or expected[col] != value}
+        if not changed:
+            return True
+        same = 'IS NOT DISTINCT FROM' if conn.dialect.name == 'postgresql' else 'IS'
+        params = {"key": key_value}
+        assignments = []
+        for i, (col, value) in enumerate(changed.items()):
+            assignments.append(f'"{col}" = :new_{i}')
+            params[f"new_{i}"] = value
+        conditions = [f'"{key_column}" = :key']
+        for i, (col, value) in enumerate(expected.items()):
+            conditions.append(f'"{col}" {same} :old_{i}')
+            params[f"old_{i}"] = value
+        result = conn.execute(
+            text(f'UPDATE "{table_name}" SET {", ".join(assignments)} WHERE {" AND ".join(conditions)}'), params
+        )
+        if result.rowcount == 0:
+            return False
+        self._journal_change(conn, table_name, key_column, key_value, list(changed), 'update')
+        return True
+
+    def set_columns(self, conn, table_name: str, key_column: str, key_values: list, new_values: dict) -> int:
+        """
+        Set the same column values on every row whose key_column is one of key_values,
+        with one UPDATE, and journal an update per key. Lists and dicts are stored as JSON.
+        
+        Returns:
+            Number of rows updated
+        """
+        if not key_values or not new_values:
+            return 0
+        params = {"keys": list(key_values)}
+        assignments = []
+        for i, (col, value) in enumerate(new_values.items()):
+            assignments.append(f'"{col}" = :new_{i}')
+            params[f"new_{i}"] = json.dumps(value) if isinstance(value, (list, dict)) else value
+        query = text(f'UPDATE "{table_name}" SET {", ".join(assignments)} WHERE "{key_column}" IN :keys').bindparams(
+            bindparam("keys", expanding=True)
+        )
+        result = conn.execute(query, params)
+        if result.rowcount:
+            self._journal_changes(conn, table_name, key_column, key_values, list(new_values), 'update')
+        return result.rowcount
+
+    # --- Change journal ---
+
+    @staticmethod
+    def _journal_change(conn, table_name: str, key_column: Optional[str], key_value, changed_columns: List[str], operation: str):
+        """
+        Append a change journal entry using an open connection, so the entry
+        commits (or rolls back) together with the write it describes.
+        """
+        conn.execute(
+            ChangeJournal.__table__.insert(),
+            {
+                "table_name": table_name,
+                "key_column": key_column,
+                "key_value": None if key_value is None else str(key_value),
+                "changed_columns": json.dumps(list(changed_columns)),
+                "operation": operation,
+                "changed_at": datetime.utcnow()
+            }
+        )
+
+    @staticmethod
+    def _journal_changes(conn, table_name: str, key_column: str, key_values: list, changed_columns: List[str], operation: str):
+        """
+        Append one journal entry per key value with a single executemany, using an open connection.
+        """
+        changed_at = datetime.utcnow()
+        conn.execute(
+            ChangeJournal.__table__.insert(),
+            [{
+                "table_name": table_name,
+                "key_column": key_column,
+                "key_value": str(key_value),
+                "changed_columns": json.dumps(list(changed_columns)),
+                "operation": operation,
+                "changed_at": changed_at
+            } for key_value in key_values]
+        )
+
+    def record_change(self, table_name: str, key_column: Optional[str] = None, key_value=None, changed_columns: Optional[List[str]] = None, operation: str = 'table') -> bool:
+        """
+        Record a change in the journal outside of a write.
+        With no key_column the whole table is marked for a full upload.
+        
+        Returns:
+            bool: True if the entry was recorded, False otherwise
+        """
+        try:
+            self._write(lambda conn: self._journal_change(conn, table_name, key_column, key_value, changed_columns or [], operation))
+            return True
+        except Exception as e:
+            print(f"Error recording change for {table_name}: {e}")
+            return False
+
+    def get_pending_changes(self, table_name: str) -> list:
+        """
+        Get all journaled changes for a table, oldest first.
+        
+        Returns:
+            List of dicts with id, key_column, key_value, changed_columns (list), operation and changed_at
+        """
+        with self.Session() as session:
+            entries = session.query(ChangeJournal).filter(
+                ChangeJournal.table_name == table_name
+            ).order_by(ChangeJournal.id).all()
+            return [{
+                "id": entry.id,
+                "key_column": entry.key_column,
+                "key_value": entry.key_value,
+                "changed_columns": json.loads(entry.changed_columns) if entry.changed_columns else [],
+                "operation": entry.operation,
+                "changed_at": entry.changed_at
+            } for entry in entries]
+
+    def get_tables_with_pending_changes(self) -> List[str]:
+        """
+        Get the names of all tables that have journaled changes waiting to be uploaded.
+        """
+        with self.Session() as session:
+            rows = session.query(ChangeJournal.table_name).distinct().all()
+            return [row[0] for row in rows]
+
+    def has_pending_changes(self, table_name: str) -> bool:
+        with self.Session() as session:
+            return session.query(ChangeJournal.id).filter(
+                ChangeJournal.table_name == table_name
+            ).first() is not None
+
+    def clear_changes(self, table_name: str, up_to_id: Optional[int] = None) -> int:
+        """
+        Remove journaled changes for a table once they have been uploaded.
+        
+        Args:
+            table_name: Name of the table
+            up_to_id: Only remove entries with an id up to and including this one,
+                      so changes made while an upload was running are kept
+        
+        Returns:
+            Number of entries removed
+        """
+        try:
+            def clear(session):
+                query = session.query(ChangeJournal).filter(ChangeJournal.table_name == table_name)
+                if up_to_id is not None:
+                    query = query.filter(ChangeJournal.id <= up_to_id)
+                return query.delete(synchronize_session=False)
+            return self._write_session(clear)
+        except Exception as e:
+            print(f"Error clearing change journal for {table_name}: {e}")
+            return 0
+
+    def clear_change_ids(self, change_ids: List[int]) -> int:
+        """
+        Remove specific journal entries, e.g. the ones a write-behind flush has sent.
+        
+        Returns:
+            Number of entries removed
+        """
+        if not change_ids:
+            return 0
+        try:
+            return self._write_session(lambda session: session.query(ChangeJournal).filter(
+                ChangeJournal.id.in_(change_ids)
+            ).delete(synchronize_session=False))
+        except Exception as e:
+            print(f"Error clearing change journal entries: {e}")
+            return 0
+
+    # --- Sync jobs ---
+
+    @staticmethod
+    def _job_to_dict(job: SyncJob) -> dict:
+        return {
+            "id": job.id,
+            "job_type": job.job_type,
+            "table_name": job.table_name,
+            "options": json.loads(job.options) if job.options else {},
+            "status": job.status,
+            "result": json.loads(job.result) if job.result else None,
+            "worker_id": job.worker_id,
+            "requested_at": job.requested_at.isoformat() if job.requested_at else None,
+            "started_at": job.started_at.isoformat() if job.started_at else None,
+            "finished_at": job.finished_at.isoformat() if job.finished_at else None
+        }
+
+    def enqueue_job(self, job_type: str, table_name: Optional[str] = None, options: Optional[dict] = None) -> dict:
+        """
+        Ask the sync worker to run a job. An identical job that is still pending
+        is returned instead of queueing a duplicate.
+        
+        Args:
+            job_type: 'sync' (Airtable -> database), 'upload' (database -> Airtable) or
+                      'webhook' (apply changes from Airtable webhook payloads)
+            table_name: Table to work on, or None for every table
+            options: Extra job options, e.g. {"force_upload": True}
+        
+        Returns:
+            The job as a dict
+        """
+        options_json = json.dumps(options or {}, sort_keys=True)
+        def enqueue(session):
+            job = session.query(SyncJob).filter(
+                SyncJob.status == 'pending',
+                SyncJob.job_type == job_type,
+                SyncJob.table_name.is_(None) if table_name is None else SyncJob.table_name == table_name,
+                SyncJob.options == options_json
+            ).order_by(SyncJob.id).first()
+            if job is None:
+                job = SyncJob(job_type=job_type, table_name=table_name, options=options_json,
+                              status='pending', requested_at=datetime.utcnow())
+                session.add(job)
+                session.flush()
+            return self._job_to_dict(job)
+        return self._write_session(enqueue)
+
+    def claim_next_job(self, worker_id: str, stale_after_seconds: Optional[float] = None) -> Optional[dict]:
+        """
+        Take the oldest pending job and mark it as running.
+        The claim is a conditional UPDATE, so two workers can't take the same job.
+        
+        Args:
+            worker_id: Identifier of the worker taking the job
+            stale_after_seconds: Also take back a job that has been running for longer than this,
+                                 e.g. because the worker running it died
+        
+        Returns:
+            The claimed job as a dict, or None if nothing is pending
+        """
+        def claim(session):
+            now = datetime.utcnow()
+            claimable = SyncJob.status == 'pending'
+            if stale_after_seconds:
+                claimable = or_(claimable, and_(
+                    SyncJob.status == 'running',
+                    SyncJob.started_at < now - timedelta(seconds=stale_after_seconds)
+                ))
+            while True:
+                job = session.query(SyncJob).filter(claimable).order_by(SyncJob.id).first()
+                if job is None:
+                    return None
+                if job.status == 'running':
+                    print(f"Reclaiming job {job.id} from {job.worker_id}: running since {job.started_at}")
+                claimed = session.query(SyncJob).filter(
+                    SyncJob.id == job.id,
+                    SyncJob.status == job.status,
+                    SyncJob.started_at.is_(None) if job.started_at is None else SyncJob.started_at == job.started_at
+                ).update({
+                    "status": 'running',
+                    "worker_id": worker_id,
+                    "started_at": now
+                }, synchronize_session=False)
+                if claimed:
+                    session.refresh(job)
+                    return self._job_to_dict(job)
+                session.expire(job)
+        return self._write_session(claim)
+
+    def finish_job(self, job_id: int, succeeded: bool, result=None, worker_id: Optional[str] = None) -> bool:
+        """
+        Record the outcome of a job the worker has finished.
+        
+        Args:
+            worker_id: If given, only record the outcome while this worker still holds the job,
+                       so a worker whose job was reclaimed as stale can't overwrite the new run
+        
+        Returns:
+            bool: True if the job was found and updated
+        """
+        def finish(session):
+            job = session.get(SyncJob, job_id)
+            if job is None or (worker_id is not None and job.worker_id != worker_id):
+                return False
+            job.status = 'done' if succeeded else 'failed'
+            job.result = json.dumps(result, default=str)
+            job.finished_at = datetime.utcnow()
+            return True
+        return self._write_session(finish)
+
+    def get_job(self, job_id: int) -> Optional[dict]:
+        with self.Session() as session:
+            job = session.get(SyncJob, job_id)
+            return self._job_to_dict(job) if job else None
+
+    def get_recent_jobs(self, limit: int = 20) -> List[dict]:
+        """
+        Get the most recently requested jobs, newest first.
+        """
+        with self.Session() as session:
+            jobs = session.query(SyncJob).order_by(SyncJob.id.desc()).limit(limit).all()
+            return [self._job_to_dict(job) for job in jobs]
+
+    # --- Scheduler leases ---
+
+    def acquire_lease(self, name: str, holder: str, ttl_seconds: float, min_interval_seconds: float = 0) -> bool:
+        """
+        Take the lease for a scheduled job and mark its run as started.
+        Works the same on SQLite and Postgres: the lease row is claimed with a
+        conditional UPDATE, so when several workers race exactly one wins.
+        
+        Args:
+            name: Name of the scheduled job
+            holder: Identifier of the worker taking the lease
+            ttl_seconds: How long the lease lasts if it is never released (e.g. the worker dies)
+            min_interval_seconds: Refuse the lease if the job last started less than this long ago,
+                                  so a daily job isn't run again by a worker whose schedule fires later.
+                                  Not applied when the last run failed
+        
+        Returns:
+            bool: True if this worker now holds the lease and should run the job
+        """
+        now = datetime.utcnow()
+        def acquire(session):
+            if session.get(SchedulerLease, name) is None:
+                # Another worker may create the row first; either way it exists afterwards
+                dialect_insert = postgresql_insert if session.bind.dialect.name == 'postgresql' else sqlite_insert
+                session.execute(dialect_insert(SchedulerLease.__table__).values(name=name).on_conflict_do_nothing())
+
+            query = session.query(SchedulerLease).filter(
+                SchedulerLease.name == name,
+                or_(SchedulerLease.holder.is_(None), SchedulerLease.holder == holder, SchedulerLease.expires_at < now)
+            )
+            if min_interval_seconds:
+                # A failed run doesn't count, so the job can be retried straight away
+                query = query.filter(or_(
+                    SchedulerLease.last_run_started_at.is_(None),
+                    SchedulerLease.last_run_status == 'failed',
+                    SchedulerLease.last_run_started_at <= now - timedelta(seconds=min_interval_seconds)
+                ))
+            acquired = query.update({
+                "holder": holder,
+                "expires_at": now + timedelta(seconds=ttl_seconds),
+                "last_run_holder": holder,
+                "last_run_started_at": now,
+                "last_run_finished_at": None,
+                "last_run_status": 'running',
+                "last_run_result": None
+            }, synchronize_session=False)
+            return acquired == 1
+        return self._write_session(acquire)
+
+    def release_lease(self, name: str, holder: str, succeeded: bool, result=None) -> bool:
+        """
+        Give up a lease after running the job, recording how the run went.
+        
+        Returns:
+            bool: True if the lease was still held by `holder`
+        """
+        def release(session):
+            released = session.query(SchedulerLease).filter(
+                SchedulerLease.name == name,
+                SchedulerLease.holder == holder
+            ).update({
+                "holder": None,
+                "expires_at": None,
+                "last_run_finished_at": datetime.utcnow(),
+                "last_run_status": 'done' if succeeded else 'failed',
+                "last_run_result": json.dumps(result, default=str)
+            }, synchronize_session=False)
+            return released == 1
+        return self._write_session(release)
+
+    def get_leases(self) -> List[dict]:
+        """
+        Get every scheduler lease with its current holder and last run status.
+        A lease whose expiry has passed is reported as free.
+        """
+        now = datetime.utcnow()
+        with self.Session() as session:
+            leases = session.query(SchedulerLease).order_by(SchedulerLease.name).all()
+            return [{
+                "name": lease.name,
+                "holder": lease.holder if lease.expires_at and lease.expires_at > now else None,
+                "expires_at": lease.expires_at.isoformat() if lease.expires_at else None,
+                "last_run_holder": lease.last_run_holder,
+                "last_run_started_at": lease.last_run_started_at.isoformat() if lease.last_run_started_at else None,
+                "last_run_finished_at": lease.last_run_finished_at.isoformat() if lease.last_run_finished_at else None,
+                "last_run_status": lease.last_run_status,
+                "last_run_result": json.loads(lease.last_run_result) if lease.last_run_result else None
+            } for lease in leases]
+
+    # --- Adaptive sync state ---
+
+    def count_changes_since(self, table_name: str, after_id: int) -> tuple:
+        """
+        Count change journal entries for a table newer than after_id.
+        
+        Returns:
+            Tuple of (count, newest id), with newest id equal to after_id if there are none
+        """
+        with self.Session() as session:
+            count, newest_id = session.query(func.count(ChangeJournal.id), func.max(ChangeJournal.id)).filter(
+                ChangeJournal.table_name == table_name,
+                ChangeJournal.id > after_id
+            ).one()
+            return count, newest_id if newest_id is not None else after_id
+
+    def get_table_sync_states(self) -> dict:
+        """
+        Get the adaptive sync state of every table, keyed by table name.
+        """
+        with self.Session() as session:
+            return {state.table_name: {
+                "change_rate": state.change_rate or 0.0,
+                "last_change_id": state.last_change_id or 0,
+                "rate_updated_at": state.rate_updated_at,
+                "last_upload_at": state.last_upload_at,
+                "last_download_at": state.last_download_at
+            } for state in session.query(TableSyncState).all()}
+
+    def save_table_sync_state(self, table_name: str, **values):
+        """
+        Create or update a table's adaptive sync state with the given column values.
+        """
+        def save(session):
+            state = session.get(TableSyncState, table_name)
+            if state is None:
+                state = TableSyncState(table_name=table_name)
+                session.add(state)
+            for key, value in values.items():
+                setattr(state, key, value)
+        self._write_session(save)
+
+    def record_sync_calls(self, calls: int, keep_seconds: float = 3600):
+        """
+        Charge Airtable calls to the shared hourly budget, dropping charges older than keep_seconds.
+        """
+        now = datetime.utcnow()
+        def record(session):
+            session.query(SyncCallCharge).filter(
+                SyncCallCharge.spent_at < now - timedelta(seconds=keep_seconds)
+            ).delete(synchronize_session=False)
+            session.add(SyncCallCharge(calls=calls, spent_at=now))
+        self._write_session(record)
+
+    def count_sync_calls_since(self, since: datetime) -> int:
+        """
+        Total Airtable calls charged by any worker since the given time.
+        """
+        with self.Session() as session:
+            return session.query(func.sum(SyncCallCharge.calls)).filter(SyncCallCharge.spent_at >= since).scalar() or 0
+
+    def count_rows(self, table_name: str) -> int:
+        """
+        Count the rows in a data table, or 0 if the table doesn't exist.
+        """
+        try:
+            with self.engine.connect() as conn:
+                return conn.execute(text(f'SELECT COUNT(*) FROM "{table_name}"')).scalar() or 0
+        except Exception:
+            return 0
+
+    # --- Upserts from Airtable ---
+
+    def upsert_rows(self, table_name: str, rows: List[dict], key_column: str) -> tuple:
+        """
+        Insert or update rows matched on key_column, adding any new columns as TEXT.
+        These rows come from Airtable, so nothing is journaled.
+        
+        Returns:
+            Tuple of (updated, inserted) row counts
+        """
+        if not rows:
+            return 0, 0
+        columns = []
+        for row in rows:
+            columns.extend(col for col in row if col not in columns)
+        def upsert(conn):
+            updated = inserted = 0
+            existing = list(conn.execute(text(f'SELECT * FROM "{table_name}" LIMIT 0')).keys())
+            for col in columns:
+                if col not in existing:
+                    conn.execute(text(f'ALTER TABLE "{table_name}" ADD COLUMN "{col}" TEXT'))
+            for row in rows:
+                values = {f"v{i}": row.get(col, '') for i, col in enumerate(columns)}
+                assignments = ', '.join(f'"{col}" = :v{i}' for i, col in enumerate(columns))
+                values["key"] = row[key_column]
+                result = conn.execute(text(f'UPDATE "{table_name}" SET {assignments} WHERE "{key_column}" = :key'), values)
+                if result.rowcount:
+                    updated += 1
+                    continue
+                quoted_columns = ', '.join(f'"{col}"' for col in columns)
+                placeholders = ', '.join(f':v{i}' for i in range(len(columns)))
+                conn.execute(text(f'INSERT INTO "{table_name}" ({quoted_columns}) VALUES ({placeholders})'), values)
+                inserted += 1
+            return updated, inserted
+        return self._write(upsert)
+
+    def delete_rows(self, table_name: str, key_column: str, values: List[str]) -> int:
+        """
+        Delete every row whose key_column is one of values, without journaling.
+        
+        Returns:
+            Number of rows deleted
+        """
+        if not values:
+            return 0
+        query = text(f'DELETE FROM "{table_name}" WHERE "{key_column}" IN :values').bindparams(
+            bindparam("values", expanding=True)
+        )
+        return self._write(lambda conn: conn.execute(query, {"values": list(values)}).rowcount)
+
+    def replace_record_ids(self, table_name: str, record_ids: Dict[str, str]) -> int:
+        """
+        Point rows (and journal entries keyed by record id) at new Airtable record ids,
+        e.g. after a full upload recreated the records. These ids come from Airtable,
+        so nothing is journaled.
+        
+        Args:
+            table_name: Name of the table
+            record_ids: Mapping of stored record id to the record's current Airtable id
+        
+        Returns:
+            Number of rows updated
+        """
+        if not record_ids:
+            return 0
+        params = [{"old": old, "new": new} for old, new in record_ids.items()]
+        key_column = self.JOURNAL_KEY_COLUMN
+        def replace(conn):
+            updated = conn.execute(
+                text(f'UPDATE "{table_name}" SET "{key_column}" = :new WHERE "{key_column}" = :old'), params
+            ).rowcount
+            conn.execute(
+                ChangeJournal.__table__.update().where(
+                    ChangeJournal.table_name == table_name,
+                    ChangeJournal.key_column == key_column,
+                    ChangeJournal.key_value == bindparam("old")
+                ).values(key_value=bindparam("new")),
+                params
+            )
+            return updated
+        return self._write(replace)
+
+    def get_table_columns(self, table_name: str) -> List[str]:
+        """
+        Get a data table's column names, or an empty list if it doesn't exist.
+        """
+        try:
+            with self.engine.connect() as conn:
+                return list(conn.execute(text(f'SELECT * FROM "{table_name}" LIMIT 0')).keys())
+        except Exception:
+            return []
+
+    # --- Table catalog ---
+
+    def save_table_catalog(self, base_id: str, tables: List[dict]):
+        """
+        Replace the cached schema of a base with tables from the Airtable Meta API.
+        """
+        now = datetime.utcnow()
+        def save(session):
+            session.query(TableCatalogEntry).filter(TableCatalogEntry.base_id == base_id).delete()
+            for position, table in enumerate(tables):
+                session.add(TableCatalogEntry(
+                    base_id=base_id,
+                    table_name=table['name'],
+                    table_id=table.get('id'),
+                    position=position,
+                    fields=json.dumps(table.get('fields', [])),
+                    fetched_at=now
+                ))
+        self._write_session(save)
+
+    def get_table_catalog(self, base_id: str) -> Optional[dict]:
+        """
+        Get the cached schema of a base.
+        
+        Returns:
+            Dictionary with "tables" (id, name and fields of each table, in base order)
+            and "fetched_at", or None if the base has never been discovered
+        """
+        with self.Session() as session:
+            entries = session.query(TableCatalogEntry).filter(TableCatalogEntry.base_id == base_id).order_by(TableCatalogEntry.position).all()
+            if not entries:
+                return None
+            return {
+                "tables": [{"id": entry.table_id, "name": entry.table_name, "fields": json.loads(entry.fields or '[]')} for entry in entries],
+                "fetched_at": min(entry.fetched_at for entry in entries)
+            }
+
+    # --- Webhook cursors ---
+
+    def get_webhook_cursor(self, webhook_id: str) -> dict:
+        """
+        Get the next payload cursor and newest applied transaction number for a webhook.
+        """
+        with self.Session() as session:
+            state = session.get(WebhookCursor, webhook_id)
+            if state is None:
+                return {"cursor": 1, "last_transaction": 0}
+            return {"cursor": state.cursor, "last_transaction": state.last_transaction}
+
+    def save_webhook_cursor(self, webhook_id: str, cursor: int, last_transaction: int):
+        def save(session):
+            state = session.get(WebhookCursor, webhook_id)
+            if state is None:
+                state = WebhookCursor(webhook_id=webhook_id)
+                session.add(state)
+            state.cursor = cursor
+            state.last_transaction = last_transaction
+            state.updated_at = datetime.utcnow()
+        self._write_session(save)
@@ -0,0 +1,57 @@
+"""
+Startup-time instrumentation for app.py: how long each import and initialisation
+phase takes. Phases are always recorded (a perf_counter call each); set
+STARTUP_PROFILE=1 to print them once the app has loaded, and STARTUP_PROFILE_OUTPUT
+to a file path to also write them there as JSON (see niche-tests/benchmark_startup.py).
+
+Kept free of project and third-party imports so it can time everything else.
+"""
+import json
+import os
+import time
+from contextlib import contextmanager
+
+_started = time.perf_counter()
+_phases = []
+
+
+@contextmanager
+def phase(name: str):
+    """
+    Time the block as one startup phase.
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        _phases.append({"phase": name, "seconds": round(time.perf_counter() - start, 4)})
+
+
+def enabled() -> bool:
+    return os.environ.get('STARTUP_PROFILE', '').lower() in ('1', 'true', 'yes')
+
+
+def get_report() -> dict:
+    """
+    Get the recorded phases and the time since this module was imported.
+    """
+    return {
+        "total_seconds": round(time.perf_counter() - _started, 4),
+        "phases": list(_phases)
+    }
+
+
+def finish() -> dict:
+    """
+    Called once startup is complete: print and save the report if profiling is on.
+    """
+    report = get_report()
+    if enabled():
+        print(f"Startup took {report['total_seconds']:.3f}s")
+        for entry in report["phases"]:
+            print(f"  {entry['phase']:<32} {entry['seconds']:.3f}s")
+        output = os.environ.get('STARTUP_PROFILE_OUTPUT')
+        if output:
+            with open(output, 'w') as f:
+                json.dump(report, f, indent=2)
+    return report
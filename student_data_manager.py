@@ -1,6 +1,24 @@
 from utilities import parse_database_row, process_quest_data_for_frontend
 import json
+
+
+class StepTransitionConflict(Exception):
+    """
+    Raised inside a step transition's transaction when a student changed after it was
+    read, so the transaction rolls back and the transition can be planned again.
+    """
+
+    def __init__(self, website_id):
+        super().__init__(f"Student {website_id} changed during a step transition")
+        self.website_id = website_id
+
+
 class StudentDataManager:
+    # Student columns a step transition reads and writes; the write only applies if they are unchanged
+    TRANSITION_COLUMNS = ("current_step", "current_quest", "quest_progress_percentage", "completed_quests")
+    # Attempts at a step transition for a student that keeps changing underneath it
+    MAX_TRANSITION_ATTEMPTS = 5
+
     def __init__(self, airtable_multi_manager):
         if airtable_multi_manager is None:
             raise ValueError("airtable_multi_manager cannot be None")
@@ -72,12 +90,34 @@ class StudentDataManager:
         Retrieve all students in a specific classroom.
         Returns a list of student data dicts or an empty list if none found.
         """
-        sql = f"SELECT * FROM craffft_students WHERE current_class = '{classroom_id}'"
-        return self.airtable_multi_manager.execute_sql_query('craffft_students', sql)
+        return self._find_rows('craffft_students', 'current_class', classroom_id)
+
+    def _find_rows(self, table_name, column, value):
+        """
+        Get the rows whose column equals value, passed as a bound parameter so request
+        input never becomes part of the SQL. Returns None if the query fails.
+        """
+        try:
+            return self.airtable_multi_manager.sqlite_storage.find_rows_by_column(table_name, column, str(value))
+        except Exception as e:
+            print(f"SQL query error on table {table_name}: {e}")
+            return None
 
     def get_students_data_for_dashboard(self, classroom_id):
         # Retrieve the students for the classroom
-        students = self.get_student_by_class(classroom_id)
+        students = self.get_student_by_class(classroom_id) or []
+        return self.build_dashboard(students)
+
+    def build_dashboard(self, students):
+        """
+        Add each student's progress and current quest, current step and completed steps
+        to their row. The quests and all the steps needed are each read with one query,
+        however many students there are.
+
+        Returns:
+            dict with the frontend-ready 'quests' the students are on and the 'students'
+        """
+        storage = self.airtable_multi_manager.sqlite_storage
 
         # Collect unique quest IDs from students
         unique_quests = []
@@ -87,60 +127,44 @@ class StudentDataManager:
             if current_quest and current_quest not in unique_quests:
                 unique_quests.append(current_quest)
 
-        # Get quest data for the unique quests if any exist
+        # Get quest data for the unique quests if any exist, processed for frontend consumption
         quest_data = []
         if unique_quests:
-            ids_str = "', '".join(unique_quests)
-            sql = f"SELECT * FROM craffft_quests WHERE short_code IN ('{ids_str}')"
-            raw_quest_data = self.airtable_multi_manager.execute_sql_query('craffft_quests', sql) or []
-            
-            # Process quest data for frontend consumption
-            quest_data = process_quest_data_for_frontend(raw_quest_data)
+            quest_data = process_quest_data_for_frontend(storage.find_rows_by_values('craffft_quests', 'short_code', unique_quests))
+        quests_by_id = {quest.get('record_id'): quest for quest in quest_data}
 
-        # Process each student to add quest details
+        # Work out every student's current and completed steps, then read them all at once
+        student_steps = []
+        needed_step_ids = []
         for student in students:
             parsed_student = parse_database_row(student)
             current_quest_id = parsed_student.get('current_quest', '')
+            current_quest_obj = quests_by_id.get(current_quest_id) if current_quest_id else None
             current_step = parsed_student.get('current_step', '')
-            
+            completed_step_ids = []
+            if current_quest_obj:
+                # Completed steps are the ones before the current step in the quest
+                quest_steps = parse_database_row(current_quest_obj).get('steps', [])
+                if current_step and isinstance(quest_steps, list) and current_step in quest_steps:
+                    completed_step_ids = quest_steps[:quest_steps.index(current_step)]
+                needed_step_ids.extend(completed_step_ids + ([current_step] if current_step else []))
+            student_steps.append((parsed_student, current_quest_obj, current_step, completed_step_ids))
+        steps_by_id = {}
+        if needed_step_ids:
+            steps = storage.find_rows_by_values('craffft_steps', 'record_id', list(dict.fromkeys(needed_step_ids)))
+            steps_by_id = {step['record_id']: step for step in steps}
+
+        # Process each student to add quest details
+        for student, (parsed_student, current_quest_obj, current_step, completed_step_ids) in zip(students, student_steps):
             # Use stored progress percentage directly
             student['progress'] = parsed_student.get('quest_progress_percentage', '0')
-            
-            # Find and add current quest details
-            current_quest_obj = None
-            if current_quest_id:
-                current_quest_obj = next((obj for obj in quest_data if obj.get('record_id') == current_quest_id), None)
-            
+
             if current_quest_obj:
                 student['current_quest_name'] = current_quest_obj.get('quest_name', '')
                 student['current_quest_description'] = current_quest_obj.get('quest_description', '')
-                
-                # Get current step data if we have a current step
-                student['current_step_data'] = None
-                if current_step:
-                    step_manager = self.airtable_multi_manager.get_manager("craffft_steps")
-                    if step_manager:
-                        student['current_step_data'] = step_manager.get_row("record_id", current_step)
-                
-                # For completed steps, we can calculate them based on current step position
-                parsed_quest = parse_database_row(current_quest_obj)
-                quest_steps = parsed_quest.get('steps', [])
-                current_quest_completed_steps_info = []
-                
-                if current_step and isinstance(quest_steps, list) and current_step in quest_steps:
-                    current_step_index = quest_steps.index(current_step)
-                    completed_step_ids = quest_steps[:current_step_index]
-                    
-                    # Get step data for completed steps
-                    if completed_step_ids:
-                        step_manager = self.airtable_multi_manager.get_manager("craffft_steps")
-                        if step_manager:
-                            for step_id in completed_step_ids:
-                                step_info = step_manager.get_row("record_id", step_id)
-                                if step_info:
-                                    current_quest_completed_steps_info.append(step_info)
-                
-                student['current_quest_completed_steps'] = current_quest_completed_steps_info
+                student['current_step_data'] = steps_by_id.get(current_step) if current_step else None
+                student['current_quest_completed_steps'] = [steps_by_id[step_id] for step_id in completed_step_ids
+                                                            if step_id in steps_by_id]
             else:
                 student['current_quest_name'] = ''
                 student['current_quest_description'] = ''
@@ -153,13 +177,56 @@ class StudentDataManager:
         }
         return return_data
 
-    def get_teacher_data(self, classroom_id):
+    def get_teacher_dashboard(self, teacher_website_id):
+        """
+        Get the dashboard for every class a teacher has (their classroom_ids), as
+        get_students_data_for_dashboard gives for one class. All the classes' students
+        are read with one IN query and the quests and steps they need are read once.
+
+        Args:
+            teacher_website_id: The teacher's website_user_id
+
+        Returns:
+            dict with the teacher's details, the 'quests' any of their students are on and
+            one 'classes' section per classroom id with its classroom_id, class_name
+            (the students' current_class) and 'students'; None if the teacher isn't found
+        """
+        teacher = self.get_teacher_data(teacher_website_id)
+        if not teacher:
+            return None
+        classroom_ids = parse_database_row(teacher).get('classroom_ids', [])
+        if not isinstance(classroom_ids, list):
+            classroom_ids = []
+        # Students' current_class is "<teacher website id>><classroom id>", see /students/add
+        class_names = {str(classroom_id): f"{teacher_website_id}>{classroom_id}" for classroom_id in classroom_ids}
+
+        students = []
+        if class_names:
+            students = self.airtable_multi_manager.sqlite_storage.find_rows_by_values(
+                'craffft_students', 'current_class', list(class_names.values())
+            )
+        dashboard = self.build_dashboard(students)
+
+        return {
+            'teacher': {
+                'website_user_id': teacher_website_id,
+                'first_name': teacher.get('first_name', ''),
+                'last_name': teacher.get('last_name', '')
+            },
+            'quests': dashboard['quests'],
+            'classes': [{
+                'classroom_id': classroom_id,
+                'class_name': class_name,
+                'students': [student for student in dashboard['students'] if student.get('current_class') == class_name]
+            } for classroom_id, class_name in class_names.items()]
+        }
+
+    def get_teacher_data(self, teacher_website_id):
         """
-        Retrieve the teacher for the classroom using a direct SQL query.
+        Retrieve the teacher with the given website_user_id.
         Returns the first teacher found, or None if not found.
         """
-        sql = f"SELECT * FROM craffft_teachers WHERE website_user_id = '{classroom_id}'"
-        teachers = self.airtable_multi_manager.execute_sql_query('craffft_teachers', sql)
+        teachers = self._find_rows('craffft_teachers', 'website_user_id', teacher_website_id)
         if not teachers:
             return None
         return teachers[0]
@@ -169,8 +236,7 @@ class StudentDataManager:
         Retrieve a student's data by their ID.
         Returns the student data dict or None if not found.
         """
-        sql = f"SELECT * FROM craffft_students WHERE website_id = '{student_id}'"
-        students = self.airtable_multi_manager.execute_sql_query('craffft_students', sql)
+        students = self._find_rows('craffft_students', 'website_id', student_id)
         if not students:
             return None
         return students[0]
@@ -217,6 +283,41 @@ class StudentDataManager:
             print(f"Error in reset_student_quest: {str(e)}")
             return False
 
+    def reset_class_quest(self, class_name, new_quest=None):
+        """
+        Reset the quest-related fields of every student in a class, optionally setting a
+        new quest, as reset_student_quest does for one student. The class is read and all
+        its students updated with a single UPDATE in one transaction.
+
+        Args:
+            class_name: The students' current_class (e.g. "15>1")
+            new_quest: Optional new quest code to assign after reset
+
+        Returns:
+            List of the class's student rows as read before the reset, or None on error.
+            Students without a website_id are left unchanged.
+        """
+        storage = self.airtable_multi_manager.sqlite_storage
+        new_values = {
+            "current_quest": new_quest if new_quest is not None else "",
+            "current_step": "",
+            "quest_progress_percentage": "0"
+        }
+
+        def reset(conn):
+            students = storage.select_rows(conn, "craffft_students", "current_class", [class_name], for_update=True)
+            website_ids = [student["website_id"] for student in students if student.get("website_id")]
+            storage.set_columns(conn, "craffft_students", "website_id", website_ids, new_values)
+            return students
+
+        try:
+            students = storage.run_transaction(reset)
+            print(f"Quest fields reset{f' and new quest {new_quest!r} assigned' if new_quest else ''} for {len(students)} students in class {class_name}")
+            return students
+        except Exception as e:
+            print(f"Error in reset_class_quest: {str(e)}")
+            return None
+
     def add_completed_quest_for_student(self, website_id, quest_code):
         """
         Add a quest to a student's completed_quests list.
@@ -267,10 +368,80 @@ class StudentDataManager:
         sql = f"SELECT * FROM craffft_students WHERE current_class = '{classroom_id}'"
         return self.airtable_multi_manager.execute_sql_query('craffft_students', sql    )
 
+    @staticmethod
+    def plan_step_transition(student_row, new_current_step, step_quest_id, quest_row, allow_quest_update=True):
+        """
+        Work out a student's move to new_current_step without touching the database:
+        the quest change, the new progress and, on the quest's last step, completing
+        the quest (added to completed_quests once, then the quest fields are reset).
+        
+        Args:
+            student_row: The student's craffft_students row
+            new_current_step: Step the student moves to
+            step_quest_id: craffft_quest_id of that step, or None if the step doesn't exist
+            quest_row: craffft_quests row of step_quest_id, if found
+            allow_quest_update: Whether the step may move the student to another quest
+        
+        Returns:
+            Tuple of (result in the shape returned by update_step_and_check_quest, column -> new value)
+        """
+        if not step_quest_id:
+            return {
+                "success": False,
+                "error": f"No quest found for step {new_current_step} in craffft_steps table"
+            }, {}
+
+        parsed_student = parse_database_row(student_row)
+        old_current_quest = parsed_student.get("current_quest", "") or ""
+        if not allow_quest_update and step_quest_id != old_current_quest:
+            return {
+                "success": False,
+                "error": f"Step {new_current_step} belongs to quest {step_quest_id} which is not the student's current quest {old_current_quest}. Quest updates are disabled."
+            }, {}
+
+        changes = {"current_step": new_current_step}
+        current_quest = old_current_quest
+        quest_changed = False
+        if step_quest_id != old_current_quest:
+            changes["current_quest"] = current_quest = step_quest_id
+            quest_changed = True
+
+        quest_completed = False
+        if quest_row:
+            changes["quest_progress_percentage"] = StudentDataManager.get_progress(
+                dict(student_row, current_step=new_current_step), quest_row
+            )
+            # Reaching the quest's last step completes it
+            quest_steps = parse_database_row(quest_row).get('steps', [])
+            if isinstance(quest_steps, list) and quest_steps and new_current_step == quest_steps[-1]:
+                print(f"Quest {current_quest} completed for student {parsed_student.get('website_id')} - reached last step {new_current_step}")
+                completed_quests = parsed_student.get("completed_quests", [])
+                if not isinstance(completed_quests, list):
+                    completed_quests = []
+                if current_quest not in completed_quests:
+                    changes["completed_quests"] = completed_quests + [current_quest]
+                changes.update(current_quest="", current_step="", quest_progress_percentage="0")
+                current_quest = ""
+                quest_completed = True
+
+        return {
+            "success": True,
+            "current_step": new_current_step,
+            "current_quest": current_quest,
+            "quest_changed": quest_changed,
+            "quest_completed": quest_completed
+        }, changes
+
     def update_step_and_check_quest(self, website_id, new_current_step, allow_quest_update=True):
         """
         Update student's current step and check if quest changed
         
+        The student is read, the step and quest looked up and the new step, quest,
+        progress and completion written in one transaction. The write only applies if
+        the student's quest fields are unchanged since they were read (and the row is
+        locked on Postgres), so concurrent updates for one student can't lose a
+        completion or complete a quest twice; a conflicting update is retried.
+        
         Args:
             website_id: Student's website ID
             new_current_step: New current step to set
@@ -281,121 +452,81 @@ class StudentDataManager:
                 - current_step: Current step after update
                 - current_quest: Current quest ID  
                 - quest_changed: Boolean if quest was changed
+                - quest_completed: Boolean if the step completed the quest
                 - success: Boolean if operation succeeded
                 - error: Error message if operation failed
         """
-        try:
-            # Get step manager
-            step_manager = self.airtable_multi_manager.get_manager("craffft_steps")
+        return self.update_steps_and_check_quests([(website_id, new_current_step)], allow_quest_update)[0]
 
-            # Get current student data
-            student_row = self.student_table.get_row("website_id", website_id)
-            if not student_row:
-                return {
-                    "success": False,
-                    "error": f"No student found with website_id: {website_id}"
-                }
-
-            # Get current quest and step from craffft_students 
-            parsed_student = parse_database_row(student_row)
-            old_current_step = parsed_student.get("current_step", "")
-            old_current_quest = parsed_student.get("current_quest", "")
-            current_quest = old_current_quest if old_current_quest else ""
-            
-            # Use get_value_by_row_and_column to look up the quest for this step
-            step_quest_id = step_manager.get_value_by_row_and_column("name", new_current_step, "craffft_quest_id")
-            if not step_quest_id:
-                return {
-                    "success": False,
-                    "error": f"No quest found for step {new_current_step} in craffft_steps table"
-                }
+    def update_steps_and_check_quests(self, updates, allow_quest_update=True):
+        """
+        Apply many step updates at once, as update_step_and_check_quest does for one.
+        
+        The students, steps and quests are each read with one IN query and every
+        transition is written in a single transaction. Updates are applied in order, so
+        a student listed twice moves through both steps. If any student changed since it
+        was read, the whole batch is rolled back and retried.
+        
+        Args:
+            updates: List of (website_id, new_current_step) pairs
+            allow_quest_update: Whether to allow quest updates (default True)
+        
+        Returns:
+            List with one result per update, in order, each shaped like update_step_and_check_quest's
+        """
+        if not updates:
+            return []
+        storage = self.airtable_multi_manager.sqlite_storage
 
-            quest_changed = False
-            if allow_quest_update:
-                # Update current_step and allow quest changes
-                success = self.student_table.modify_field("website_id", website_id, "current_step", new_current_step)
-                current_step = new_current_step
-
-                # Check if quest needs to be updated
-                if step_quest_id != old_current_quest:
-                    # Quest has changed, update the current_quest
-                    new_current_quest = step_quest_id  # Replace with new quest (string)
-                    success = self.student_table.modify_field("website_id", website_id, "current_quest", new_current_quest)
-                    if success:
-                        current_quest = new_current_quest
-                        quest_changed = True
-            else:
-                # Quest update not allowed - validate that step belongs to current quest
-                if step_quest_id != old_current_quest:
-                    return {
-                        "success": False,
-                        "error": f"Step {new_current_step} belongs to quest {step_quest_id} which is not the student's current quest {old_current_quest}. Quest updates are disabled."
-                    }
+        def transitions(conn):
+            students = storage.select_rows(conn, "craffft_students", "website_id",
+                                           list(dict.fromkeys(website_id for website_id, _ in updates)), for_update=True)
+            students_by_id = {str(student["website_id"]): student for student in students}
+            steps = storage.select_rows(conn, "craffft_steps", "name", list(dict.fromkeys(step for _, step in updates)))
+            step_quests = {step["name"]: step.get("craffft_quest_id") for step in steps}
+            quests = storage.select_rows(conn, "craffft_quests", "short_code",
+                                         [quest_id for quest_id in set(step_quests.values()) if quest_id])
+            quests_by_code = {quest["short_code"]: quest for quest in quests}
 
-                # Step is valid for current quest, update current_step only
-                success = self.student_table.modify_field("website_id", website_id, "current_step", new_current_step)
-                if not success:
-                    return {
+            results = []
+            for website_id, new_current_step in updates:
+                student_row = students_by_id.get(str(website_id))
+                if student_row is None:
+                    results.append({
                         "success": False,
-                        "error": f"Failed to update current_step for student with website_id: {website_id}"
-                    }
-                current_step = new_current_step
-
-            # Update quest progress percentage and check for quest completion after step/quest changes
-            quest_completed = False
-            try:
-                quest_manager = self.airtable_multi_manager.get_manager("craffft_quests")
-                if quest_manager and current_quest:
-                    # Get the current quest object
-                    current_quest_obj = quest_manager.get_row("short_code", current_quest)
-                    if current_quest_obj:
-                        # Get updated student data for progress calculation
-                        updated_student = self.student_table.get_row("website_id", website_id)
-                        # Calculate new progress
-                        new_progress = StudentDataManager.get_progress(updated_student, current_quest_obj)
-                        # Update progress in database
-                        self.student_table.modify_field("website_id", website_id, "quest_progress_percentage", new_progress)
-                        
-                        # Check if quest is completed by checking if student is on the last step
-                        parsed_quest = parse_database_row(current_quest_obj)
-                        quest_steps = parsed_quest.get('steps', [])
-                        
-                        if isinstance(quest_steps, list) and quest_steps and new_current_step:
-                            # Check if the current step is the last step in the quest
-                            last_step_id = quest_steps[-1]  # Get the last step ID from the ordered list
-                            if new_current_step == last_step_id:
-                                quest_completed = True
-                                print(f"Quest {current_quest} completed for student {website_id} - reached last step {new_current_step}")
-                                
-                                # First, add the quest to completed quests
-                                add_success = self.add_completed_quest_for_student(website_id, current_quest)
-                                
-                                # Then reset all quest fields
-                                reset_success = self.reset_student_quest(website_id)
-                                
-                                if add_success and reset_success:
-                                    current_quest = ""  # Update local variable for return value
-                                else:
-                                    print(f"Warning: Failed to properly complete quest for student {website_id}")
-                                    quest_completed = False
-                            
-            except Exception as e:
-                print(f"Warning: Failed to update quest progress: {e}")
-                # Don't fail the whole operation if progress update fails
+                        "error": f"No student found with website_id: {website_id}"
+                    })
+                    continue
+                step_quest_id = step_quests.get(new_current_step)
+                result, changes = self.plan_step_transition(student_row, new_current_step, step_quest_id,
+                                                            quests_by_code.get(step_quest_id), allow_quest_update)
+                if result["success"]:
+                    missing = [col for col in changes if col not in student_row]
+                    if missing:
+                        storage.add_columns(conn, "craffft_students", missing)
+                        for row in students_by_id.values():
+                            row.update(dict.fromkeys(missing))
+                    expected = {col: student_row[col] for col in self.TRANSITION_COLUMNS if col in student_row}
+                    if not storage.compare_and_set(conn, "craffft_students", "website_id", student_row["website_id"],
+                                                   expected, changes):
+                        # Roll back the transitions already written and start the batch again
+                        raise StepTransitionConflict(website_id)
+                    # Later updates for the same student start from this one
+                    student_row.update({col: json.dumps(value) if isinstance(value, (list, dict)) else value
+                                        for col, value in changes.items()})
+                results.append(result)
+            return results
 
-            return {
-                "success": True,
-                "current_step": current_step,
-                "current_quest": current_quest,
-                "quest_changed": quest_changed,
-                "quest_completed": quest_completed
-            }
-            
+        try:
+            for _ in range(self.MAX_TRANSITION_ATTEMPTS):
+                try:
+                    return storage.run_transaction(transitions)
+                except StepTransitionConflict as conflict:
+                    website_id = conflict.website_id
+            error = f"Student {website_id} kept changing during the update, try again"
         except Exception as e:
-            return {
-                "success": False,
-                "error": f"Unexpected error: {str(e)}"
-            }
+            error = f"Unexpected error: {str(e)}"
+        return [{"success": False, "error": error} for _ in updates]
 
     def add_classes_to_teacher_by_website_id(self, teacher_website_id: str, new_classes: set) -> dict:
         """
@@ -464,9 +595,6 @@ class StudentDataManager:
             )
             
             if success:
-                # Mark table as modified for Airtable sync
-                self.airtable_multi_manager.mark_table_as_modified("craffft_teachers")
-                
                 return {
                     "success": True,
                     "message": f"Successfully added {len(classes_to_add)} classes to teacher",
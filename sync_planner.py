@@ -0,0 +1,206 @@
+import math
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+from utilities import load_env
+
+
+class AdaptiveSyncPlanner:
+    """
+    Decides when each table is uploaded to and downloaded from Airtable, based on
+    how often it is written locally.
+
+    Each tick, new change journal entries are counted per table and folded into an
+    exponentially smoothed change rate (changes/hour). Hot tables get short upload and
+    download intervals, cold tables back off towards the maximum. Every run is charged
+    against an hourly Airtable call budget; work that doesn't fit waits for the next
+    tick, hottest tables first.
+
+    The rates and last run times are kept in the table_sync_state table, so another
+    worker can pick up where this one left off. Calls are charged in the
+    sync_call_charges table, so one budget covers every worker on the database.
+    """
+    # Aim for roughly this many changed rows per incremental upload
+    TARGET_CHANGES_PER_UPLOAD = 50
+    # Download a table this many times less often than it would be uploaded
+    DOWNLOAD_INTERVAL_FACTOR = 10
+    # Seconds for the smoothed change rate to halve when a table goes quiet
+    RATE_HALF_LIFE = 3600
+
+    def __init__(self, multi_manager, calls_per_hour: Optional[float] = None,
+                 min_upload_interval: float = 60, max_upload_interval: float = 24 * 60 * 60,
+                 min_download_interval: float = 15 * 60, max_download_interval: float = 24 * 60 * 60):
+        """
+        Args:
+            multi_manager: AirtableMultiManager whose tables are scheduled
+            calls_per_hour: Airtable call budget for planned runs (SYNC_CALL_BUDGET_PER_HOUR, default 3600)
+            min_upload_interval / max_upload_interval: Bounds on seconds between uploads of a table
+            min_download_interval / max_download_interval: Bounds on seconds between downloads of a table
+        """
+        self.multi_manager = multi_manager
+        self.storage = multi_manager.sqlite_storage
+        if calls_per_hour is None:
+            calls_per_hour = float(load_env('SYNC_CALL_BUDGET_PER_HOUR', '3600'))
+        self.calls_per_hour = calls_per_hour
+        self.min_upload_interval = min_upload_interval
+        self.max_upload_interval = max_upload_interval
+        self.min_download_interval = min_download_interval
+        self.max_download_interval = max_download_interval
+
+    # --- Change rates ---
+
+    def observe_changes(self, now: Optional[datetime] = None) -> Dict[str, dict]:
+        """
+        Fold journal entries written since the last observation into each table's change rate.
+
+        Returns:
+            The updated sync state of every managed table, keyed by table name
+        """
+        now = now or datetime.utcnow()
+        states = self.storage.get_table_sync_states()
+        for table_name in self.multi_manager.get_available_tables():
+            state = states.get(table_name, {"change_rate": 0.0, "last_change_id": 0, "rate_updated_at": None,
+                                            "last_upload_at": None, "last_download_at": None})
+            count, newest_id = self.storage.count_changes_since(table_name, state["last_change_id"])
+            previous = state["rate_updated_at"]
+            if previous is None:
+                # First sight of the table: count what's pending as an hour's worth of changes
+                rate = float(count)
+            else:
+                elapsed = max((now - previous).total_seconds(), 1.0)
+                decay = 0.5 ** (elapsed / self.RATE_HALF_LIFE)
+                rate = state["change_rate"] * decay + (count * 3600 / elapsed) * (1 - decay)
+            state.update(change_rate=rate, last_change_id=newest_id, rate_updated_at=now)
+            self.storage.save_table_sync_state(table_name, change_rate=rate, last_change_id=newest_id, rate_updated_at=now)
+            states[table_name] = state
+        return states
+
+    def upload_interval(self, change_rate: float) -> float:
+        if change_rate <= 0:
+            return self.max_upload_interval
+        interval = self.TARGET_CHANGES_PER_UPLOAD / change_rate * 3600
+        return min(self.max_upload_interval, max(self.min_upload_interval, interval))
+
+    def download_interval(self, change_rate: float) -> float:
+        interval = self.upload_interval(change_rate) * self.DOWNLOAD_INTERVAL_FACTOR
+        return min(self.max_download_interval, max(self.min_download_interval, interval))
+
+    # --- Planning ---
+
+    def estimate_calls(self, kind: str, table_name: str) -> int:
+        """
+        Estimate the Airtable calls an upload or download of a table will make.
+        """
+        if kind == 'download':
+            return max(1, math.ceil(self.storage.count_rows(table_name) / 100))
+        changes = self.storage.get_pending_changes(table_name)
+        if any(change["key_column"] is None for change in changes):
+            # Full replace: list existing records, then delete and insert in batches of 10
+            rows = self.storage.count_rows(table_name)
+            return math.ceil(rows / 100) + 2 * math.ceil(rows / 10) + 1
+        keys = {(change["key_column"], change["key_value"]) for change in changes}
+        # Record id lookups in chunks of 50, then batches of 10
+        return 2 * math.ceil(len(keys) / 50) + math.ceil(len(keys) / 10) + 1
+
+    def plan(self, states: Dict[str, dict], now: Optional[datetime] = None) -> List[dict]:
+        """
+        Work out which uploads and downloads are due, hottest tables first.
+        Uploads are due once a table with pending changes has waited its upload interval;
+        downloads only run for tables with nothing waiting to upload.
+        """
+        now = now or datetime.utcnow()
+        modified_tables = set(self.multi_manager.get_modified_tables())
+        due = []
+        for table_name, state in states.items():
+            if table_name not in self.multi_manager.managers:
+                continue
+            rate = state["change_rate"]
+            if table_name in modified_tables:
+                kind, interval, last_run = 'upload', self.upload_interval(rate), state["last_upload_at"]
+            else:
+                kind, interval, last_run = 'download', self.download_interval(rate), state["last_download_at"]
+            waited = (now - last_run).total_seconds() if last_run else None
+            if waited is None and kind == 'download':
+                # Start the download clock rather than re-downloading every table on first sight
+                self.storage.save_table_sync_state(table_name, last_download_at=now)
+                continue
+            if waited is not None and waited < interval:
+                continue
+            due.append({"kind": kind, "table_name": table_name, "change_rate": round(rate, 2), "interval": round(interval)})
+        # Hot tables first, and uploads (local changes at risk) before downloads
+        due.sort(key=lambda task: (task["kind"] != 'upload', -task["change_rate"]))
+        return due
+
+    # --- Budget ---
+
+    def calls_spent(self) -> int:
+        """
+        Airtable calls charged to the budget in the last hour, by any worker.
+        """
+        return self.storage.count_sync_calls_since(datetime.utcnow() - timedelta(hours=1))
+
+    def record_calls(self, calls: int):
+        """
+        Charge calls made outside the planner (e.g. write-behind flushes) to the hourly budget.
+        """
+        if calls > 0:
+            self.storage.record_sync_calls(calls)
+
+    def total_calls(self) -> int:
+        """
+        Airtable calls made by this process so far, from the client's metrics.
+        """
+        return sum(stats["calls"] for stats in self.multi_manager.get_airtable_metrics().values())
+
+    # --- Running ---
+
+    def run_due(self) -> Dict[str, str]:
+        """
+        Observe change rates and run every due upload/download that fits in the call budget.
+
+        Returns:
+            Dictionary of "<kind> <table>" -> status message, including deferred work
+        """
+        now = datetime.utcnow()
+        states = self.observe_changes(now)
+        results = {}
+        for task in self.plan(states, now):
+            label = f"{task['kind']} {task['table_name']}"
+            estimate = self.estimate_calls(task["kind"], task["table_name"])
+            remaining = self.calls_per_hour - self.calls_spent()
+            if estimate > remaining:
+                results[label] = f"Deferred: needs ~{estimate} calls, {max(0, int(remaining))} left in the hourly budget"
+                continue
+
+            calls_before = self.total_calls()
+            try:
+                if task["kind"] == 'upload':
+                    result = self.multi_manager.upload_table_to_airtable(task["table_name"])
+                else:
+                    result = self.multi_manager.update_database_from_airtable(task["table_name"])
+            except Exception as e:
+                result = f"Error: {str(e)}"
+            self.record_calls(self.total_calls() - calls_before)
+
+            if result and not str(result).startswith(("Error", "Failed")):
+                column = "last_upload_at" if task["kind"] == 'upload' else "last_download_at"
+                self.storage.save_table_sync_state(task["table_name"], **{column: datetime.utcnow()})
+            results[label] = result or "Failed"
+        return results
+
+    def get_status(self) -> dict:
+        """
+        Get each table's change rate, current intervals and last runs, plus the call budget.
+        """
+        tables = {}
+        for table_name, state in self.storage.get_table_sync_states().items():
+            tables[table_name] = {
+                "change_rate_per_hour": round(state["change_rate"], 2),
+                "upload_interval_seconds": round(self.upload_interval(state["change_rate"])),
+                "download_interval_seconds": round(self.download_interval(state["change_rate"])),
+                "last_upload_at": state["last_upload_at"].isoformat() if state["last_upload_at"] else None,
+                "last_download_at": state["last_download_at"].isoformat() if state["last_download_at"] else None
+            }
+        return {
+            "calls_per_hour_budget": self.calls_per_hour,
+            "tables": tables
+        }
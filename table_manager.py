@@ -1,29 +1,105 @@
 import os
-from airtable import Airtable
 import csv
+import hashlib
 import io
 import json
-from typing import Optional
+import re
+from typing import Optional, TYPE_CHECKING
 from sqlite_storage import SQLiteStorage
 from utilities import convert_value_for_airtable, parse_database_row
 
+if TYPE_CHECKING:
+    from airtable_client import AirtableClient
+
+# Airtable record ids, as stored locally in the record_id (RECORD_ID() formula) column
+AIRTABLE_RECORD_ID_PATTERN = re.compile(r'^rec[A-Za-z0-9]{14}$')
+
 class TableManager:
-    def __init__(self, base_id, table_name, api_key, sqlite_storage: Optional[SQLiteStorage] = None):
+    def __init__(self, base_id, table_name, api_key, sqlite_storage: Optional[SQLiteStorage] = None, airtable_client: Optional['AirtableClient'] = None):
         self.base_id = base_id
         self.table_name = table_name
         self.api_key = api_key
         self.sqlite_storage = sqlite_storage
-        self.has_updates = False  # Track if any updates have been made
+        self._airtable_client = airtable_client
+
+    @property
+    def airtable_client(self) -> 'AirtableClient':
+        """
+        All Airtable calls go through the shared, rate limited client for this base,
+        created (and requests imported) on first use rather than at startup.
+        """
+        if self._airtable_client is None:
+            from airtable_client import get_airtable_client
+            self._airtable_client = get_airtable_client(self.api_key, self.base_id)
+        return self._airtable_client
+
+    @property
+    def has_updates(self) -> bool:
+        """
+        True if this table has journaled changes waiting to be uploaded to Airtable.
+        """
+        if not self.sqlite_storage:
+            return False
+        return self.sqlite_storage.has_pending_changes(self.table_name)
 
     # Fetch data from Airtable and store in SQLite using csv writer
     def update_database_from_airtable(self, force_delete=True):
         # Note: Ideally this would be done with a dictwriter, but I cant seem to get it to work
 
-        airtable = Airtable(self.base_id, self.table_name, self.api_key)
+        # Changes journaled up to here are superseded by the download; later ones must survive it
+        journal_up_to_id = 0
+        if self.sqlite_storage:
+            _, journal_up_to_id = self.sqlite_storage.count_changes_since(self.table_name, 0)
+
+        airtable = self.airtable_client.table(self.table_name)
         records = airtable.get_all()
+        content_hash = self.records_hash(records)
         if not records:
-            return None
+            # Nothing to import, but the download itself worked: record it like any other sync
+            if self.sqlite_storage:
+                self.sqlite_storage.save_content_hash(self.table_name, content_hash)
+            return f"Skipped: {self.table_name} has no records in Airtable."
+        if self.sqlite_storage and self._matches_last_sync(content_hash):
+            return f"Skipped: {self.table_name} is unchanged in Airtable since the last sync."
+
+        csv_data = self._records_to_csv(records)
 
+        # Store in SQLite only
+        if self.sqlite_storage:
+            # Drop the existing table first if force_delete is True (default behavior)
+            if not self.sqlite_storage.replace_table_from_airtable(self.table_name, csv_data, journal_up_to_id,
+                                                                   drop_table=force_delete):
+                return f"Skipped: {self.table_name} changed locally during the download; it will be uploaded first."
+            self.sqlite_storage.save_content_hash(self.table_name, content_hash)
+
+        return f"Successfully updated DB from Airtable for table {self.table_name}."
+
+    @staticmethod
+    def records_hash(records) -> str:
+        """
+        Stable hash of Airtable records: independent of record order and field order.
+        """
+        digest = hashlib.sha256()
+        for record in sorted(records, key=lambda record: record['id']):
+            digest.update(json.dumps([record['id'], record['fields']], sort_keys=True, default=str).encode())
+            digest.update(b'\n')
+        return digest.hexdigest()
+
+    def _matches_last_sync(self, content_hash: str) -> bool:
+        """
+        True if the local table is still exactly what the last sync imported from
+        records with this hash: same hash, no local changes since, table still there.
+        """
+        if self.sqlite_storage.get_content_hash(self.table_name) != content_hash:
+            return False
+        if self.sqlite_storage.has_pending_changes(self.table_name):
+            return False
+        return bool(self.sqlite_storage.get_table_columns(self.table_name))
+
+    def _records_to_csv(self, records) -> str:
+        """
+        Flatten Airtable records into CSV text, the form sync imports into the database.
+        """
         fieldnames = set()
         for record in records:
             fieldnames.update(record['fields'].keys())
@@ -41,15 +117,70 @@ class TableManager:
 
         csv_data = output.getvalue()
         output.close()
+        return csv_data
 
-        # Store in SQLite only
-        if self.sqlite_storage:
-            # Delete the existing table if force_delete is True (default behavior)
-            if force_delete:
-                self.sqlite_storage.delete_table(self.table_name)
-            self.sqlite_storage.import_csv_rows(self.table_name, csv_data)
+    def apply_airtable_changes(self, changed_record_ids, destroyed_record_ids, chunk_size: int = 50) -> str:
+        """
+        Bring specific records up to date from Airtable instead of pulling the whole table,
+        e.g. for the records named in webhook payloads.
+        Changed records are fetched by id and converted the same way as a full sync, then
+        upserted on record_id; destroyed records are deleted. Records with local changes
+        still waiting to be uploaded are left alone, since the upload will overwrite them.
+        
+        Args:
+            changed_record_ids: Airtable ids of created or changed records
+            destroyed_record_ids: Airtable ids of deleted records
+            chunk_size: Record ids fetched per request
+        
+        Returns:
+            Status message
+        """
+        if not self.sqlite_storage:
+            return "Error: No database configured"
+        pending = self.sqlite_storage.get_pending_changes(self.table_name)
+        if any(change["key_column"] is None for change in pending):
+            return f"Skipped: {self.table_name} is waiting for a full upload"
 
-        return f"Successfully updated DB from Airtable for table {self.table_name}."
+        key_column = SQLiteStorage.JOURNAL_KEY_COLUMN
+        local_columns = self.sqlite_storage.get_table_columns(self.table_name)
+        if key_column not in local_columns:
+            # Without record ids stored locally the changed rows can't be matched, so pull the table
+            if pending:
+                return f"Skipped: {self.table_name} has no {key_column} column and has pending changes"
+            return self.update_database_from_airtable() or "Failed to update"
+
+        pending_keys = {(change["key_column"], change["key_value"]) for change in pending}
+        pending_columns = {column for column, _ in pending_keys}
+        airtable = self.airtable_client.table(self.table_name)
+        changed_record_ids = sorted(set(changed_record_ids) - set(destroyed_record_ids))
+        records = []
+        for i in range(0, len(changed_record_ids), chunk_size):
+            chunk = changed_record_ids[i:i+chunk_size]
+            formula = "OR(%s)" % ','.join(f"RECORD_ID()='{record_id}'" for record_id in chunk)
+            records.extend(airtable.get_all(formula=formula))
+
+        rows = []
+        skipped = 0
+        if records:
+            parsed = list(csv.DictReader(io.StringIO(self._records_to_csv(records))))
+            columns = list(dict.fromkeys(local_columns + list(parsed[0].keys())))
+            for record, row in zip(records, parsed):
+                # Airtable leaves empty fields out, so anything missing was cleared
+                row = {col: row.get(col, '') for col in columns}
+                row[key_column] = row.get(key_column) or record['id']
+                if any((col, row.get(col, '')) in pending_keys for col in pending_columns):
+                    skipped += 1
+                    continue
+                rows.append(row)
+
+        updated, inserted = self.sqlite_storage.upsert_rows(self.table_name, rows, key_column)
+        deleted = self.sqlite_storage.delete_rows(self.table_name, key_column, list(destroyed_record_ids))
+        # The table no longer matches a full sync's records
+        self.sqlite_storage.save_content_hash(self.table_name, None)
+        message = f"Applied Airtable changes to {self.table_name} ({updated} updated, {inserted} inserted, {deleted} deleted"
+        if skipped:
+            message += f", {skipped} skipped with pending local changes"
+        return message + ")"
 
 
     def get_row(self, column_containing_reference: str, reference_value: str):
@@ -104,10 +235,8 @@ class TableManager:
         updated = False
 
         if self.sqlite_storage:
+            # The storage layer records the change in the journal in the same transaction
             updated = self.sqlite_storage.modify_field(self.table_name, column_containing_reference, reference_value, target_column, new_value)
-        
-        if updated:
-            self.has_updates = True
 
         return updated
 
@@ -126,12 +255,15 @@ class TableManager:
 
     def upload_to_airtable(self) -> Optional[str]:
         """
-        
+        Replace the whole Airtable table with the local table.
+        Use upload_changes_to_airtable to upload only journaled changes.
         """
         try:
             if not self.sqlite_storage:
                 return "Error: No SQLite storage configured"
             
+            pending_changes = self.sqlite_storage.get_pending_changes(self.table_name)
+            
             # Get all records from local database
             sql = f"SELECT * FROM \"{self.table_name}\""
             records = self.sqlite_storage.execute_sql_query(self.table_name, sql)
@@ -139,16 +271,17 @@ class TableManager:
             if not records:
                 return "No records found to upload"
             
-            airtable = Airtable(self.base_id, self.table_name, self.api_key)
+            airtable = self.airtable_client.table(self.table_name)
+            executor = self.airtable_client.batch_executor(self.table_name)
             
             # Delete all existing records
             existing_records = airtable.get_all()
             if existing_records:
                 record_ids = [record['id'] for record in existing_records]
-                for i in range(0, len(record_ids), 10):
-                    batch = record_ids[i:i+10]
-                    airtable.batch_delete(batch)
-                print(f"Deleted {len(record_ids)} existing records")
+                delete_report = executor.delete(record_ids)
+                if delete_report['failed_batches']:
+                    return self._batch_failure_message(delete_report)
+                print(f"Deleted {delete_report['records']} existing records ({delete_report['records_per_second']} records/sec)")
             
             # Upload new records (smart conversion for lists and numbers)
             upload_records = []
@@ -160,19 +293,280 @@ class TableManager:
                         clean_record[k] = converted_value
                 upload_records.append(clean_record)
             
-            # Upload in batches
-            uploaded_count = 0
-            for i in range(0, len(upload_records), 10):
-                batch = upload_records[i:i+10]
-                result = airtable.batch_insert(batch)
-                if result:
-                    uploaded_count += len(result)
+            # Upload in concurrent batches
+            insert_report = executor.insert(upload_records)
+            if insert_report['failed_batches']:
+                return self._batch_failure_message(insert_report)
+            
+            # Everything journaled before the upload started is now in Airtable
+            if pending_changes:
+                self.sqlite_storage.clear_changes(self.table_name, up_to_id=pending_changes[-1]['id'])
             
-            return f"Success: Replaced {self.table_name} with {uploaded_count} records"
+            return (f"Success: Replaced {self.table_name} with {insert_report['records']} records "
+                    f"({insert_report['records_per_second']} records/sec)")
             
         except Exception as e:
             return f"Error: {str(e)}"
 
+    def upload_changes_to_airtable(self) -> Optional[str]:
+        """
+        Upload only the rows recorded in the change journal to Airtable.
+        Repeated changes to the same row are coalesced, rows that still exist locally
+        are updated (or inserted if Airtable doesn't have them) and rows that no
+        longer exist locally are deleted. Falls back to a full upload if the whole
+        table has been marked as modified.
+        """
+        try:
+            if not self.sqlite_storage:
+                return "Error: No SQLite storage configured"
+            
+            pending_changes = self.sqlite_storage.get_pending_changes(self.table_name)
+            if not pending_changes:
+                return "No changes to upload"
+            last_change_id = pending_changes[-1]['id']
+            
+            if any(change['key_column'] is None for change in pending_changes):
+                return self.upload_to_airtable()
+            
+            # Coalesce changes per row: None means the whole row needs sending
+            changed_rows = {}
+            for change in pending_changes:
+                key = (change['key_column'], change['key_value'])
+                if change['operation'] == 'insert':
+                    changed_rows[key] = None
+                elif changed_rows.get(key, set()) is not None:
+                    changed_rows.setdefault(key, set()).update(change['changed_columns'])
+            
+            # Work out what Airtable needs from the current local state of each row
+            upserts = []  # (lookup_column, lookup_value, row, columns)
+            deletes = []  # (lookup_column, lookup_value)
+            for (key_column, key_value), columns in changed_rows.items():
+                local_rows = self.sqlite_storage.find_rows_by_column(self.table_name, key_column, key_value)
+                if not local_rows:
+                    deletes.append((key_column, key_value))
+                    continue
+                for row in local_rows:
+                    if row.get('record_id'):
+                        upserts.append(('record_id', row['record_id'], row, columns))
+                    else:
+                        upserts.append((key_column, key_value, row, columns))
+            
+            airtable = self.airtable_client.table(self.table_name)
+            lookups = [(column, value) for column, value, _, _ in upserts] + deletes
+            airtable_ids = self._find_airtable_record_ids(airtable, lookups)
+            
+            update_records = []
+            insert_records = []
+            for lookup_column, lookup_value, row, columns in upserts:
+                record_ids = airtable_ids.get((lookup_column, str(lookup_value)), [])
+                if record_ids:
+                    # Cleared values are sent as None so Airtable clears them too
+                    update_columns = row.keys() if columns is None else columns
+                    fields = {column: convert_value_for_airtable(row.get(column)) for column in update_columns}
+                    update_records.extend({'id': record_id, 'fields': fields} for record_id in record_ids)
+                else:
+                    # Not in Airtable yet, so send the whole row
+                    fields = {k: convert_value_for_airtable(v) for k, v in row.items()}
+                    insert_records.append({k: v for k, v in fields.items() if v is not None})
+            
+            delete_ids = []
+            for lookup_column, lookup_value in deletes:
+                delete_ids.extend(airtable_ids.get((lookup_column, str(lookup_value)), []))
+            
+            # Send 10-record batches concurrently within the rate budget
+            executor = self.airtable_client.batch_executor(self.table_name)
+            reports = []
+            if update_records:
+                reports.append(executor.update(update_records))
+            if insert_records:
+                reports.append(executor.insert(insert_records))
+            if delete_ids:
+                reports.append(executor.delete(delete_ids))
+            
+            failed_reports = [report for report in reports if report['failed_batches']]
+            if failed_reports:
+                # Keep the journal so the failed rows are retried on the next upload
+                return self._batch_failure_message(*failed_reports)
+            
+            self.sqlite_storage.clear_changes(self.table_name, up_to_id=last_change_id)
+            
+            sent = sum(report['records'] for report in reports)
+            seconds = sum(report['seconds'] for report in reports)
+            records_per_second = round(sent / seconds, 1) if seconds > 0 else sent
+            return (f"Success: Uploaded {len(changed_rows)} changed rows for {self.table_name} "
+                    f"({len(update_records)} updated, {len(insert_records)} inserted, {len(delete_ids)} deleted, "
+                    f"{records_per_second} records/sec)")
+            
+        except Exception as e:
+            return f"Error: {str(e)}"
+
+    def flush_row_updates(self) -> str:
+        """
+        Write-behind flush: send journaled field updates straight to Airtable.
+        Repeated updates to a record are coalesced into one, and records are sent as
+        10-record batch updates addressed by the Airtable id stored in the local
+        record_id column, so no lookup requests are needed.
+        Inserts, deletes, rows without a stored Airtable id and failed batches stay in
+        the journal for the next upload_changes_to_airtable.
+        
+        Returns:
+            Status message
+        """
+        if not self.sqlite_storage:
+            return "Error: No SQLite storage configured"
+        pending_changes = self.sqlite_storage.get_pending_changes(self.table_name)
+        if any(change['key_column'] is None for change in pending_changes):
+            return f"Skipped: {self.table_name} is waiting for a full upload"
+        
+        # Rows with inserts or deletes need the full upload path
+        entries_by_key = {}
+        structural_keys = set()
+        for change in pending_changes:
+            key = (change['key_column'], change['key_value'])
+            entries_by_key.setdefault(key, []).append(change)
+            if change['operation'] != 'update':
+                structural_keys.add(key)
+        
+        fields_by_id = {}  # Airtable id -> fields to send
+        keys_by_id = {}  # Airtable id -> journal keys it covers
+        for key, entries in entries_by_key.items():
+            if key in structural_keys:
+                continue
+            rows = self.sqlite_storage.find_rows_by_column(self.table_name, key[0], key[1])
+            record_ids = [row.get('record_id') for row in rows]
+            if not rows or not all(record_id and AIRTABLE_RECORD_ID_PATTERN.match(record_id) for record_id in record_ids):
+                continue
+            columns = {column for entry in entries for column in entry['changed_columns']}
+            for row in rows:
+                fields = fields_by_id.setdefault(row['record_id'], {})
+                # Cleared values are sent as None so Airtable clears them too
+                fields.update({column: convert_value_for_airtable(row.get(column)) for column in columns})
+                keys_by_id.setdefault(row['record_id'], set()).add(key)
+        
+        if not fields_by_id:
+            return "No row updates to flush"
+        
+        update_records = [{'id': record_id, 'fields': fields} for record_id, fields in fields_by_id.items()]
+        executor = self.airtable_client.batch_executor(self.table_name)
+        report = executor.update(update_records)
+        reports = [report]
+        failed_records = self._failed_batch_records(report, update_records)
+        
+        # A 404 means a stored id is stale (a full upload recreates every record), and it fails
+        # the whole batch: look the batch's records up again, store their current ids and resend
+        stale_records = self._failed_batch_records(report, update_records, status=404)
+        if stale_records:
+            current_ids = self._refresh_record_ids(stale_records, keys_by_id, entries_by_key)
+            retry_records = [{'id': current_ids[record['id']], 'fields': record['fields']}
+                             for record in stale_records if record['id'] in current_ids]
+            for record in stale_records:
+                if record['id'] in current_ids:
+                    keys_by_id[current_ids[record['id']]] = keys_by_id[record['id']]
+            retry_report = executor.update(retry_records) if retry_records else None
+            if retry_report:
+                reports.append(retry_report)
+            stale_ids = {record['id'] for record in stale_records}
+            failed_records = [record for record in failed_records if record['id'] not in stale_ids]
+            # Records Airtable no longer has were handed to the upload as inserts, so they stay journaled
+            failed_records += [record for record in stale_records if record['id'] not in current_ids]
+            if retry_report:
+                failed_records += self._failed_batch_records(retry_report, retry_records)
+        
+        # Keep the journal entries of any record in a failed batch
+        failed_keys = set()
+        for record in failed_records:
+            failed_keys.update(keys_by_id[record['id']])
+        flushed_keys = {key for keys in keys_by_id.values() for key in keys} - failed_keys
+        self.sqlite_storage.clear_change_ids([entry['id'] for key in flushed_keys for entry in entries_by_key[key]])
+        
+        failed_reports = [report for report in reports if report['failed_batches']]
+        if failed_reports and failed_records:
+            return self._batch_failure_message(*failed_reports)
+        return (f"Success: Flushed {len(update_records)} records for {self.table_name} "
+                f"in {sum(report['batches'] for report in reports)} batches ({report['records_per_second']} records/sec)")
+
+    @staticmethod
+    def _failed_batch_records(report: dict, records: list, status: Optional[int] = None) -> list:
+        """
+        Get the records that were in a report's failed batches, optionally only those that failed with `status`.
+        """
+        failed = []
+        for failure in report['failed_batches']:
+            if status is None or failure.get('status') == status:
+                start = failure['batch'] * report['batch_size']
+                failed.extend(records[start:start + report['batch_size']])
+        return failed
+
+    def _refresh_record_ids(self, records: list, keys_by_id: dict, entries_by_key: dict) -> dict:
+        """
+        Look records up in Airtable by their stored record id (the {record_id} field), then by
+        the key their journal entries use, and store the ids found locally. Records that
+        can't be found are journaled as inserts for the next upload to recreate.
+        
+        Returns:
+            Dictionary mapping each stored id that was found to the record's current Airtable id
+        """
+        airtable = self.airtable_client.table(self.table_name)
+        key_column = SQLiteStorage.JOURNAL_KEY_COLUMN
+        lookups = [(key_column, record['id']) for record in records]
+        lookups += [key for record in records for key in keys_by_id[record['id']] if key[0] != key_column]
+        found = self._find_airtable_record_ids(airtable, lookups)
+        
+        current_ids = {}
+        for record in records:
+            record_ids = found.get((key_column, record['id']), [])
+            if not record_ids:
+                keys = [key for key in keys_by_id[record['id']] if key[0] != key_column]
+                record_ids = found.get((keys[0][0], str(keys[0][1])), []) if len(keys) == 1 else []
+            if len(record_ids) == 1:
+                current_ids[record['id']] = record_ids[0]
+        
+        changed = {old: new for old, new in current_ids.items() if old != new}
+        if changed:
+            self.sqlite_storage.replace_record_ids(self.table_name, changed)
+            print(f"Updated {len(changed)} stale Airtable record ids in {self.table_name}")
+        for record in records:
+            if record['id'] not in current_ids:
+                for key in keys_by_id[record['id']]:
+                    self.sqlite_storage.record_change(self.table_name, key[0], key[1], [], 'insert')
+        return current_ids
+
+    def _batch_failure_message(self, *reports) -> str:
+        failed_records = sum(report['failed_records'] for report in reports)
+        failed_batches = [batch for report in reports for batch in report['failed_batches']]
+        return (f"Error: {len(failed_batches)} batches ({failed_records} records) failed to "
+                f"{reports[0]['operation']} for {self.table_name}: {failed_batches[0]['error']}")
+
+    @staticmethod
+    def _find_airtable_record_ids(airtable, lookups, chunk_size: int = 50) -> dict:
+        """
+        Find the Airtable record ids for (column, value) pairs, batching the lookups
+        into OR() formulas so the number of requests scales with the number of changes.
+        
+        Returns:
+            Dictionary mapping (column, str(value)) to a list of Airtable record ids
+        """
+        values_by_column = {}
+        for column, value in lookups:
+            values_by_column.setdefault(column, set()).add(str(value))
+        
+        found = {}
+        for column, values in values_by_column.items():
+            values = sorted(values)
+            for i in range(0, len(values), chunk_size):
+                chunk = values[i:i+chunk_size]
+                # Concatenating with '' compares as text, so number fields match too
+                conditions = [
+                    "{%s}&''='%s'" % (column, value.replace('\\', '\\\\').replace("'", "\\'"))
+                    for value in chunk
+                ]
+                formula = f"OR({','.join(conditions)})"
+                for record in airtable.get_all(formula=formula, fields=[column]):
+                    value = record.get('fields', {}).get(column)
+                    if value is not None:
+                        found.setdefault((column, str(value)), []).append(record['id'])
+        return found
+
     def add_record(self, record_data: dict) -> bool:
         """
         Add a new record to the table.
@@ -189,10 +583,6 @@ class TableManager:
         try:
             # Insert the record into SQLite
             success = self.sqlite_storage.add_record(self.table_name, record_data)
-            
-            if success:
-                self.has_updates = True
-                
             return success
             
         except Exception as e:
@@ -216,10 +606,6 @@ class TableManager:
         try:
             # Delete the record from SQLite
             success = self.sqlite_storage.delete_record(self.table_name, column_containing_reference, reference_value)
-            
-            if success:
-                self.has_updates = True
-                
             return success
             
         except Exception as e:
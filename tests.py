@@ -6,6 +6,7 @@ from student_data_manager import StudentDataManager
 from utilities import load_env, parse_database_row
 import json
 import asyncio
+from contextlib import contextmanager
 from app import app
 
 def test_basic_usage():
@@ -1609,6 +1610,1184 @@ def test_add_teacher_api():
             else:
                 print(f"⚠ Failed to delete test teacher with website_user_id: {website_user_id}")
 
+def test_change_journal():
+    """Test that local writes are journaled per row and drive get_modified_tables."""
+    import tempfile
+    
+    with tempfile.TemporaryDirectory() as temp_dir:
+        sqlite_store = SQLiteStorage(db_path=os.path.join(temp_dir, "journal_test.db"))
+        multi_manager = AirtableMultiManager("test_key", "test_base", table_names=["journal_students"], sqlite_storage=sqlite_store)
+        manager = multi_manager.get_manager("journal_students")
+        
+        assert multi_manager.get_modified_tables() == []
+        assert manager.has_updates is False
+        
+        assert manager.add_record({"record_id": "rec1", "website_id": "1", "first_name": "Ada", "current_step": ""})
+        assert manager.add_record({"record_id": "rec2", "website_id": "2", "first_name": "Alan", "current_step": ""})
+        assert manager.modify_field("website_id", "1", "current_step", "GG-01")
+        assert manager.modify_field("website_id", "1", "current_step", "GG-02")
+        assert manager.delete_record("website_id", "2")
+        # Writes that match nothing are not journaled
+        assert not manager.modify_field("website_id", "999", "current_step", "GG-01")
+        
+        changes = sqlite_store.get_pending_changes("journal_students")
+        assert [change['operation'] for change in changes] == ['insert', 'insert', 'update', 'update', 'delete']
+        assert changes[0]['key_column'] == 'record_id' and changes[0]['key_value'] == 'rec1'
+        assert changes[2]['key_column'] == 'website_id' and changes[2]['changed_columns'] == ['current_step']
+        assert multi_manager.get_modified_tables() == ["journal_students"]
+        assert manager.has_updates is True
+        
+        # Changes made after an upload started are kept
+        sqlite_store.clear_changes("journal_students", up_to_id=changes[-1]['id'])
+        assert multi_manager.get_modified_tables() == []
+        multi_manager.mark_table_as_modified("journal_students")
+        assert sqlite_store.get_pending_changes("journal_students")[0]['key_column'] is None
+        
+        # A row without a record_id can't be found by key later, so its table is marked for a full upload
+        sqlite_store.clear_changes("journal_students")
+        assert manager.add_record({"website_id": "3", "first_name": "Grace", "current_step": ""})
+        changes = sqlite_store.get_pending_changes("journal_students")
+        assert [(change['operation'], change['key_column']) for change in changes] == [('table', None)]
+        sqlite_store.engine.dispose()
+
+def test_airtable_client_rate_limit_and_retry():
+    """Test the shared Airtable client's token bucket and retry handling."""
+    import time
+    import requests
+    from airtable_client import AirtableClient, TokenBucket
+    
+    # 10 tokens/sec with a burst of 1: 5 acquisitions take at least ~0.4s
+    bucket = TokenBucket(rate=10, capacity=1)
+    start = time.monotonic()
+    for _ in range(5):
+        bucket.acquire()
+    assert time.monotonic() - start >= 0.35
+    
+    class StubSession:
+        def __init__(self, statuses):
+            self.statuses = list(statuses)
+            self.calls = 0
+        
+        def request(self, method, url, **kwargs):
+            self.calls += 1
+            response = requests.Response()
+            response.status_code = self.statuses.pop(0)
+            response.headers['Retry-After'] = '0'
+            response._content = b'{}'
+            return response
+    
+    client = AirtableClient("test_key", "test_base", requests_per_second=100, max_retries=3, backoff_base=0.001)
+    
+    # Throttled and server errors are retried until success
+    session = StubSession([429, 503, 200])
+    response = client.send(session, 'GET', 'https://example.invalid', operation='GET test')
+    assert response.status_code == 200
+    assert session.calls == 3
+    
+    # Client errors are not retried, and retries stop at max_retries
+    session = StubSession([422])
+    assert client.send(session, 'GET', 'https://example.invalid', operation='GET test').status_code == 422
+    session = StubSession([500] * 5)
+    assert client.send(session, 'GET', 'https://example.invalid', operation='GET test').status_code == 500
+    assert session.calls == 4
+    
+    metrics = client.get_metrics()['GET test']
+    assert metrics['calls'] == 8
+    assert metrics['throttled'] == 1
+    assert metrics['retries'] == 5
+    
+    # Creates are retried after a 429 but not after a 5xx, which may follow a successful write
+    session = StubSession([429, 200])
+    assert client.send(session, 'POST', 'https://example.invalid', operation='POST test').status_code == 200
+    session = StubSession([503, 200])
+    assert client.send(session, 'POST', 'https://example.invalid', operation='POST test').status_code == 503
+    assert session.calls == 1
+    
+    from urllib3.exceptions import MaxRetryError, NameResolutionError, NewConnectionError
+    
+    class FailingSession:
+        def __init__(self, error):
+            self.error = error
+            self.calls = 0
+        
+        def request(self, method, url, **kwargs):
+            self.calls += 1
+            raise self.error
+    
+    def connection_error(reason):
+        return requests.ConnectionError(MaxRetryError(None, 'https://example.invalid', reason=reason))
+    
+    # DNS failures aren't retried at all
+    session = FailingSession(connection_error(NameResolutionError('example.invalid', None, OSError('not known'))))
+    def send_fails(session, method):
+        try:
+            client.send(session, method, 'https://example.invalid', operation=f'{method} test')
+        except (requests.ConnectionError, requests.Timeout):
+            return True
+        return False
+    
+    assert send_fails(session, 'GET')
+    assert session.calls == 1
+    
+    # A create is retried when the connection was refused, but not after a read timeout
+    session = FailingSession(connection_error(NewConnectionError(None, 'Connection refused')))
+    assert send_fails(session, 'POST')
+    assert session.calls == 4
+    session = FailingSession(requests.ReadTimeout())
+    assert send_fails(session, 'POST')
+    assert session.calls == 1
+
+def test_batch_upload_executor_partial_failure():
+    """Test that batch uploads run concurrently and retry failed batches on their own."""
+    import threading
+    import requests
+    from airtable_client import AirtableClient, BatchUploadExecutor
+    
+    def http_error(status):
+        response = requests.Response()
+        response.status_code = status
+        return requests.HTTPError(f"{status} error", response=response)
+    
+    class FlakyTable:
+        def __init__(self):
+            self.lock = threading.Lock()
+            self.attempts = {}
+        
+        def _attempt(self, key):
+            with self.lock:
+                self.attempts[key] = self.attempts.get(key, 0) + 1
+                return self.attempts[key]
+        
+        def batch_insert(self, batch):
+            first = batch[0]['n']
+            attempt = self._attempt(first)
+            if first == 10 and attempt == 1:
+                raise http_error(429)
+            if first == 20:
+                raise ValueError("bad batch")
+            if first == 30:
+                raise requests.ReadTimeout("no response")
+            return batch
+        
+        def batch_update(self, batch):
+            if self._attempt(('update', batch[0]['n'])) == 1:
+                raise requests.ReadTimeout("no response")
+            return batch
+    
+    table = FlakyTable()
+    client = AirtableClient("test_key", "test_base", requests_per_second=100, backoff_base=0.001, backoff_max=0.01)
+    executor = BatchUploadExecutor(client, "test_table", max_workers=3, batch_retries=2)
+    executor._table = lambda: table
+    
+    report = executor.insert([{'n': n} for n in range(35)])
+    assert report['batches'] == 4
+    assert report['records'] == 20  # batches starting at 20 and 30 fail
+    assert report['failed_records'] == 15
+    assert [failure['batch'] for failure in report['failed_batches']] == [2, 3]
+    assert table.attempts[10] == 2  # throttled batch retried once
+    assert table.attempts[20] == 1  # not an HTTP failure, so not retried
+    assert table.attempts[30] == 1  # the insert may have gone through, so not resent
+    
+    # Updates are safe to resend after a timeout
+    report = executor.update([{'n': n} for n in range(10)])
+    assert report['records'] == 10
+    assert table.attempts[('update', 0)] == 2
+    assert report['records_per_second'] > 0
+
+@contextmanager
+def fake_airtable_base(db_name, table_names, latency=0.0):
+    """
+    Start a local fake Airtable server and a multi-manager for it, backed by a temporary SQLite database.
+    Managers don't call Airtable until used, so tables can be added to the server afterwards.
+    
+    Args:
+        db_name: File name of the temporary database
+        table_names: Tables for the multi-manager to manage
+        latency: Seconds the fake server waits before answering each request
+    
+    Yields:
+        Tuple of (server, client, sqlite_store, multi_manager)
+    """
+    import tempfile
+    from airtable_client import AirtableClient
+    from fake_airtable import FakeAirtableServer
+    
+    with FakeAirtableServer(latency=latency) as server, tempfile.TemporaryDirectory() as temp_dir:
+        client = AirtableClient("test_key", server.base_id, requests_per_second=100, api_url=server.api_url)
+        sqlite_store = SQLiteStorage(db_path=os.path.join(temp_dir, db_name))
+        multi_manager = AirtableMultiManager("test_key", server.base_id, table_names=table_names, sqlite_storage=sqlite_store, airtable_client=client)
+        try:
+            yield server, client, sqlite_store, multi_manager
+        finally:
+            sqlite_store.engine.dispose()
+
+@contextmanager
+def swapped_app_globals(**values):
+    """
+    Point the app module's globals (e.g. multi_manager, initial_sync) at test objects, restoring them afterwards.
+    """
+    import sys
+    
+    app_module = sys.modules['app']
+    originals = {name: getattr(app_module, name) for name in values}
+    for name, value in values.items():
+        setattr(app_module, name, value)
+    try:
+        yield
+    finally:
+        for name, value in originals.items():
+            setattr(app_module, name, value)
+
+def test_sync_and_upload_with_fake_airtable():
+    """Test discovery, sync and uploads end to end against the local fake Airtable server."""
+    with fake_airtable_base("fake_sync.db", []) as (server, client, sqlite_store, multi_manager):
+        server.add_table("fake_students", [
+            {"record_id": f"rec{i}", "website_id": i, "first_name": f"Student {i}", "current_step": ""}
+            for i in range(1, 26)
+        ])
+        
+        assert multi_manager.discover_and_add_tables_from_base() == {"fake_students": True}
+        results = multi_manager.update_all_tables()
+        assert results["fake_students"].startswith("Successfully")
+        manager = multi_manager.get_manager("fake_students")
+        assert len(manager.get_full_table()) == 25
+        # Pages of 100 records, so one list request
+        assert server.request_counts["GET v0/appFakeBase/fake_students"] == 1
+        
+        # Incremental upload only touches the changed rows
+        manager.modify_field("website_id", "1", "current_step", "GG-01")
+        manager.modify_field("website_id", "1", "current_step", "GG-02")
+        manager.modify_field("website_id", "2", "first_name", "Renamed")
+        manager.add_record({"record_id": "rec99", "website_id": "99", "first_name": "New", "current_step": ""})
+        manager.delete_record("website_id", "3")
+        server.reset_counts()
+        
+        results = multi_manager.upload_modified_tables_to_airtable()
+        assert results["fake_students"].startswith("Success"), results
+        assert "2 updated, 1 inserted, 1 deleted" in results["fake_students"]
+        assert multi_manager.get_modified_tables() == []
+        assert server.request_counts == {
+            "GET v0/appFakeBase/fake_students": 2,  # record_id and website_id lookups
+            "PATCH v0/appFakeBase/fake_students": 1,
+            "POST v0/appFakeBase/fake_students": 1,
+            "DELETE v0/appFakeBase/fake_students": 1
+        }
+        remote = {record["record_id"]: record for record in server.get_records("fake_students")}
+        assert len(remote) == 25
+        assert remote["rec1"]["current_step"] == "GG-02"
+        assert remote["rec2"]["first_name"] == "Renamed"
+        assert "rec3" not in remote and "rec99" in remote
+        
+        # Throttled requests are retried and a forced upload replaces the table
+        server.inject_errors(429, 2)
+        server.retry_after = 0
+        results = multi_manager.upload_modified_tables_to_airtable(force_upload=True)
+        assert results["fake_students"].startswith("Success: Replaced fake_students with 25 records"), results
+        assert len(server.get_records("fake_students")) == 25
+        assert sum(stats["throttled"] for stats in client.get_metrics().values()) == 2
+
+def test_sync_worker_job_queue():
+    """Test that queued sync and upload jobs are claimed once and run by the sync worker."""
+    import time
+    from scheduler import DailyAirtableUploader
+    
+    with fake_airtable_base("jobs.db", ["fake_students"]) as (server, client, sqlite_store, multi_manager):
+        server.add_table("fake_students", [
+            {"record_id": f"rec{i}", "website_id": i, "first_name": f"Student {i}"} for i in range(1, 6)
+        ])
+        worker = DailyAirtableUploader(multi_manager=multi_manager, initial_sync=False)
+        
+        # Identical pending jobs are coalesced
+        sync_job = sqlite_store.enqueue_job("sync")
+        assert sqlite_store.enqueue_job("sync")["id"] == sync_job["id"]
+        assert sync_job["status"] == "pending"
+        assert worker.process_pending_jobs() == 1
+        job = sqlite_store.get_job(sync_job["id"])
+        assert job["status"] == "done", job
+        assert job["worker_id"] == worker.worker_id
+        assert job["result"]["fake_students"].startswith("Successfully")
+        assert sqlite_store.claim_next_job("other-worker") is None
+        
+        multi_manager.get_manager("fake_students").modify_field("website_id", "1", "first_name", "Renamed")
+        upload_job = sqlite_store.enqueue_job("upload")
+        missing_job = sqlite_store.enqueue_job("sync", "missing_table")
+        assert worker.process_pending_jobs() == 2
+        assert sqlite_store.get_job(upload_job["id"])["status"] == "done"
+        assert sqlite_store.get_job(missing_job["id"])["status"] == "failed"
+        remote = {record["record_id"]: record for record in server.get_records("fake_students")}
+        assert remote["rec1"]["first_name"] == "Renamed"
+        assert [job["id"] for job in sqlite_store.get_recent_jobs()] == [missing_job["id"], upload_job["id"], sync_job["id"]]
+        
+        # A job left running by a worker that died is taken back once it is stale
+        stuck_job = sqlite_store.enqueue_job("sync", "fake_students")
+        assert sqlite_store.claim_next_job("dead-worker")["id"] == stuck_job["id"]
+        assert sqlite_store.claim_next_job(worker.worker_id, stale_after_seconds=3600) is None
+        time.sleep(0.05)
+        assert sqlite_store.claim_next_job(worker.worker_id, stale_after_seconds=0.01)["id"] == stuck_job["id"]
+        assert not sqlite_store.finish_job(stuck_job["id"], False, "late", worker_id="dead-worker")
+        assert sqlite_store.finish_job(stuck_job["id"], True, "ok", worker_id=worker.worker_id)
+        assert sqlite_store.get_job(stuck_job["id"])["status"] == "done"
+
+def test_scheduler_lease():
+    """Test that only one worker runs a scheduled job and that expired leases can be taken over."""
+    import tempfile
+    from scheduler import DailyAirtableUploader
+    
+    with tempfile.TemporaryDirectory() as temp_dir:
+        sqlite_store = SQLiteStorage(db_path=os.path.join(temp_dir, "leases.db"))
+        multi_manager = AirtableMultiManager("test_key", "appTest", table_names=[], sqlite_storage=sqlite_store)
+        first = DailyAirtableUploader(multi_manager=multi_manager, initial_sync=False)
+        second = DailyAirtableUploader(multi_manager=multi_manager, initial_sync=False)
+        second.worker_id = "other-host:1"
+        
+        # Only one worker runs a job each interval
+        runs = []
+        assert first.run_exclusive("nightly", lambda: runs.append("first") or "ok", min_interval=3600) == "ok"
+        assert second.run_exclusive("nightly", lambda: runs.append("second"), min_interval=3600) is None
+        assert runs == ["first"]
+        lease = {lease["name"]: lease for lease in sqlite_store.get_leases()}["nightly"]
+        assert lease["holder"] is None
+        assert lease["last_run_holder"] == first.worker_id
+        assert lease["last_run_status"] == "done"
+        assert lease["last_run_result"] == "ok"
+        
+        # A held lease blocks other workers until it expires
+        assert sqlite_store.acquire_lease("upload", first.worker_id, ttl_seconds=3600)
+        assert not sqlite_store.acquire_lease("upload", second.worker_id, ttl_seconds=3600)
+        assert {lease["name"]: lease for lease in sqlite_store.get_leases()}["upload"]["holder"] == first.worker_id
+        assert sqlite_store.acquire_lease("crashed", first.worker_id, ttl_seconds=0)
+        assert sqlite_store.acquire_lease("crashed", second.worker_id, ttl_seconds=3600)
+        assert not sqlite_store.release_lease("crashed", first.worker_id, True)
+        
+        # Failures are recorded and re-raised
+        try:
+            second.run_exclusive("broken", lambda: 1 / 0)
+            assert False, "Expected ZeroDivisionError"
+        except ZeroDivisionError:
+            pass
+        lease = {lease["name"]: lease for lease in sqlite_store.get_leases()}["broken"]
+        assert lease["last_run_status"] == "failed" and lease["last_run_result"].startswith("Error")
+        # ...and a failed run can be retried without waiting out min_interval
+        assert sqlite_store.acquire_lease("broken", first.worker_id, ttl_seconds=3600, min_interval_seconds=3600)
+        sqlite_store.engine.dispose()
+
+def test_adaptive_sync_planner():
+    """Test that busy tables get shorter sync intervals and planned runs stay within the call budget."""
+    from datetime import datetime, timedelta
+    from sync_planner import AdaptiveSyncPlanner
+    
+    with fake_airtable_base("planner.db", ["hot_table", "cold_table"]) as (server, client, sqlite_store, multi_manager):
+        for table_name in ("hot_table", "cold_table"):
+            server.add_table(table_name, [{"record_id": f"rec{i}", "website_id": i, "name": f"Row {i}"} for i in range(1, 41)])
+        multi_manager.update_all_tables()
+        planner = AdaptiveSyncPlanner(multi_manager, calls_per_hour=1000)
+        
+        # Rates come from journal writes since the last observation
+        hour_ago = datetime.utcnow() - timedelta(hours=1)
+        for table_name in ("hot_table", "cold_table"):
+            sqlite_store.save_table_sync_state(table_name, change_rate=0.0, last_change_id=0, rate_updated_at=hour_ago)
+        for i in range(1, 31):
+            multi_manager.get_manager("hot_table").modify_field("website_id", str(i), "name", f"Hot {i}")
+        multi_manager.get_manager("cold_table").modify_field("website_id", "1", "name", "Cold 1")
+        states = planner.observe_changes()
+        assert states["hot_table"]["change_rate"] > 10 * states["cold_table"]["change_rate"] > 0
+        assert planner.upload_interval(states["hot_table"]["change_rate"]) < planner.upload_interval(states["cold_table"]["change_rate"])
+        assert [task["table_name"] for task in planner.plan(states)] == ["hot_table", "cold_table"]
+        
+        results = planner.run_due()
+        assert results["upload hot_table"].startswith("Success"), results
+        assert results["upload cold_table"].startswith("Success"), results
+        assert server.get_records("hot_table")[0]["name"] == "Hot 1"
+        assert 0 < planner.calls_spent() <= 10
+        # Nothing pending and the download clock has just started, so nothing else is due
+        assert planner.run_due() == {}
+        
+        # A table uploaded recently waits for its interval
+        multi_manager.get_manager("cold_table").modify_field("website_id", "2", "name", "Cold 2")
+        assert "upload cold_table" not in planner.run_due()
+        
+        # Work that doesn't fit in the budget is deferred, including by another worker's planner
+        sqlite_store.save_table_sync_state("cold_table", last_upload_at=hour_ago - timedelta(days=2))
+        planner.calls_per_hour = planner.calls_spent()
+        assert planner.run_due()["upload cold_table"].startswith("Deferred")
+        other_planner = AdaptiveSyncPlanner(multi_manager, calls_per_hour=planner.calls_per_hour)
+        assert other_planner.calls_spent() == planner.calls_spent()
+        assert other_planner.run_due()["upload cold_table"].startswith("Deferred")
+        assert multi_manager.get_modified_tables() == ["cold_table"]
+        status = planner.get_status()
+        assert status["tables"]["hot_table"]["last_upload_at"] is not None
+
+def test_airtable_webhook_sync():
+    """Test that webhook payloads apply only the changed records, once, in order."""
+    import socket
+    from airtable_webhooks import AirtableWebhookProcessor
+    
+    with fake_airtable_base("webhook.db", ["fake_steps"]) as (server, client, sqlite_store, multi_manager):
+        ids = server.add_table("fake_steps", [{"name": f"Step {i}", "description": f"Do {i}"} for i in range(5)])
+        for record_id in ids:
+            # record_id is a RECORD_ID() formula field in the real base
+            server.update_record("fake_steps", record_id, {"record_id": record_id})
+        webhook = server.create_webhook()
+        multi_manager.update_all_tables()
+        manager = multi_manager.get_manager("fake_steps")
+        
+        # Edits made in Airtable, plus one record that also has an unsent local change
+        server.update_record("fake_steps", ids[0], {"name": "Edited"})
+        server.update_record("fake_steps", ids[1], {"description": None})
+        new_id = server.add_table("fake_steps", [{"name": "New step"}])[0]
+        server.update_record("fake_steps", new_id, {"record_id": new_id})
+        server.delete_record("fake_steps", ids[2])
+        server.update_record("fake_steps", ids[3], {"name": "Edited then deleted"})
+        server.delete_record("fake_steps", ids[3])
+        manager.modify_field("record_id", ids[4], "name", "Local")
+        server.update_record("fake_steps", ids[4], {"name": "Remote"})
+        server.reset_counts()
+        
+        processor = AirtableWebhookProcessor(multi_manager, webhook_id=webhook["id"], mac_secret=webhook["macSecretBase64"])
+        summary = processor.process()
+        assert summary["applied_payloads"] == 8, summary
+        # The webhook lease holder names the process, like the sync worker's, so it is unique across workers
+        lease = {lease["name"]: lease for lease in sqlite_store.get_leases()}[f"webhook:{webhook['id']}"]
+        assert lease["last_run_holder"].startswith(f"{socket.gethostname()}:{os.getpid()}:"), lease
+        assert "1 skipped with pending local changes" in summary["tables"]["fake_steps"][0], summary
+        rows = {row["record_id"]: row for row in manager.get_full_table()}
+        assert rows[ids[0]]["name"] == "Edited"
+        assert rows[ids[1]]["description"] == ""
+        assert rows[new_id]["name"] == "New step"
+        assert ids[2] not in rows and ids[3] not in rows
+        assert rows[ids[4]]["name"] == "Local"
+        # One payload page, one meta lookup for table ids, one filtered fetch of the changed records
+        assert server.request_counts == {
+            "GET v0/bases/appFakeBase": 1,
+            "GET v0/meta": 1,
+            "GET v0/appFakeBase/fake_steps": 1
+        }, server.request_counts
+        
+        # Nothing new: nothing applied. Replayed payloads are skipped by transaction number
+        assert processor.process()["applied_payloads"] == 0
+        sqlite_store.save_webhook_cursor(webhook["id"], 1, sqlite_store.get_webhook_cursor(webhook["id"])["last_transaction"])
+        replay = processor.process()
+        assert replay["applied_payloads"] == 0 and replay["skipped_payloads"] == 8 and replay["tables"] == {}
+        
+        # Notifications from the fake sender are signed with the webhook's MAC secret
+        body, headers = server.notification_request(webhook["id"])
+        assert processor.verify_signature(body, headers["X-Airtable-Content-MAC"])
+        assert not processor.verify_signature(body + b" ", headers["X-Airtable-Content-MAC"])
+        # Without a secret, notifications are only accepted when unsigned ones are explicitly allowed
+        assert not AirtableWebhookProcessor(multi_manager, webhook_id=webhook["id"], allow_unsigned=False).verify_signature(body, None)
+        assert AirtableWebhookProcessor(multi_manager, webhook_id=webhook["id"], allow_unsigned=True).verify_signature(body, None)
+        
+        # The fake rejects formulas it can't evaluate instead of matching every record
+        response = client.request('GET', f"{server.api_url}/{server.base_id}/fake_steps", params={"filterByFormula": "NOT({name}='Edited')"})
+        assert response.status_code == 422 and response.json()["error"]["type"] == "INVALID_FILTER_BY_FORMULA"
+
+def test_write_behind_flush():
+    """Test that journaled row updates are coalesced and flushed in 10-record batches without lookups."""
+    from scheduler import DailyAirtableUploader
+    
+    with fake_airtable_base("write_behind.db", ["fake_students"]) as (server, client, sqlite_store, multi_manager):
+        ids = server.add_table("fake_students", [{"website_id": f"W{i:03d}", "current_step": "1", "points": "0"} for i in range(25)])
+        for record_id in ids:
+            server.update_record("fake_students", record_id, {"record_id": record_id})
+        multi_manager.update_all_tables()
+        manager = multi_manager.get_manager("fake_students")
+        
+        # Several updates per student coalesce into one record update each
+        for i in range(12):
+            for step in range(2, 5):
+                manager.modify_field("website_id", f"W{i:03d}", "current_step", str(step))
+            manager.modify_field("website_id", f"W{i:03d}", "points", "10")
+        manager.add_record({"record_id": "recLocalW999", "website_id": "W999", "current_step": "1"})
+        server.reset_counts()
+        
+        uploader = DailyAirtableUploader(multi_manager, initial_sync=False)
+        uploader.write_behind_tables = ["fake_students"]
+        results = uploader.run_write_behind()
+        assert results["fake_students"].startswith("Success: Flushed 12 records"), results
+        # Two batch updates (10 + 2), no record id lookups
+        assert server.request_counts == {"PATCH v0/appFakeBase/fake_students": 2}, server.request_counts
+        assert uploader.planner.calls_spent() == 2
+        remote = {record["website_id"]: record for record in server.get_records("fake_students")}
+        # Numeric strings are sent as numbers, like the full upload does
+        assert remote["W000"]["current_step"] == 4 and remote["W000"]["points"] == 10
+        assert remote["W020"]["current_step"] == "1"
+        
+        # Only the insert is left for the full upload path
+        pending = sqlite_store.get_pending_changes("fake_students")
+        assert [change["operation"] for change in pending] == ["insert"], pending
+        assert manager.flush_row_updates() == "No row updates to flush"
+
+def test_write_behind_flush_after_full_upload():
+    """Test that a flush recovers from the stale record ids a full upload leaves behind."""
+    with fake_airtable_base("stale_ids.db", ["fake_students"]) as (server, client, sqlite_store, multi_manager):
+        ids = server.add_table("fake_students", [{"website_id": f"W{i:03d}", "current_step": "1"} for i in range(12)])
+        for record_id in ids:
+            server.update_record("fake_students", record_id, {"record_id": record_id})
+        multi_manager.update_all_tables()
+        manager = multi_manager.get_manager("fake_students")
+        
+        # A full upload recreates every record under a new id; one is then deleted in Airtable
+        multi_manager.mark_table_as_modified("fake_students")
+        assert manager.upload_changes_to_airtable().startswith("Success: Replaced"), "full upload failed"
+        airtable_ids = {record["fields"]["website_id"]: record_id for record_id, record in server.tables["fake_students"].items()}
+        assert airtable_ids["W000"] != ids[0]
+        server.delete_record("fake_students", airtable_ids["W011"])
+        for i in range(12):
+            manager.modify_field("website_id", f"W{i:03d}", "current_step", "5")
+        
+        result = manager.flush_row_updates()
+        assert "failed" in result, result  # W011 is left for the upload to recreate
+        remote = {record["website_id"]: record for record in server.get_records("fake_students")}
+        assert all(remote[f"W{i:03d}"]["current_step"] == 5 for i in range(11)), remote
+        # The current ids are stored locally, so later flushes address the records directly
+        assert manager.get_row("website_id", "W000")["record_id"] == airtable_ids["W000"]
+        pending = sqlite_store.get_pending_changes("fake_students")
+        assert {change["key_value"] for change in pending} == {"W011"} and "insert" in [change["operation"] for change in pending], pending
+        manager.modify_field("website_id", "W001", "current_step", "6")
+        server.reset_counts()
+        assert manager.flush_row_updates().startswith("Success: Flushed 1 records")
+        assert server.request_counts == {"PATCH v0/appFakeBase/fake_students": 1}, server.request_counts
+        
+        # The next upload recreates the record Airtable lost
+        assert manager.upload_changes_to_airtable().startswith("Success"), "upload failed"
+        assert "W011" in {record["website_id"] for record in server.get_records("fake_students")}
+
+def test_sync_skips_unchanged_tables():
+    """Test that sync skips the reimport of tables whose Airtable records haven't changed."""
+    with fake_airtable_base("hash.db", ["fake_steps", "fake_quests"]) as (server, client, sqlite_store, multi_manager):
+        ids = server.add_table("fake_steps", [{"name": f"Step {i}", "description": f"Do {i}"} for i in range(5)])
+        server.add_table("fake_quests", [{"name": "Quest"}])
+        results = multi_manager.update_all_tables()
+        assert all(result.startswith("Successfully") for result in results.values()), results
+        
+        # Nothing changed: both tables are still fetched, but not reimported
+        results = multi_manager.update_all_tables()
+        assert all(result.startswith("Skipped") for result in results.values()), results
+        
+        # A remote edit, a local change or a local edit outside the journal all force the import
+        server.update_record("fake_steps", ids[0], {"name": "Edited"})
+        multi_manager.get_manager("fake_quests").modify_field("name", "Quest", "name", "Local quest")
+        results = multi_manager.update_all_tables()
+        assert all(result.startswith("Successfully") for result in results.values()), results
+        assert multi_manager.get_manager("fake_steps").get_row("name", "Edited")
+        assert multi_manager.get_manager("fake_quests").get_row("name", "Quest")
+        sqlite_store.execute_sql_query("fake_steps", "DELETE FROM fake_steps")
+        results = multi_manager.update_all_tables()
+        assert results["fake_steps"].startswith("Successfully") and results["fake_quests"].startswith("Skipped"), results
+        assert len(multi_manager.get_manager("fake_steps").get_full_table()) == 5
+
+        # A local change made while the download is fetching records keeps the old table and its journal entry
+        manager = multi_manager.get_manager("fake_steps")
+        fetch_table = client.table
+        def table_with_local_write(table_name):
+            table = fetch_table(table_name)
+            fetch_all = table.get_all
+            def get_all():
+                records = fetch_all()
+                assert manager.modify_field("name", "Step 1", "description", "Changed locally")
+                return records
+            table.get_all = get_all
+            return table
+        client.table = table_with_local_write
+        result = multi_manager.update_database_from_airtable("fake_steps")
+        assert result.startswith("Skipped") and "changed locally" in result, result
+        client.table = fetch_table
+        assert manager.get_row("name", "Step 1")["description"] == "Changed locally"
+        changes = sqlite_store.get_pending_changes("fake_steps")
+        assert [change["changed_columns"] for change in changes] == [["description"]]
+
+def test_cached_table_catalog():
+    """Test that startup adds tables from the cached catalog and only rediscovers when it is stale."""
+    import time
+    
+    with fake_airtable_base("catalog.db", []) as (server, client, sqlite_store, _):
+        server.add_table("fake_steps", [{"name": "Step", "description": "Do it"}])
+        server.add_table("fake_quests", [{"name": "Quest"}])
+        
+        def new_manager():
+            return AirtableMultiManager("test_key", server.base_id, table_names=[], sqlite_storage=sqlite_store, airtable_client=client)
+        
+        # First start: nothing cached, so discovery runs
+        assert new_manager().load_table_catalog(background_refresh=False) == {"fake_steps": True, "fake_quests": True}
+        assert server.request_counts == {"GET v0/meta": 1}, server.request_counts
+        
+        # Later starts use the catalog without calling Airtable, fields included
+        server.reset_counts()
+        multi_manager = new_manager()
+        assert multi_manager.load_table_catalog() == {"fake_steps": True, "fake_quests": True}
+        assert multi_manager.get_available_tables() == ["fake_steps", "fake_quests"]
+        assert [field["name"] for field in multi_manager.get_cached_table_fields("fake_steps")] == ["name", "description"]
+        assert server.request_counts == {}, server.request_counts
+        
+        # A stale catalog is served as is while discovery refreshes it in the background
+        server.add_table("fake_teachers", [{"name": "Teacher"}])
+        multi_manager = new_manager()
+        assert "fake_teachers" not in multi_manager.load_table_catalog(max_age=0)
+        deadline = time.monotonic() + 5
+        while "fake_teachers" not in multi_manager.get_available_tables() and time.monotonic() < deadline:
+            time.sleep(0.05)
+        assert "fake_teachers" in multi_manager.get_available_tables()
+        assert server.request_counts == {"GET v0/meta": 1}, server.request_counts
+        assert [table["name"] for table in sqlite_store.get_table_catalog(server.base_id)["tables"]] == ["fake_steps", "fake_quests", "fake_teachers"]
+
+def test_background_initial_sync():
+    """Test that the initial sync runs in the background and data requests get a 503 until their tables load."""
+    import time
+    from initial_sync import InitialSync
+    from utilities import critical_tables
+    
+    with fake_airtable_base("initial.db", ["craffft_steps"] + critical_tables, latency=0.3) as (server, client, sqlite_store, multi_manager):
+        server.add_table("craffft_steps", [{"name": "Step"}])
+        for table_name in critical_tables:
+            server.add_table(table_name, [{"name": table_name, "record_id": "1"}])
+        tracker = InitialSync(multi_manager)
+        with swapped_app_globals(initial_sync=tracker):
+            tracker.start()
+            with app.test_client() as test_client:
+                assert test_client.get('/healthz').status_code == 200
+                response = test_client.get('/readyz')
+                assert response.status_code == 503 and response.headers['Retry-After'] == str(InitialSync.RETRY_AFTER_SECONDS)
+                response = test_client.get('/data/json/craffft_steps')
+                assert response.status_code == 503 and response.get_json()["waiting_for"] == ["craffft_steps"]
+                assert test_client.get('/students/dashboard/C1').status_code == 503
+                
+                deadline = time.monotonic() + 10
+                while tracker.running and time.monotonic() < deadline:
+                    time.sleep(0.1)
+                progress = test_client.get('/readyz')
+                assert progress.status_code == 200, progress.get_json()
+                progress = progress.get_json()
+                assert progress["counts"] == {"loaded": 4} and not progress["running"], progress
+                # Critical tables are synced first
+                started = sorted(progress["tables"], key=lambda name: progress["tables"][name]["started_at"])
+                assert started[-1] == "craffft_steps", started
+            
+            # Another process finds the lease taken and waits for the tables instead of syncing again
+            server.reset_counts()
+            second = InitialSync(multi_manager)
+            second.start()
+            second._thread.join(10)
+            assert second.is_ready() and server.request_counts == {}, server.request_counts
+
+def test_initial_sync_retries_failed_tables():
+    """Test that failed initial sync tables don't block requests, are retried, and clear once a later sync loads them."""
+    from initial_sync import InitialSync
+    from utilities import critical_tables
+    
+    with fake_airtable_base("retry.db", critical_tables + ["empty_table"]) as (server, client, sqlite_store, multi_manager):
+        for table_name in critical_tables:
+            server.add_table(table_name, [{"name": table_name, "record_id": "1"}])
+        # An empty Airtable table is a successful download, not a failure to retry
+        server.add_table("empty_table", [])
+        # The first table synced (a critical one) fails and retries are off
+        tracker = InitialSync(multi_manager)
+        tracker.RETRY_ATTEMPTS = 0
+        with swapped_app_globals(initial_sync=tracker):
+            server.inject_errors(422)
+            tracker.start()
+            tracker._thread.join(10)
+            failed_table = critical_tables[0]
+            with app.test_client() as test_client:
+                progress = test_client.get('/readyz')
+                assert progress.status_code == 503 and 'Retry-After' not in progress.headers
+                assert progress.get_json()["failed"] == [failed_table] and progress.get_json()["loading"] == []
+                assert progress.get_json()["tables"]["empty_table"]["status"] == "loaded"
+                # Requests aren't held off waiting for a failed table
+                assert test_client.get(f'/data/json/{failed_table}').status_code != 503
+                assert test_client.get('/students/dashboard/C1').status_code != 503
+                
+                # A later sync, e.g. a queued /sync/update-all job, clears the failure
+                multi_manager.update_all_tables()
+                progress = test_client.get('/readyz')
+                assert progress.status_code == 200 and progress.get_json()["failed"] == [], progress.get_json()
+            lease = {lease["name"]: lease for lease in sqlite_store.get_leases()}[InitialSync.LEASE_NAME]
+            assert lease["last_run_status"] == "failed"
+            
+            # A failed run doesn't hold off the next one for MIN_INTERVAL; this time the failed table is retried
+            for table_name in critical_tables:
+                sqlite_store.delete_table(table_name)
+            retrying = InitialSync(multi_manager)
+            retrying.RETRY_BASE_SECONDS = 0.05
+            server.reset_counts()
+            server.inject_errors(422)
+            retrying.start()
+            retrying._thread.join(10)
+            progress = retrying.get_progress()
+            assert progress["ready"] and progress["counts"] == {"loaded": 4}, progress
+            assert progress["tables"][failed_table]["attempts"] == 2
+            assert server.request_counts, "expected the second sync to run rather than wait on the lease"
+
+def test_lazy_startup():
+    """Test that importing the app leaves the Swagger docs and Airtable client for first use, and times startup phases."""
+    import subprocess
+    import sys
+    import tempfile
+    
+    script = """
+import json, sys
+import app
+loaded = 'flask_restx' in sys.modules
+client = app.app.test_client()
+docs = client.get('/docs/').status_code
+spec = client.get('/swagger.json').get_json()
+try_it_out = client.get('/Airtable%20Sync/healthz').status_code
+print(json.dumps({"loaded": loaded, "docs": docs, "paths": len(spec["paths"]), "try_it_out": try_it_out,
+                  "restx_after_docs": 'flask_restx' in sys.modules, "phases": [p["phase"] for p in app.startup_profile.get_report()["phases"]]}))
+"""
+    repo_dir = os.path.dirname(os.path.abspath(__file__))
+    completed = subprocess.run([sys.executable, "-c", script], cwd=repo_dir, capture_output=True, text=True, timeout=120)
+    assert completed.returncode == 0, completed.stderr
+    result = json.loads(completed.stdout.strip().splitlines()[-1])
+    assert result["loaded"] is False, result
+    assert result["docs"] == 200 and result["paths"] > 0 and result["try_it_out"] == 200, result
+    assert result["restx_after_docs"]
+    assert {"import flask", "database engine", "table catalog"} <= set(result["phases"]), result
+    
+    # The Airtable client is created when first needed, and shared by the base's tables
+    with tempfile.TemporaryDirectory() as temp_dir:
+        sqlite_store = SQLiteStorage(db_path=os.path.join(temp_dir, "lazy.db"))
+        multi_manager = AirtableMultiManager("lazy_key", "appLazyBase", table_names=["fake_steps"], sqlite_storage=sqlite_store)
+        manager = multi_manager.get_manager("fake_steps")
+        assert multi_manager._airtable_client is None and manager._airtable_client is None
+        assert manager.airtable_client is multi_manager.airtable_client
+        sqlite_store.engine.dispose()
+
+def test_reset_after_fork():
+    """Test that a forked worker gets its own database pool and Airtable client, as gunicorn's post_fork does."""
+    import tempfile
+    import airtable_client
+    
+    with tempfile.TemporaryDirectory() as temp_dir:
+        sqlite_store = SQLiteStorage(db_path=os.path.join(temp_dir, "fork.db"))
+        multi_manager = AirtableMultiManager("fork_key", "appForkBase", table_names=["fake_steps"], sqlite_storage=sqlite_store)
+        sqlite_store.import_dict_rows("fake_steps", [{"name": "Step"}])
+        parent_client = multi_manager.airtable_client
+        parent_pool = sqlite_store.engine.pool
+        sqlite_store.save_table_catalog("appForkBase", [{"id": "tbl1", "name": "fake_steps"}, {"id": "tbl2", "name": "fake_quests"}])
+        
+        pid = os.fork()
+        if pid == 0:
+            # Child: report failures through the exit code
+            try:
+                sqlite_store.reset_after_fork()
+                multi_manager.reset_airtable_client()
+                assert multi_manager.reload_table_catalog() == ["fake_quests"]
+                assert sqlite_store.engine.pool is not parent_pool
+                assert multi_manager.get_manager("fake_steps")._airtable_client is None
+                assert multi_manager.airtable_client is not parent_client
+                assert sqlite_store.count_rows("fake_steps") == 1
+                os._exit(0)
+            except BaseException:
+                os._exit(1)
+        _, status = os.waitpid(pid, 0)
+        assert os.WEXITSTATUS(status) == 0
+        # The parent's pool and client are untouched
+        assert sqlite_store.engine.pool is parent_pool and multi_manager.airtable_client is parent_client
+        assert sqlite_store.count_rows("fake_steps") == 1
+        airtable_client.reset_clients()
+        sqlite_store.engine.dispose()
+
+def test_request_metrics_endpoint():
+    """Test that /metrics reports per-route latency, status, database and size metrics in Prometheus format."""
+    import sys
+    
+    request_metrics = sys.modules['app'].request_metrics
+    request_metrics.reset()
+    with app.test_client() as client:
+        for _ in range(2):
+            assert client.get('/sync/jobs?limit=1').status_code == 200
+        client.get('/quest-browser')
+        client.get('/no-such-route')
+        response = client.get('/metrics')
+        assert response.status_code == 200 and response.mimetype == 'text/plain'
+        lines = response.get_data(as_text=True).splitlines()
+    
+    def value(prefix):
+        matches = [line for line in lines if line.startswith(prefix + ' ')]
+        assert len(matches) == 1, (prefix, matches)
+        return float(matches[0].rsplit(' ', 1)[1])
+    
+    jobs = 'blueprint="core",route="/sync/jobs",method="GET"'
+    assert value('http_requests_total{%s,status="200"}' % jobs) == 2
+    assert value('http_request_duration_seconds_count{%s}' % jobs) == 2
+    assert value('http_request_duration_seconds_bucket{%s,le="+Inf"}' % jobs) == 2
+    # Each jobs request reads the sync_jobs table
+    assert value('http_request_db_queries_sum{%s}' % jobs) >= 2
+    assert value('http_request_db_seconds_total{%s}' % jobs) > 0
+    assert value('http_response_size_bytes_sum{%s}' % jobs) > 0
+    assert value('http_requests_total{blueprint="quests",route="/quest-browser",method="GET",status="200"}') == 1
+    assert value('http_requests_total{blueprint="core",route="unmatched",method="GET",status="404"}') == 1
+    assert '# TYPE http_request_duration_seconds histogram' in lines
+
+def test_query_stats():
+    """Test that statements are aggregated by shape, slow ones are logged and the admin API serves both."""
+    import sys
+    import tempfile
+    
+    with tempfile.TemporaryDirectory() as temp_dir:
+        sqlite_store = SQLiteStorage(db_path=os.path.join(temp_dir, "stats.db"))
+        stats = sqlite_store.query_stats
+        stats.reset()
+        stats.slow_threshold_ms = 0
+        for name in ("Ada", "Grace", "Linus"):
+            sqlite_store.execute_sql_query("table_data", f"SELECT * FROM table_data WHERE table_name = '{name}' AND length(csv_data) > 3")
+        report = stats.get_report(sort='calls')
+        shape = 'SELECT * FROM table_data WHERE table_name = ? AND length(csv_data) > ?'
+        top = next(entry for entry in report["statements"] if entry["statement"] == shape)
+        assert top["calls"] == 3 and top["slow_calls"] == 3
+        assert top["total_ms"] >= top["max_ms"] >= top["mean_ms"] > 0
+        assert report["slow_queries"][0]["statement"].endswith("'Linus' AND length(csv_data) > 3")
+        sqlite_store.engine.dispose()
+    
+    # Literals, parameter styles and IN/VALUES lists all collapse; quoted identifiers stay
+    from sqlite_storage import QueryStats
+    assert QueryStats.normalize('SELECT *  FROM "Step 2" WHERE id IN (?, ?, ?) AND n = :n_1') == 'SELECT * FROM "Step 2" WHERE id IN (?, ...) AND n = ?'
+    assert QueryStats.normalize("INSERT INTO t (a) VALUES (%(a)s), ('x'), (1.5)") == 'INSERT INTO t (a) VALUES (?), ...'
+    
+    app_stats = sys.modules['app'].multi_manager.sqlite_storage.query_stats
+    with app.test_client() as client:
+        assert client.get('/admin/api/query-stats').status_code == 302
+        with client.session_transaction() as session:
+            session['admin_authenticated'] = True
+        client.get('/sync/jobs?limit=1')
+        report = client.get('/admin/api/query-stats?sort=max&limit=5').get_json()
+        assert report["statements"] and len(report["statements"]) <= 5
+        assert [entry["max_ms"] for entry in report["statements"]] == sorted((entry["max_ms"] for entry in report["statements"]), reverse=True)
+        assert client.post('/admin/api/query-stats/reset').status_code == 200
+        assert app_stats.since.isoformat() > report["since"]
+
+def test_sampling_profiler():
+    """Test that the admin profiler samples the next requests to a route, or all threads, as collapsed stacks."""
+    import sys
+    import threading
+    import time
+    
+    profiler = sys.modules['app'].profiler
+    with app.test_client() as client:
+        assert client.post('/admin/api/profile', json={"seconds": 1}).status_code == 302
+        with client.session_transaction() as session:
+            session['admin_authenticated'] = True
+        assert client.post('/admin/api/profile', json={}).status_code == 400
+        
+        # Request mode: only the next 2 requests to the route are sampled
+        response = client.post('/admin/api/profile', json={"route": "/sync/jobs", "count": 2, "interval_ms": 1})
+        assert response.status_code == 202 and response.get_json()["mode"] == "requests"
+        assert client.post('/admin/api/profile', json={"seconds": 1}).status_code == 409
+        client.get('/healthz')
+        for _ in range(3):
+            client.get('/sync/jobs?limit=50')
+        profiler._thread.join(timeout=5)
+        status = client.get('/admin/api/profile').get_json()
+        assert status["requests"] == 2 and not status["running"], status
+        collapsed = client.get('/admin/api/profile/collapsed').get_data(as_text=True)
+        assert all(line.startswith("GET_/sync/jobs;") for line in collapsed.splitlines())
+        
+        # Thread mode samples every thread, including ones outside requests
+        stop = threading.Event()
+        def busy_wait():
+            while not stop.is_set():
+                sum(range(1000))
+        worker = threading.Thread(target=busy_wait, name="busy-worker")
+        worker.start()
+        try:
+            assert client.post('/admin/api/profile', json={"seconds": 60, "interval_ms": 1}).status_code == 202
+            time.sleep(0.2)
+            status = client.post('/admin/api/profile/stop').get_json()
+        finally:
+            stop.set()
+            worker.join()
+        assert status["mode"] == "threads" and status["samples"] > 0 and not status["running"]
+        lines = client.get('/admin/api/profile/collapsed').get_data(as_text=True).splitlines()
+        assert any(line.startswith("busy-worker;") and "busy_wait_(tests.py:" in line for line in lines)
+        assert all(int(line.rsplit(' ', 1)[1]) > 0 for line in lines)
+
+def count_request_work(client, multi_manager, method, url, **kwargs):
+    """
+    Send one test-client request and count the SQL statements and Airtable calls it caused.
+    
+    Returns:
+        Tuple of the response and a dictionary with "sql" and "airtable" counts
+    """
+    stats = multi_manager.sqlite_storage.query_stats
+    client_metrics = multi_manager.airtable_client.metrics
+    def airtable_calls():
+        return sum(operation["calls"] for operation in client_metrics.snapshot().values())
+    sql_before, airtable_before = stats.total_calls(), airtable_calls()
+    response = client.open(url, method=method, **kwargs)
+    return response, {"sql": stats.total_calls() - sql_before, "airtable": airtable_calls() - airtable_before}
+
+def assert_request_budget(client, multi_manager, method, url, max_sql, max_airtable=0, **kwargs):
+    """
+    Send one test-client request and fail if it ran more SQL statements or Airtable calls than budgeted.
+    
+    Returns:
+        The response
+    """
+    response, counts = count_request_work(client, multi_manager, method, url, **kwargs)
+    assert counts["sql"] <= max_sql, f"{method} {url} ran {counts['sql']} SQL statements (budget {max_sql})"
+    assert counts["airtable"] <= max_airtable, f"{method} {url} made {counts['airtable']} Airtable calls (budget {max_airtable})"
+    return response
+
+@contextmanager
+def query_budget_app():
+    """
+    Serve the app from a fake Airtable base with a quest, its steps, a teacher and five students
+    in one class, each four steps into Quest 1, synced into a temporary database.
+    
+    Budgets in the tests that use it are the current counts for this fixture. Lower them when an
+    endpoint gets cheaper; only raise one when the extra work is intended.
+    
+    Yields:
+        Tuple of (test_client, sqlite_store, multi_manager)
+    """
+    from initial_sync import InitialSync
+    
+    steps = [f"Q1-S{i}" for i in range(1, 7)]
+    table_names = ["craffft_quests", "craffft_steps", "craffft_teachers", "craffft_students"]
+    with fake_airtable_base("budgets.db", table_names) as (server, client, sqlite_store, multi_manager):
+        server.add_table("craffft_quests", [
+            {"record_id": "Q1", "short_code": "Q1", "quest_name": "Quest 1", "steps": steps},
+            {"record_id": "Q2", "short_code": "Q2", "quest_name": "Quest 2", "steps": ["Q2-S1", "Q2-S2"]}
+        ])
+        server.add_table("craffft_steps", [
+            {"record_id": name, "name": name, "craffft_quest_id": name.split("-")[0], "step_number": name[-1]}
+            for name in steps + ["Q2-S1", "Q2-S2"]
+        ])
+        server.add_table("craffft_teachers", [
+            {"record_id": "recT1", "website_user_id": "teacher-1", "first_name": "Test", "last_name": "Teacher", "classroom_ids": ["1"]}
+        ])
+        server.add_table("craffft_students", [
+            {"record_id": f"recS{i}", "website_id": str(i), "first_name": "Student", "last_name": str(i), "gamer_tag": f"s{i}",
+             "current_class": "teacher-1>1", "current_quest": "Q1", "current_step": "Q1-S4", "quest_progress_percentage": "67"}
+            for i in range(1, 6)
+        ])
+        multi_manager.update_all_tables()
+        
+        with swapped_app_globals(multi_manager=multi_manager, student_data_manager=StudentDataManager(multi_manager),
+                                 initial_sync=InitialSync(multi_manager)):
+            with app.test_client() as test_client:
+                yield test_client, sqlite_store, multi_manager
+
+def test_request_query_budgets():
+    """Test that the key student endpoints stay within their SQL statement and Airtable call budgets, so N+1 queries fail."""
+    from urllib.parse import quote
+    
+    with query_budget_app() as (test_client, sqlite_store, multi_manager):
+        # Students, then their quests, then their current and completed steps, however many students
+        response = assert_request_budget(test_client, multi_manager, 'GET', '/students/dashboard/teacher-1>1', max_sql=3)
+        assert response.status_code == 200 and len(response.get_json()["students"]) == 5
+        student = response.get_json()["students"][0]
+        assert student["current_step_data"]["record_id"] == "Q1-S4" and student["current_quest_name"] == "Quest 1"
+        assert [step["record_id"] for step in student["current_quest_completed_steps"]] == ["Q1-S1", "Q1-S2", "Q1-S3"]
+        # The class name from the URL is a bound parameter, not SQL
+        injection = quote("x' OR '1'='1")
+        assert test_client.get(f'/students/dashboard/{injection}').get_json()["students"] == []
+        
+        response = assert_request_budget(test_client, multi_manager, 'GET',
+                                         '/students/update-and-check-quest?websiteId=1&current-step=Q1-S5', max_sql=5)
+        assert response.status_code == 200 and response.get_json()["current_step"] == "Q1-S5"
+        
+        response = assert_request_budget(test_client, multi_manager, 'POST', '/students/add', max_sql=12, json={
+            "teacher_website_id": "teacher-1", "add_classes_to_teacher": True,
+            "students": [{"first_name": "New", "last_name": str(i), "website_id": 100 + i, "current_class": 2} for i in range(3)]
+        })
+        assert response.status_code == 201 and response.get_json()["added_count"] == 3
+
+def test_batch_step_update_api():
+    """Test that batch step updates report each transition and read the students, steps and quests once per batch."""
+    with query_budget_app() as (test_client, sqlite_store, multi_manager):
+        # Students, steps and quests are read once for the whole batch, then an update and a journal
+        # entry per transition (plus adding completed_quests, which the fixture never set)
+        response = assert_request_budget(test_client, multi_manager, 'POST', '/students/update-and-check-quest/batch',
+                                         max_sql=10, json={"updates": [
+            {"websiteId": 2, "current-step": "Q1-S5"},
+            {"websiteId": 3, "current-step": "Q1-S5"},
+            {"websiteId": 3, "current-step": "Q1-S6"},
+            {"websiteId": 4, "current-step": "Q1-S9"},
+            {"websiteId": 99, "current-step": "Q1-S5"}
+        ]})
+        assert response.status_code == 207, response.get_json()
+        batch = response.get_json()
+        assert batch["updated_count"] == 3 and batch["failed_count"] == 2
+        assert [result["websiteId"] for result in batch["results"]] == ["2", "3", "3", "4", "99"]
+        assert batch["results"][0] == {"websiteId": "2", "current_step": "Q1-S5", "current_quest": "Q1",
+                                       "quest_changed": False, "quest_completed": False}
+        assert batch["results"][2]["quest_completed"] is True and batch["results"][2]["current_quest"] == ""
+        assert "error" in batch["results"][3] and "error" in batch["results"][4]
+        student_3 = multi_manager.get_manager("craffft_students").get_row("website_id", "3")
+        assert student_3["current_step"] == "" and json.loads(student_3["completed_quests"]) == ["Q1"]
+        assert multi_manager.get_manager("craffft_students").get_row("website_id", "2")["quest_progress_percentage"] == "83"
+
+def test_assign_quest_to_class_resets_progress():
+    """Test that assigning a quest to a class resets every student's step and progress in one UPDATE."""
+    with query_budget_app() as (test_client, sqlite_store, multi_manager):
+        # The class is read, then reset with one UPDATE and one batch of journal entries
+        response = assert_request_budget(test_client, multi_manager, 'POST', '/quests/assign-to-class', max_sql=3,
+                                         json={"class_name": "teacher-1>1", "quest_code": "Q2"})
+        assert response.status_code == 200 and response.get_json()["successful_assignments"] == 5
+        for i in range(1, 6):
+            student = multi_manager.get_manager("craffft_students").get_row("website_id", str(i))
+            assert (student["current_quest"], student["current_step"], student["quest_progress_percentage"]) == ("Q2", "", "0")
+        changes = sqlite_store.get_pending_changes("craffft_students")
+        assert sorted(change["key_value"] for change in changes) == ["1", "2", "3", "4", "5"]
+        assert changes[0]["changed_columns"] == ["current_quest", "current_step", "quest_progress_percentage"]
+
+def test_teacher_dashboard_api():
+    """Test that the teacher dashboard groups every class's students and reads each table once."""
+    from urllib.parse import quote
+    
+    with query_budget_app() as (test_client, sqlite_store, multi_manager):
+        response = test_client.post('/students/add', json={
+            "teacher_website_id": "teacher-1", "add_classes_to_teacher": True,
+            "students": [{"first_name": "New", "last_name": str(i), "website_id": 100 + i, "current_class": 2} for i in range(3)]
+        })
+        assert response.status_code == 201
+        
+        # The teacher, then every class's students, their quests and their steps once each
+        class_dashboard = test_client.get('/students/dashboard/teacher-1>1').get_json()
+        response = assert_request_budget(test_client, multi_manager, 'GET', '/teachers/dashboard/teacher-1', max_sql=4)
+        assert response.status_code == 200
+        teacher_dashboard = response.get_json()
+        assert teacher_dashboard["teacher"]["website_user_id"] == "teacher-1"
+        assert teacher_dashboard["quests"] == class_dashboard["quests"]
+        assert [(section["classroom_id"], section["class_name"], len(section["students"]))
+                for section in teacher_dashboard["classes"]] == [("1", "teacher-1>1", 5), ("2", "teacher-1>2", 3)]
+        assert teacher_dashboard["classes"][0]["students"] == class_dashboard["students"]
+        assert test_client.get('/teachers/dashboard/no-such-teacher').status_code == 404
+        # The id from the URL is a bound parameter, not SQL
+        injection = quote("x' OR '1'='1")
+        assert test_client.get(f'/teachers/dashboard/{injection}').status_code == 404
+
+def test_sync_routes_queue_jobs():
+    """Test that manual syncs and uploads are queued for the worker rather than run in the request."""
+    with query_budget_app() as (test_client, sqlite_store, multi_manager):
+        response = assert_request_budget(test_client, multi_manager, 'POST', '/sync/update-all', max_sql=2)
+        assert response.status_code == 202 and response.get_json()["job"]["job_type"] == "sync"
+        response = test_client.post('/sync/update-table', json={"table_name": "craffft_steps", "force_delete": False})
+        assert response.status_code == 202 and response.get_json()["job"]["options"] == {"force_delete": False}
+        response = test_client.post('/sync/upload?table_name=craffft_students&force_upload=true')
+        assert response.status_code == 202 and response.get_json()["job"]["options"] == {"force_upload": True}
+        assert test_client.post('/sync/upload?table_name=missing').status_code == 404
+        assert [job["status"] for job in sqlite_store.get_recent_jobs()] == ["pending"] * 3
+
+def test_single_writer_storage():
+    """Test that single-writer mode commits concurrent writes in shared transactions and isolates failing writes."""
+    import tempfile
+    import threading
+    
+    with tempfile.TemporaryDirectory() as temp_dir:
+        sqlite_store = SQLiteStorage(db_path=os.path.join(temp_dir, "single_writer.db"), single_writer=True)
+        assert sqlite_store.get_write_stats()["mode"] == "single_writer"
+        sqlite_store.import_dict_rows("writer_students", [{"record_id": f"rec{i}", "website_id": str(i), "current_step": ""} for i in range(40)])
+        with sqlite_store.engine.connect() as conn:
+            assert conn.exec_driver_sql("PRAGMA journal_mode").scalar() == "wal"
+        
+        # Concurrent writers: every write lands, and each is journaled with its row
+        release = threading.Event()
+        def update(i):
+            release.wait()
+            assert sqlite_store.modify_field("writer_students", "website_id", str(i), "current_step", f"S-{i}")
+        threads = [threading.Thread(target=update, args=(i,)) for i in range(40)]
+        for thread in threads:
+            thread.start()
+        release.set()
+        for thread in threads:
+            thread.join()
+        rows = sqlite_store.execute_sql_query("writer_students", "SELECT website_id, current_step FROM writer_students")
+        assert all(row["current_step"] == f"S-{row['website_id']}" for row in rows)
+        assert len(sqlite_store.get_pending_changes("writer_students")) == 40
+        stats = sqlite_store.get_write_stats()
+        assert stats["writes"] >= 41 and stats["transactions"] <= stats["writes"] and stats["lock_errors"] == 0
+        
+        # A failing write is rolled back on its own; the rest of its batch commits
+        dispatcher = sqlite_store.write_dispatcher
+        results = []
+        def submit(write):
+            try:
+                results.append(dispatcher.submit(write))
+            except Exception as e:
+                results.append(type(e).__name__)
+        def failing(conn):
+            conn.exec_driver_sql("UPDATE writer_students SET current_step = 'lost' WHERE website_id = '0'")
+            raise ValueError("failed write")
+        writes = [failing, lambda conn: conn.exec_driver_sql("UPDATE writer_students SET current_step = 'kept' WHERE website_id = '1'").rowcount]
+        threads = [threading.Thread(target=submit, args=(write,)) for write in writes]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert sorted(results, key=str) == [1, "ValueError"]
+        assert sqlite_store.find_row_by_column("writer_students", "website_id", "0")["current_step"] == "S-0"
+        assert sqlite_store.find_row_by_column("writer_students", "website_id", "1")["current_step"] == "kept"
+        assert sqlite_store.get_write_stats()["failed_writes"] == 1
+
+        # Bookkeeping writes (jobs, leases, journal clean-up, sync state) go through the writer as well
+        writes_before = sqlite_store.get_write_stats()["writes"]
+        job = sqlite_store.enqueue_job("sync", "writer_students")
+        assert sqlite_store.claim_next_job("worker-1")["id"] == job["id"]
+        assert sqlite_store.finish_job(job["id"], True, "ok")
+        assert sqlite_store.acquire_lease("nightly", "worker-1", ttl_seconds=60)
+        assert not sqlite_store.acquire_lease("nightly", "worker-2", ttl_seconds=60)
+        assert sqlite_store.release_lease("nightly", "worker-1", True)
+        sqlite_store.save_content_hash("writer_students", "hash")
+        sqlite_store.save_table_sync_state("writer_students", change_rate=1.0)
+        assert sqlite_store.clear_changes("writer_students") == 40
+        assert sqlite_store.get_write_stats()["writes"] - writes_before == 9
+        assert sqlite_store.get_job(job["id"])["status"] == "done" and sqlite_store.get_content_hash("writer_students") == "hash"
+
+        # Writes run on the writer thread but count towards the submitting thread's query tally
+        SQLiteStorage.start_query_tally()
+        assert sqlite_store.modify_field("writer_students", "website_id", "2", "current_step", "tallied")
+        tally = SQLiteStorage.stop_query_tally()
+        assert tally["queries"] >= 2 and tally["seconds"] > 0
+        dispatcher.close()
+        sqlite_store.engine.dispose()
+
+def test_step_transition_is_atomic():
+    """Test that concurrent step updates for one student complete a quest once and keep the journal consistent."""
+    import tempfile
+    import threading
+    
+    with tempfile.TemporaryDirectory() as temp_dir:
+        for single_writer in (False, True):
+            sqlite_store = SQLiteStorage(db_path=os.path.join(temp_dir, f"transition-{single_writer}.db"), single_writer=single_writer)
+            sqlite_store.import_dict_rows("craffft_quests", [{"short_code": "Q1", "steps": json.dumps(["S1", "S2", "S3"])}])
+            sqlite_store.import_dict_rows("craffft_steps", [{"name": name, "craffft_quest_id": "Q1"} for name in ("S1", "S2", "S3")])
+            sqlite_store.import_dict_rows("craffft_students", [{"record_id": "rec1", "website_id": "1", "current_quest": "Q1", "current_step": "S1",
+                                                                "quest_progress_percentage": "33", "completed_quests": "[]"}])
+            multi_manager = AirtableMultiManager("test_key", "test_base", table_names=["craffft_quests", "craffft_steps", "craffft_students"], sqlite_storage=sqlite_store)
+            student_data_manager = StudentDataManager(multi_manager)
+            
+            result = student_data_manager.update_step_and_check_quest("1", "S2")
+            assert result == {"success": True, "current_step": "S2", "current_quest": "Q1", "quest_changed": False, "quest_completed": False}
+            assert sqlite_store.find_row_by_column("craffft_students", "website_id", "1")["quest_progress_percentage"] == "67"
+            assert not student_data_manager.update_step_and_check_quest("1", "NOPE")["success"]
+            assert not student_data_manager.update_step_and_check_quest("404", "S2")["success"]
+            
+            # Many requests reach the last step at once: the quest is completed once and the student ends reset
+            release = threading.Event()
+            results = []
+            def finish():
+                release.wait()
+                results.append(student_data_manager.update_step_and_check_quest("1", "S3"))
+            threads = [threading.Thread(target=finish) for _ in range(8)]
+            for thread in threads:
+                thread.start()
+            release.set()
+            for thread in threads:
+                thread.join()
+            assert all(result["success"] and result["quest_completed"] for result in results), results
+            student = parse_database_row(sqlite_store.find_row_by_column("craffft_students", "website_id", "1"))
+            assert student["completed_quests"] == ["Q1"]
+            assert (student["current_quest"], student["current_step"], student["quest_progress_percentage"]) == ("", "", "0")
+            # One journal entry per transition that changed something: the move to S2 and the completion
+            changes = sqlite_store.get_pending_changes("craffft_students")
+            assert len(changes) == 2
+            assert set(changes[1]["changed_columns"]) == {"current_step", "current_quest", "quest_progress_percentage", "completed_quests"}
+            if sqlite_store.write_dispatcher is not None:
+                sqlite_store.write_dispatcher.close()
+            sqlite_store.engine.dispose()
+
 def run_all_tests():
     import sys
     import types